@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Benchmark decoding the output of `bw list items` into BwItem models.
+
+Compares the three decode modes of process_list on a synthetic vault (see synthetic_vault.py):
+    per-item: json.loads, then BwItem(**item) for every item.
+    batch: json.loads for the raw items, and decode_item_dicts on the parsed items.
+    batch-nogc: The same as batch, inside paused_gc.
+The raw items are decoded in every mode, as process_list keeps them for the Bitwarden Export entry. Every mode
+runs in its own process, so the memory left by one mode does not slow down the next.
+
+Usage:
+    PYTHONPATH=src python benchmarks/bench_decode.py --sizes 1000 10000 100000
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, List
+
+from synthetic_vault import add_arguments, vault_from_arguments
+
+MODES = ["per-item", "batch", "batch-nogc"]
+
+
+def decode(mode: str, payload: bytes) -> List[Any]:
+    """
+    Decode the payload like process_list does in the given mode.
+    """
+    # Imported here so the parent process, which only generates vaults, stays small.
+    # pylint: disable=import-outside-toplevel
+    from bitwarden_exporter.bw_models import BwItem, decode_item_dicts
+    from bitwarden_exporter.utils import paused_gc
+
+    if mode == "per-item":
+        return [BwItem(**bw_item_dict) for bw_item_dict in json.loads(payload)]
+    if mode == "batch":
+        return decode_item_dicts(json.loads(payload))
+    with paused_gc():
+        return decode_item_dicts(json.loads(payload))
+
+
+def main() -> None:
+    """
+    Run the benchmark, or decode one payload when called with --worker.
+    """
+    if len(sys.argv) == 4 and sys.argv[1] == "--worker":
+        with open(sys.argv[3], "rb") as payload_file:
+            payload = payload_file.read()
+        start = time.perf_counter()
+        decode(sys.argv[2], payload)
+        print(time.perf_counter() - start)
+        return
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    args = parser.parse_args()
+
+    print(f"{'items':>8} " + " ".join(f"{mode + ' (s)':>14}" for mode in MODES) + f" {'speedup':>9}")
+    for size in args.sizes:
+        args.items = size
+        with tempfile.NamedTemporaryFile(suffix=".json") as payload_file:
+            payload_file.write(json.dumps(vault_from_arguments(args)["items"]).encode("utf-8"))
+            payload_file.flush()
+            timings = [
+                float(
+                    subprocess.run(
+                        [sys.executable, __file__, "--worker", mode, payload_file.name],
+                        check=True,
+                        stdout=subprocess.PIPE,
+                    ).stdout
+                )
+                for mode in MODES
+            ]
+        line = " ".join(f"{timing:>14.3f}" for timing in timings)
+        print(f"{size:>8} {line} {timings[0] / min(timings[1:]):>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Benchmark entry insertion in KeePassStorage at growing vault sizes.
+
+All entries go to the same group, which is the worst case for a per-entry duplicate search. Insertion and the
+final save are timed separately; the time per entry should stay flat as the vault grows.
+
+Usage:
+    PYTHONPATH=src python benchmarks/bench_entry_insert.py --entries 1000 10000 50000
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+from typing import List
+
+from bitwarden_exporter.bw_models import BwItem, BwItemLogin, BwItemLoginUri
+from bitwarden_exporter.exporter.keepass_exporter import KeePassStorage
+
+
+def build_items(entries: int) -> List[BwItem]:
+    """
+    Create login items with a URI each; every tenth item shares its title and username with the previous one.
+    """
+    return [
+        BwItem(
+            revisionDate="2024-01-01T00:00:00.000Z",
+            creationDate="2024-01-01T00:00:00.000Z",
+            object="item",
+            id=f"item-{item_index}",
+            type=1,
+            reprompt=0,
+            name=f"Login {item_index - 1 if item_index % 10 == 0 else item_index}",
+            favorite=False,
+            login=BwItemLogin(
+                username="user",
+                password=f"password-{item_index}",
+                uris=[BwItemLoginUri(uri=f"https://example.com/{item_index}")],
+            ),
+        )
+        for item_index in range(entries)
+    ]
+
+
+def main() -> None:
+    """
+    Run the benchmark and print one line per vault size.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, nargs="+", default=[1000, 10000, 50000])
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    print(f"{'entries':>8} {'insert (s)':>11} {'us/entry':>9} {'save (s)':>9}")
+    for entries in args.entries:
+        items = build_items(entries)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            storage = KeePassStorage(os.path.join(tmp_dir, "bench.kdbx"), "bench")
+            with storage:
+                start = time.perf_counter()
+                storage.process_no_folder_items(items)
+                insert_elapsed = time.perf_counter() - start
+                start = time.perf_counter()
+            save_elapsed = time.perf_counter() - start
+        print(f"{entries:>8} {insert_elapsed:>11.3f} {insert_elapsed / entries * 1e6:>9.1f} {save_elapsed:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Benchmark group creation in KeePassStorage with a deeply nested collection tree.
+
+Every collection path is `Team-<t>/Level-1/.../Level-<depth>/Leaf-<n>`, so most path segments are shared and
+resolving a collection walks existing groups before creating the leaf.
+
+Usage:
+    PYTHONPATH=src python benchmarks/bench_group_index.py --collections 2000 --depth 8
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+from bitwarden_exporter.bw_models import BwCollection, BwOrganization
+from bitwarden_exporter.exporter.keepass_exporter import KeePassStorage
+
+
+def build_organization(collections: int, depth: int, teams: int) -> BwOrganization:
+    """
+    Create an organization with `collections` nested collections spread over `teams` top level groups.
+    """
+    organization = BwOrganization(object="organization", id="org", name="Org", status=2, type=0, enabled=True)
+    for collection_index in range(collections):
+        levels = "/".join(f"Level-{level}" for level in range(1, depth + 1))
+        collection_id = f"collection-{collection_index}"
+        organization.collections[collection_id] = BwCollection(
+            object="collection",
+            id=collection_id,
+            organizationId=organization.id,
+            name=f"Team-{collection_index % teams}/{levels}/Leaf-{collection_index}",
+        )
+    return organization
+
+
+def main() -> None:
+    """
+    Run the benchmark and print the timing.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--collections", type=int, default=2000)
+    parser.add_argument("--depth", type=int, default=8)
+    parser.add_argument("--teams", type=int, default=10)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    organization = build_organization(args.collections, args.depth, args.teams)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with KeePassStorage(os.path.join(tmp_dir, "bench.kdbx"), "bench") as storage:
+            start = time.perf_counter()
+            storage.process_organizations({organization.id: organization})
+            elapsed = time.perf_counter() - start
+
+    print(f"collections={args.collections} depth={args.depth} teams={args.teams}")
+    print(f"process_organizations: {elapsed:.3f}s ({elapsed / args.collections * 1e6:.1f} us per collection)")
+
+
+if __name__ == "__main__":
+    main()
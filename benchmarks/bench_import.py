@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark the startup of the CLI for commands that do not export anything.
+
+Runs `python -X importtime -m bitwarden_exporter` with --version and --help, and reports the wall time and the
+cumulative import time of the slowest top level modules. Every command is run --repeat times and the fastest
+run is kept.
+
+The run fails, with exit status 1, when a command imports one of the export dependencies (pykeepass, lxml,
+argon2, jmespath, pydantic, pycryptodome), which are only needed once an export starts, or when its import time
+exceeds the budget.
+
+Usage:
+    PYTHONPATH=src python benchmarks/bench_import.py
+    PYTHONPATH=src python benchmarks/bench_import.py --budget-ms 150 --repeat 10
+"""
+
+import argparse
+import re
+import subprocess
+import sys
+import time
+from typing import Dict, List, Set, Tuple
+
+COMMANDS = [["--version"], ["--help"]]
+
+FORBIDDEN_MODULES = ["pykeepass", "lxml", "argon2", "jmespath", "pydantic", "Crypto", "Cryptodome"]
+
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def run_command(arguments: List[str]) -> Tuple[float, Dict[str, int], Set[str]]:
+    """
+    Run the CLI once with -X importtime.
+
+    Returns:
+        Tuple[float, Dict[str, int], Set[str]]: Wall time in seconds, the cumulative import time in microseconds
+            of every module imported at the top level (which includes the modules it imports), and the names of
+            all imported modules.
+    """
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "bitwarden_exporter", *arguments],
+        check=False,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    elapsed = time.perf_counter() - start
+    top_level: Dict[str, int] = {}
+    modules: Set[str] = set()
+    for line in completed.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            modules.add(match.group(4))
+            # Nested imports are indented by two more spaces per level.
+            if len(match.group(3)) == 1:
+                top_level[match.group(4)] = int(match.group(2))
+    return elapsed, top_level, modules
+
+
+def main() -> None:
+    """
+    Run the benchmark.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per command, the fastest is kept.")
+    parser.add_argument("--budget-ms", type=float, default=300, help="Allowed import time of each command.")
+    parser.add_argument("--top", type=int, default=5, help="Number of slowest modules to list.")
+    args = parser.parse_args()
+
+    failures: List[str] = []
+    print(f"{'command':>10} {'wall (ms)':>10} {'imports (ms)':>13}  slowest top level modules")
+    for arguments in COMMANDS:
+        runs = [run_command(arguments) for _ in range(args.repeat)]
+        elapsed = min(run[0] for run in runs)
+        top_level = min((run[1] for run in runs), key=lambda times: sum(times.values()))
+        import_ms = sum(top_level.values()) / 1000
+        slowest = sorted(((us, module) for module, us in top_level.items()), reverse=True)[: args.top]
+        command = " ".join(arguments)
+        print(
+            f"{command:>10} {elapsed * 1000:>10.0f} {import_ms:>13.0f}  "
+            + ", ".join(f"{module} {us / 1000:.0f}" for us, module in slowest)
+        )
+
+        imported = sorted({module.split(".")[0] for module in runs[0][2]} & set(FORBIDDEN_MODULES))
+        if imported:
+            failures.append(f"{command} imports {', '.join(imported)}")
+        if import_ms > args.budget_ms:
+            failures.append(f"{command} imports for {import_ms:.0f} ms, budget {args.budget_ms:.0f} ms")
+
+    for failure in failures:
+        print(f"REGRESSION: {failure}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Benchmark resolving JMESPath secrets against a large vault.
+
+Every secret filters by item ID, like a per-shard or per-organization password stored in the vault, and is
+resolved once with jmespath.search over all raw items and once with resolve_secret and the item ID index.
+
+Usage:
+    PYTHONPATH=src python benchmarks/bench_resolve_secret.py --items 100000 --secrets 20
+"""
+
+import argparse
+import logging
+import time
+from typing import Any, Dict, List
+
+import jmespath
+
+from bitwarden_exporter.utils import index_items, resolve_secret
+
+
+def build_items(items: int) -> List[List[Dict[str, Any]]]:
+    """
+    Create raw items shaped like RawItems.items, each with an export-password field.
+    """
+    return [
+        [
+            {
+                "id": f"item-{item_index:08d}",
+                "name": f"Login {item_index}",
+                "login": {"username": f"user-{item_index}", "password": f"password-{item_index}"},
+                "fields": [{"name": "export-password", "value": f"secret-{item_index}", "type": 1}],
+            }
+            for item_index in range(items)
+        ]
+    ]
+
+
+def main() -> None:
+    """
+    Run the benchmark and print the timing.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--secrets", type=int, default=20)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    all_items_list = build_items(args.items)
+    step = max(args.items // args.secrets, 1)
+    expressions = [
+        f"[?id=='item-{item_index:08d}'].fields[] | [?name=='export-password'].value"
+        for item_index in range(0, args.items, step)
+    ][: args.secrets]
+
+    start = time.perf_counter()
+    expected = [jmespath.search(expression, all_items_list[0])[0] for expression in expressions]
+    scan_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    items_by_id = index_items(all_items_list)
+    index_elapsed = time.perf_counter() - start
+    start = time.perf_counter()
+    resolved = [resolve_secret(f"jmespath:{expression}", all_items_list, items_by_id) for expression in expressions]
+    indexed_elapsed = time.perf_counter() - start
+
+    if resolved != expected:
+        raise SystemExit("Indexed resolution returned different secrets")
+    print(f"items={args.items} secrets={len(expressions)}")
+    print(f"jmespath.search: {scan_elapsed:.3f}s ({scan_elapsed / len(expressions) * 1e3:.1f} ms per secret)")
+    print(f"index_items: {index_elapsed:.3f}s")
+    print(f"resolve_secret: {indexed_elapsed:.4f}s ({indexed_elapsed / len(expressions) * 1e3:.3f} ms per secret)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+End to end benchmark suite on synthetic vaults.
+
+For every vault size a synthetic vault is generated (see synthetic_vault.py) and served by the stub fake_bw.py.
+Each size then runs in its own processes, so peak RSS is measured per size, and times process_list, the KeePass
+database creation, every KeePassStorage.process_* stage and the final save. Every size is run --repeat times and
+the fastest time of each stage is kept, which filters out most of the scheduling noise.
+
+Results are compared against the stored baselines in baselines.json; a stage slower, or a peak RSS larger, than
+the baseline by more than the tolerance is reported as a regression and makes the suite exit with status 1.
+Baselines depend on the machine, record them with --update-baselines before comparing on a new one.
+
+Usage:
+    PYTHONPATH=src python benchmarks/bench_suite.py --sizes 1000 10000 100000
+    PYTHONPATH=src python benchmarks/bench_suite.py --sizes 1000 --update-baselines
+"""
+
+import argparse
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from synthetic_vault import add_arguments, vault_from_arguments, write_vault
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+BASELINES_FILE = os.path.join(BENCHMARKS_DIR, "baselines.json")
+
+STAGES = [
+    "process_list",
+    "create_database",
+    "process_organizations",
+    "process_folders",
+    "process_no_folder_items",
+    "process_bw_exports",
+    "save",
+]
+
+
+def peak_rss_mib() -> float:
+    """
+    Peak resident set size of this process in MiB; ru_maxrss is in KiB on Linux and in bytes on macOS.
+    """
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / (1024 * 1024) if sys.platform == "darwin" else max_rss / 1024
+
+
+def run_stages(vault_dir: str, work_dir: str) -> Dict[str, Any]:
+    """
+    Export the vault served by fake_bw.py to a KeePass database, timing every stage.
+
+    Returns:
+        Dict[str, Any]: Seconds per stage, total seconds, and peak RSS in MiB.
+    """
+    # Imported here so the parent process, which only generates vaults and compares results, stays small.
+    # pylint: disable=import-outside-toplevel
+    from bitwarden_exporter import BITWARDEN_EXPORTER_GLOBAL_SETTINGS
+    from bitwarden_exporter.bw_list_process import process_list
+    from bitwarden_exporter.exporter.keepass_exporter import KeePassStorage
+
+    os.environ["FAKE_BW_VAULT"] = vault_dir
+    BITWARDEN_EXPORTER_GLOBAL_SETTINGS.bw_executable = os.path.join(BENCHMARKS_DIR, "fake_bw.py")
+    BITWARDEN_EXPORTER_GLOBAL_SETTINGS.tmp_dir = os.path.join(work_dir, "tmp")
+
+    stages: Dict[str, float] = {}
+    suite_start = time.perf_counter()
+
+    start = time.perf_counter()
+    bw_processed_items = process_list()
+    stages["process_list"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    storage = KeePassStorage(os.path.join(work_dir, "bench.kdbx"), "bench")
+    with storage:
+        stages["create_database"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        storage.process_organizations(bw_processed_items.organizations)
+        stages["process_organizations"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        storage.process_folders(bw_processed_items.folders)
+        stages["process_folders"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        storage.process_no_folder_items(bw_processed_items.no_folder_items)
+        stages["process_no_folder_items"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        storage.process_bw_exports(bw_processed_items.raw_items)
+        stages["process_bw_exports"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+    stages["save"] = time.perf_counter() - start
+
+    return {
+        "stages": stages,
+        "total_seconds": time.perf_counter() - suite_start,
+        "peak_rss_mib": peak_rss_mib(),
+    }
+
+
+def run_size(args: argparse.Namespace, size: int) -> Dict[str, Any]:
+    """
+    Generate a vault with `size` items and run the stages on it `args.repeat` times, each in a new process.
+
+    Returns:
+        Dict[str, Any]: The fastest time of every stage and of the total, and the largest peak RSS.
+    """
+    args.items = size
+    results = []
+    with tempfile.TemporaryDirectory(prefix="bw-bench-") as work_dir:
+        vault_dir = os.path.join(work_dir, "vault")
+        write_vault(vault_from_arguments(args), vault_dir)
+        for run in range(args.repeat):
+            run_dir = os.path.join(work_dir, f"run-{run}")
+            os.makedirs(run_dir)
+            worker = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--worker", vault_dir, run_dir],
+                check=True,
+                stdout=subprocess.PIPE,
+                env=os.environ,
+            )
+            results.append(json.loads(worker.stdout))
+    return {
+        "stages": {stage: round(min(result["stages"][stage] for result in results), 3) for stage in STAGES},
+        "total_seconds": round(min(result["total_seconds"] for result in results), 3),
+        "peak_rss_mib": round(max(result["peak_rss_mib"] for result in results), 1),
+    }
+
+
+def compare(size: int, result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    List the stages, total time, and peak RSS of a result that exceed the baseline by more than the tolerance.
+    """
+    measured = dict(result["stages"], total_seconds=result["total_seconds"], peak_rss_mib=result["peak_rss_mib"])
+    expected = dict(baseline["stages"], total_seconds=baseline["total_seconds"], peak_rss_mib=baseline["peak_rss_mib"])
+    regressions = []
+    for name, value in measured.items():
+        if name not in expected:
+            continue
+        # Ignore sub 100 ms stages, their timing is mostly noise.
+        if name != "peak_rss_mib" and value < 0.1:
+            continue
+        if value > expected[name] * (1 + tolerance):
+            regressions.append(f"{size} items: {name} {value:.3f} > baseline {expected[name]:.3f}")
+    return regressions
+
+
+def print_result(size: int, result: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    """
+    Print one line per stage with the baseline, if there is one.
+    """
+    print(f"{size} items")
+    for stage in STAGES:
+        line = f"  {stage:<24} {result['stages'][stage]:>9.3f}s"
+        if baseline:
+            line += f"  (baseline {baseline['stages'][stage]:.3f}s)"
+        print(line)
+    total = f"  {'total':<24} {result['total_seconds']:>9.3f}s"
+    rss = f"  {'peak RSS':<24} {result['peak_rss_mib']:>9.1f}MiB"
+    if baseline:
+        total += f"  (baseline {baseline['total_seconds']:.3f}s)"
+        rss += f"  (baseline {baseline['peak_rss_mib']:.1f}MiB)"
+    print(total)
+    print(rss)
+
+
+def main() -> None:
+    """
+    Run the suite, or a single size when called with --worker.
+    """
+    if len(sys.argv) == 4 and sys.argv[1] == "--worker":
+        logging.basicConfig(level=logging.ERROR)
+        print(json.dumps(run_stages(sys.argv[2], sys.argv[3])))
+        return
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--baselines", default=BASELINES_FILE, help="JSON file with the stored baselines.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per size, the fastest run is kept.")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Allowed slowdown, 0.5 is 50%%.")
+    parser.add_argument("--update-baselines", action="store_true", help="Store the results as the new baselines.")
+    args = parser.parse_args()
+
+    baselines: Dict[str, Any] = {}
+    if os.path.exists(args.baselines):
+        with open(args.baselines, "r", encoding="utf-8") as baselines_file:
+            baselines = json.load(baselines_file)
+
+    regressions: List[str] = []
+    for size in args.sizes:
+        result = run_size(args, size)
+        baseline = baselines.get(str(size), {})
+        print_result(size, result, baseline)
+        if args.update_baselines:
+            baselines[str(size)] = result
+        elif baseline:
+            regressions.extend(compare(size, result, baseline, args.tolerance))
+
+    if args.update_baselines:
+        with open(args.baselines, "w", encoding="utf-8") as baselines_file:
+            json.dump(baselines, baselines_file, indent=2, sort_keys=True)
+            baselines_file.write("\n")
+        print(f"Baselines written to {args.baselines}")
+
+    if regressions:
+        print("Regressions:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Stub Bitwarden CLI serving a synthetic vault written by synthetic_vault.py.
+
+Supports the commands bw_cli uses: `status`, `list folders|organizations|collections|items` and
+`get attachment <id> --itemid <item id> [--output <path>]`, which prints the attachment without --output.
+The vault directory is read from FAKE_BW_VAULT.
+FAKE_BW_ATTACHMENT_LATENCY, in seconds, delays every attachment download to model a remote server.
+
+Usage:
+    FAKE_BW_VAULT=/tmp/vault bitwarden-exporter --bw benchmarks/fake_bw.py target exporter keepass -p secret
+"""
+
+import json
+import os
+import sys
+import time
+from typing import List
+
+
+def main(argv: List[str]) -> int:
+    """
+    Run one bw command and return its exit code.
+    """
+    vault_dir = os.environ["FAKE_BW_VAULT"]
+    args = [arg for arg in argv if arg != "--raw"]
+
+    if args == ["status"]:
+        print(json.dumps({"serverUrl": None, "lastSync": None, "userEmail": "bench@example.com", "status": "unlocked"}))
+        return 0
+
+    if len(args) == 2 and args[0] == "list":
+        object_file = os.path.join(vault_dir, f"{args[1]}.json")
+        if not os.path.exists(object_file):
+            print(f"Unknown object {args[1]}", file=sys.stderr)
+            return 1
+        with open(object_file, "rb") as vault_file:
+            sys.stdout.buffer.write(vault_file.read())
+        return 0
+
+    if (
+        len(args) in (5, 7)
+        and args[:2] == ["get", "attachment"]
+        and args[3] == "--itemid"
+        and args[5:6] in ([], ["--output"])
+    ):
+        attachment_id = args[2]
+        with open(os.path.join(vault_dir, "attachments.json"), "rb") as attachments_file:
+            attachment_sizes = json.load(attachments_file)
+        if attachment_id not in attachment_sizes:
+            print("Not found.", file=sys.stderr)
+            return 1
+        time.sleep(float(os.environ.get("FAKE_BW_ATTACHMENT_LATENCY", "0")))
+        pattern = attachment_id.encode("utf-8")
+        size = attachment_sizes[attachment_id]
+        content = (pattern * (size // len(pattern) + 1))[:size]
+        if len(args) == 5:
+            sys.stdout.buffer.write(content)
+        else:
+            with open(args[6], "wb") as attachment_file:
+                attachment_file.write(content)
+        return 0
+
+    print(f"Unsupported command: {' '.join(args)}", file=sys.stderr)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Generate a synthetic Bitwarden vault for benchmarks.
+
+The vault is written as the JSON the Bitwarden CLI prints for `bw list folders|organizations|collections|items`,
+one file per object type, so fake_bw.py can serve it. Attachment contents are not stored; attachments.json maps
+each attachment ID to its size and fake_bw.py generates the content on the fly.
+
+Usage:
+    python benchmarks/synthetic_vault.py --items 10000 --output /tmp/vault
+"""
+
+import argparse
+import json
+import os
+import random
+from typing import Any, Dict, List
+
+ITEM_TYPES = {"login": 1, "note": 2, "card": 3, "identity": 4, "ssh": 5}
+
+TIMESTAMP = "2024-01-01T00:00:00.000Z"
+
+
+def nested_name(prefix: str, index: int, depth: int) -> str:
+    """
+    Name of a collection or folder nested `depth` levels deep, e.g. `Team-3/Level-1/Level-2`.
+    """
+    return "/".join([f"{prefix}-{index}"] + [f"Level-{level}" for level in range(1, depth + 1)])
+
+
+def make_item(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    rng: random.Random,
+    item_index: int,
+    item_type: str,
+    fields: int,
+    attachment_size: int,
+    attachment_ratio: float,
+) -> Dict[str, Any]:
+    """
+    Create one item of the given type with `fields` custom fields and, for a share of items, one attachment.
+    """
+    item: Dict[str, Any] = {
+        "passwordHistory": None,
+        "revisionDate": TIMESTAMP,
+        "creationDate": TIMESTAMP,
+        "deletedDate": None,
+        "object": "item",
+        "id": f"item-{item_index:08d}",
+        "organizationId": None,
+        "folderId": None,
+        "type": ITEM_TYPES[item_type],
+        "reprompt": 0,
+        "name": f"{item_type.capitalize()} {item_index}",
+        "notes": f"Notes of item {item_index}",
+        "favorite": False,
+        "collectionIds": [],
+        "fields": [
+            {"name": f"field-{field_index}", "value": f"value-{field_index}", "type": field_index % 2}
+            for field_index in range(fields)
+        ],
+        "attachments": [],
+    }
+    if item_type == "login":
+        item["login"] = {
+            "username": f"user-{item_index}",
+            "password": f"password-{item_index}",
+            "totp": "JBSWY3DPEHPK3PXP" if item_index % 4 == 0 else None,
+            "uris": [{"match": None, "uri": f"https://{item_index}.example.com/{uri_index}"} for uri_index in range(2)],
+            "passwordRevisionDate": None,
+        }
+    elif item_type == "note":
+        item["secureNote"] = {"type": 0}
+    elif item_type == "card":
+        item["card"] = {
+            "cardholderName": "Card Holder",
+            "brand": "Visa",
+            "number": "4111111111111111",
+            "expMonth": "1",
+            "expYear": "2030",
+            "code": "123",
+        }
+    elif item_type == "identity":
+        item["identity"] = {
+            "firstName": "First",
+            "lastName": f"Last {item_index}",
+            "email": f"{item_index}@example.com",
+        }
+    elif item_type == "ssh":
+        item["sshKey"] = {
+            "privateKey": f"PRIVATE KEY {item_index}",
+            "publicKey": f"ssh-ed25519 {item_index}",
+            "keyFingerprint": f"SHA256:{item_index}",
+        }
+
+    if attachment_size > 0 and rng.random() < attachment_ratio:
+        item["attachments"].append(
+            {
+                "id": f"attachment-{item_index:08d}",
+                "fileName": f"attachment-{item_index}.bin",
+                "size": str(attachment_size),
+                "sizeName": f"{attachment_size} B",
+                "url": "",
+            }
+        )
+    return item
+
+
+def generate_vault(  # pylint: disable=too-many-arguments,too-many-positional-arguments,too-many-locals
+    items: int,
+    item_types: List[str],
+    organizations: int,
+    collections: int,
+    folders: int,
+    depth: int,
+    attachment_size: int,
+    attachment_ratio: float,
+    fields: int,
+    seed: int = 0,
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Generate a vault; items are spread round robin over organizations, folders, and no folder.
+
+    Returns:
+        Dict[str, List[Dict[str, Any]]]: The output of `bw list <object type>` keyed by object type.
+    """
+    rng = random.Random(seed)
+    vault: Dict[str, List[Dict[str, Any]]] = {
+        "folders": [{"object": "folder", "id": None, "name": "No Folder"}],
+        "organizations": [],
+        "collections": [],
+        "items": [],
+    }
+    for folder_index in range(folders):
+        vault["folders"].append(
+            {"object": "folder", "id": f"folder-{folder_index}", "name": nested_name("Folder", folder_index, depth)}
+        )
+    for organization_index in range(organizations):
+        organization_id = f"organization-{organization_index}"
+        vault["organizations"].append(
+            {
+                "object": "organization",
+                "id": organization_id,
+                "name": f"Organization {organization_index}",
+                "status": 2,
+                "type": 0,
+                "enabled": True,
+            }
+        )
+        for collection_index in range(collections):
+            vault["collections"].append(
+                {
+                    "object": "collection",
+                    "id": f"{organization_id}-collection-{collection_index}",
+                    "organizationId": organization_id,
+                    "name": nested_name("Collection", collection_index, depth),
+                    "externalId": None,
+                }
+            )
+
+    for item_index in range(items):
+        item = make_item(
+            rng, item_index, item_types[item_index % len(item_types)], fields, attachment_size, attachment_ratio
+        )
+        bucket = item_index % 3
+        if bucket == 0 and organizations and collections:
+            organization_index = (item_index // 3) % organizations
+            item["organizationId"] = f"organization-{organization_index}"
+            item["collectionIds"] = [f"organization-{organization_index}-collection-{item_index % collections}"]
+        elif bucket == 1 and folders:
+            item["folderId"] = f"folder-{item_index % folders}"
+        vault["items"].append(item)
+    return vault
+
+
+def write_vault(vault: Dict[str, List[Dict[str, Any]]], output: str) -> None:
+    """
+    Write each object type to `<output>/<object type>.json` and the attachment sizes to `attachments.json`.
+    """
+    os.makedirs(output, exist_ok=True)
+    for object_type, objects in vault.items():
+        with open(os.path.join(output, f"{object_type}.json"), "w", encoding="utf-8") as vault_file:
+            json.dump(objects, vault_file)
+    attachment_sizes = {
+        attachment["id"]: int(attachment["size"]) for item in vault["items"] for attachment in item["attachments"]
+    }
+    with open(os.path.join(output, "attachments.json"), "w", encoding="utf-8") as attachments_file:
+        json.dump(attachment_sizes, attachments_file)
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Add the vault shape options to an argument parser.
+    """
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--item-types", default="login,note,card,identity,ssh", help="Comma separated, cycled.")
+    parser.add_argument("--organizations", type=int, default=5)
+    parser.add_argument("--collections", type=int, default=20, help="Collections per organization.")
+    parser.add_argument("--folders", type=int, default=20)
+    parser.add_argument("--depth", type=int, default=3, help="Nesting depth of collections and folders.")
+    parser.add_argument("--attachment-size", type=int, default=4096, help="Bytes per attachment, 0 for none.")
+    parser.add_argument("--attachment-ratio", type=float, default=0.01, help="Share of items with an attachment.")
+    parser.add_argument("--fields", type=int, default=3, help="Custom fields per item.")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def vault_from_arguments(args: argparse.Namespace) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Generate a vault from options added by add_arguments.
+    """
+    return generate_vault(
+        items=args.items,
+        item_types=args.item_types.split(","),
+        organizations=args.organizations,
+        collections=args.collections,
+        folders=args.folders,
+        depth=args.depth,
+        attachment_size=args.attachment_size,
+        attachment_ratio=args.attachment_ratio,
+        fields=args.fields,
+        seed=args.seed,
+    )
+
+
+def main() -> None:
+    """
+    Generate a vault into the output directory.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    parser.add_argument("--output", required=True, help="Directory to write the vault to.")
+    args = parser.parse_args()
+    write_vault(vault_from_arguments(args), args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,23 +6,105 @@ Classes:
 """
 
 import tempfile
+from dataclasses import dataclass
+from enum import Enum
+from typing import Optional
 
-from pydantic import BaseModel, Field
+
+class BwBackend(str, Enum):
+    """
+    Transport used to talk to the Bitwarden CLI.
+
+    Attributes:
+        CLI: Start a new `bw` process for every command.
+        SERVE: Send every command to a single, persistent `bw serve` over loopback HTTP.
+    """
+
+    CLI = "cli"
+    SERVE = "serve"
 
 
-class BitwardenExportSettings(BaseModel):
+class BwFetchMode(str, Enum):
+    """
+    How vault folders, organizations, collections, and items are fetched.
+
+    Attributes:
+        SEQUENTIAL: One `bw list` call per object type, one after another.
+        PARALLEL: The same `bw list` calls, run concurrently.
+        EXPORT: A single `bw export` for the personal vault plus one per organization, without attachments.
+    """
+
+    SEQUENTIAL = "sequential"
+    PARALLEL = "parallel"
+    EXPORT = "export"
+
+
+class BwDecodeMode(str, Enum):
+    """
+    How the output of `bw list items` is turned into BwItem models.
+
+    Attributes:
+        PER_ITEM: Decode the JSON, then validate one item at a time.
+        BATCH: Validate the whole JSON array in one call.
+        BATCH_NOGC: Like BATCH, with the garbage collector paused while the items are decoded.
+    """
+
+    PER_ITEM = "per-item"
+    BATCH = "batch"
+    BATCH_NOGC = "batch-nogc"
+
+
+@dataclass
+class BitwardenExportSettings:  # pylint: disable=too-many-instance-attributes
     """
     Configuration for the Bitwarden Exporter CLI.
 
+    A dataclass rather than a pydantic model: every CLI call imports this package, including --version and
+    --help, and importing pydantic would take most of their run time.
+
     Attributes:
-        tmp_dir: Directory used to store temporary, sensitive artifacts (attachments, SSH keys) during export.
+        tmp_dir: Directory used to store temporary, sensitive artifacts (attachments, SSH keys) during export;
+            a new temporary directory is created on first use when unset, see get_tmp_dir.
         debug: Enables verbose logging and keeps the temporary directory after export for troubleshooting.
         bw_executable: Path or command name of the Bitwarden CLI executable (defaults to "bw").
+        download_workers: Maximum number of attachments downloaded concurrently.
+        bw_backend: Transport used to run Bitwarden CLI commands.
+        bw_serve_url: URL of an already running `bw serve`; when unset, the serve backend starts its own.
+        fetch_mode: How vault lists are fetched from the Bitwarden CLI.
+        stream_items: Decode `bw list items` incrementally from the CLI output, one item at a time.
+        cache_dir: Directory of the encrypted incremental export cache; the cache is disabled when unset.
+        cache_password: Password of the export cache, supports the same prefixes as the KDBX password.
+        decode_mode: How vault items are validated; streamed and exported items are always validated one by one.
+        profile_file: Path of the Chrome trace JSON written on exit; profiling is disabled when unset.
+        aggregate_logs: Count repeated log messages and log one summary per stage instead of every line.
+        log_sample_interval: With debug and aggregate_logs, still log every Nth occurrence of a repeated message.
+        resume: Record finished downloads in a manifest in tmp_dir, skip the ones a previous run recorded, and
+            keep tmp_dir when the export fails, see DownloadManifest.
     """
 
-    tmp_dir: str = Field(default_factory=tempfile.mkdtemp)
+    tmp_dir: Optional[str] = None
     debug: bool = False
     bw_executable: str = "bw"
+    download_workers: int = 4
+    bw_backend: BwBackend = BwBackend.CLI
+    bw_serve_url: Optional[str] = None
+    fetch_mode: BwFetchMode = BwFetchMode.SEQUENTIAL
+    stream_items: bool = False
+    cache_dir: Optional[str] = None
+    cache_password: Optional[str] = None
+    decode_mode: BwDecodeMode = BwDecodeMode.BATCH
+    profile_file: Optional[str] = None
+    aggregate_logs: bool = False
+    log_sample_interval: int = 100
+    resume: bool = False
+
+    def get_tmp_dir(self) -> str:
+        """
+        Return the temporary directory, creating a new one on first use if none is configured.
+        """
+        if self.tmp_dir is None:
+            self.tmp_dir = tempfile.mkdtemp()
+        return self.tmp_dir
 
 
 BITWARDEN_EXPORTER_GLOBAL_SETTINGS: BitwardenExportSettings = BitwardenExportSettings()
@@ -46,3 +128,5 @@ This will not delete the temporary directory after the export.
 """
 
 APPLICATION_PACKAGE_NAME = "bitwarden-exporter"
+
+LOGGING_FORMAT = "%(asctime)s - %(levelname)s - %(name)s.%(funcName)s():%(lineno)d:- %(message)s"
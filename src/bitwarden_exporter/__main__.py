@@ -3,10 +3,9 @@
 Command line global options.
 """
 
-import logging
 import sys
 import time
-from importlib.metadata import PackageNotFoundError, version
+from typing import List, Optional
 
 import typer
 
@@ -15,8 +14,19 @@ from bitwarden_exporter import (
     APPLICATION_PACKAGE_NAME,
     BITWARDEN_EXPORTER_GLOBAL_SETTINGS,
     CLI_DEBUG_HELP,
+    BwBackend,
+    BwDecodeMode,
+    BwFetchMode,
 )
-from bitwarden_exporter.exporter import keepass_exporter
+from bitwarden_exporter.exporter import (
+    ARCHIVE_EXPORT_PASSWORD_HELP,
+    JSONL_EXPORT_PASSWORD_HELP,
+    KDBX_EXPORT_PASSWORD_HELP,
+    AttachmentMemoryPolicy,
+    JsonlAttachmentMode,
+)
+from bitwarden_exporter.log_handlers import configure_logging
+from bitwarden_exporter.profiler import start_profiling
 
 app = typer.Typer(
     name=APPLICATION_PACKAGE_NAME,
@@ -33,6 +43,12 @@ def version_callback(app_version: bool) -> None:
     Show the application's version and exit.
     """
     if app_version:
+        # importlib.metadata is slow to import, and only needed here.
+        from importlib.metadata import (  # pylint: disable=import-outside-toplevel
+            PackageNotFoundError,
+            version,
+        )
+
         try:
             uv_version = version(APPLICATION_PACKAGE_NAME)
             print(f"{uv_version}")
@@ -42,7 +58,7 @@ def version_callback(app_version: bool) -> None:
 
 
 @app.callback()
-def version_option_register(
+def version_option_register(  # pylint: disable=too-many-arguments,too-many-positional-arguments,too-many-locals
     # pylint: disable=unused-argument
     app_version: bool = typer.Option(
         None,
@@ -57,34 +73,138 @@ def version_option_register(
         help=CLI_DEBUG_HELP,
         is_eager=True,
     ),
-    tmp_dir: str = typer.Option(
+    tmp_dir: Optional[str] = typer.Option(
         default=BITWARDEN_EXPORTER_GLOBAL_SETTINGS.tmp_dir,
         help="Temporary directory to store temporary sensitive files.",
         show_default="Temporary directory",
         is_eager=True,
     ),
+    resume: bool = typer.Option(
+        BITWARDEN_EXPORTER_GLOBAL_SETTINGS.resume,
+        help="Record finished downloads in --tmp-dir and keep it when the export fails, so a new run with the same "
+        "--tmp-dir resumes instead of downloading every attachment again.",
+        is_eager=True,
+    ),
     bw_executable: str = typer.Option(
         BITWARDEN_EXPORTER_GLOBAL_SETTINGS.bw_executable,
         "--bw",
         help="Path or command name of the Bitwarden CLI executable.",
         is_eager=True,
     ),
+    download_workers: int = typer.Option(
+        BITWARDEN_EXPORTER_GLOBAL_SETTINGS.download_workers,
+        "--download-workers",
+        min=1,
+        help="Maximum number of attachments downloaded concurrently by the Bitwarden CLI.",
+        is_eager=True,
+    ),
+    bw_backend: BwBackend = typer.Option(
+        BITWARDEN_EXPORTER_GLOBAL_SETTINGS.bw_backend,
+        "--bw-backend",
+        help="Run every Bitwarden CLI command as a new process (cli) or through one persistent 'bw serve' (serve).",
+        is_eager=True,
+    ),
+    bw_serve_url: Optional[str] = typer.Option(
+        BITWARDEN_EXPORTER_GLOBAL_SETTINGS.bw_serve_url,
+        "--bw-serve-url",
+        help="Attach the serve backend to an already running 'bw serve', e.g. http://127.0.0.1:8087.",
+        show_default="Start a new 'bw serve' on a loopback port",
+        is_eager=True,
+    ),
+    fetch_mode: BwFetchMode = typer.Option(
+        BITWARDEN_EXPORTER_GLOBAL_SETTINGS.fetch_mode,
+        "--fetch-mode",
+        help="Fetch vault lists one after another, concurrently (starts one bw process per list at once), or from "
+        "'bw export' (export has no attachments).",
+        is_eager=True,
+    ),
+    stream_items: bool = typer.Option(
+        BITWARDEN_EXPORTER_GLOBAL_SETTINGS.stream_items,
+        help="Decode 'bw list items' incrementally, one item at a time, instead of holding the whole output.",
+        is_eager=True,
+    ),
+    cache_dir: Optional[str] = typer.Option(
+        BITWARDEN_EXPORTER_GLOBAL_SETTINGS.cache_dir,
+        "--cache-dir",
+        help="Keep an encrypted cache of attachments between runs and skip downloads for unchanged items.",
+        show_default="Cache disabled",
+        is_eager=True,
+    ),
+    cache_password: Optional[str] = typer.Option(
+        BITWARDEN_EXPORTER_GLOBAL_SETTINGS.cache_password,
+        "--cache-password",
+        help="Password of the export cache, as a direct value, file:<path> or env:<variable>.",
+        is_eager=True,
+    ),
+    decode_mode: BwDecodeMode = typer.Option(
+        BITWARDEN_EXPORTER_GLOBAL_SETTINGS.decode_mode,
+        "--decode-mode",
+        help="Validate vault items one by one, in one batch, or in one batch with the garbage collector paused.",
+        is_eager=True,
+    ),
+    profile_file: Optional[str] = typer.Option(
+        BITWARDEN_EXPORTER_GLOBAL_SETTINGS.profile_file,
+        "--profile",
+        help="Write a Chrome trace (Perfetto) of wall and CPU time per stage to this file and log a summary table.",
+        show_default="Profiling disabled",
+        is_eager=True,
+    ),
+    aggregate_logs: bool = typer.Option(
+        BITWARDEN_EXPORTER_GLOBAL_SETTINGS.aggregate_logs,
+        help="Log repeated per-item messages once and a count of each in one summary per stage.",
+        is_eager=True,
+    ),
+    log_sample_interval: int = typer.Option(
+        BITWARDEN_EXPORTER_GLOBAL_SETTINGS.log_sample_interval,
+        "--log-sample-interval",
+        min=1,
+        help="With --debug and --aggregate-logs, still log every Nth occurrence of a repeated message.",
+        is_eager=True,
+    ),
 ) -> None:
     """
     Main command-line interface for Bitwarden to KeePass export.
     """
     BITWARDEN_EXPORTER_GLOBAL_SETTINGS.debug = debug
 
-    logging.basicConfig(
-        level=logging.DEBUG if debug else logging.WARNING,
-        format="%(asctime)s - %(levelname)s - %(name)s.%(funcName)s():%(lineno)d:- %(message)s",
-        handlers=[logging.StreamHandler(sys.stdout)],
-    )
+    BITWARDEN_EXPORTER_GLOBAL_SETTINGS.aggregate_logs = aggregate_logs
+
+    BITWARDEN_EXPORTER_GLOBAL_SETTINGS.log_sample_interval = log_sample_interval
+
+    configure_logging(debug, aggregate_logs, log_sample_interval)
 
     BITWARDEN_EXPORTER_GLOBAL_SETTINGS.bw_executable = bw_executable
 
+    if resume and tmp_dir is None:
+        raise typer.BadParameter("--resume requires --tmp-dir, a new temporary directory cannot be resumed")
+
     BITWARDEN_EXPORTER_GLOBAL_SETTINGS.tmp_dir = tmp_dir
 
+    BITWARDEN_EXPORTER_GLOBAL_SETTINGS.resume = resume
+
+    BITWARDEN_EXPORTER_GLOBAL_SETTINGS.download_workers = download_workers
+
+    if fetch_mode == BwFetchMode.EXPORT and bw_backend == BwBackend.SERVE:
+        raise typer.BadParameter("--fetch-mode export cannot be combined with --bw-backend serve, which has no export")
+
+    BITWARDEN_EXPORTER_GLOBAL_SETTINGS.bw_backend = bw_backend
+
+    BITWARDEN_EXPORTER_GLOBAL_SETTINGS.bw_serve_url = bw_serve_url
+
+    BITWARDEN_EXPORTER_GLOBAL_SETTINGS.fetch_mode = fetch_mode
+
+    BITWARDEN_EXPORTER_GLOBAL_SETTINGS.stream_items = stream_items
+
+    BITWARDEN_EXPORTER_GLOBAL_SETTINGS.cache_dir = cache_dir
+
+    BITWARDEN_EXPORTER_GLOBAL_SETTINGS.cache_password = cache_password
+
+    BITWARDEN_EXPORTER_GLOBAL_SETTINGS.decode_mode = decode_mode
+
+    BITWARDEN_EXPORTER_GLOBAL_SETTINGS.profile_file = profile_file
+    if profile_file:
+        start_profiling(profile_file)
+
 
 target = typer.Typer()
 
@@ -94,8 +214,8 @@ target_exporter = typer.Typer()
 
 
 @target_exporter.command(name="keepass", help="Export Bitwarden data to KDBX file.")
-def target_exporter_keepass(
-    kdbx_password: str = typer.Option(..., "--kdbx-password", "-p", help=keepass_exporter.KDBX_EXPORT_PASSWORD_HELP),
+def target_exporter_keepass(  # pylint: disable=too-many-arguments,too-many-positional-arguments,too-many-locals
+    kdbx_password: str = typer.Option(..., "--kdbx-password", "-p", help=KDBX_EXPORT_PASSWORD_HELP),
     kdbx_file: str = typer.Option(
         f"bitwarden_dump_{int(time.time())}.kdbx",
         "--kdbx-file",
@@ -103,11 +223,203 @@ def target_exporter_keepass(
         help="Bitwarden Export Location",
         show_default="bitwarden_dump_<timestamp>.kdbx",
     ),
+    attachment_memory_limit: int = typer.Option(
+        0,
+        "--attachment-memory-limit",
+        min=0,
+        help="Maximum attachment size in MiB held in memory until the KDBX file is saved, 0 for no limit.",
+    ),
+    attachment_memory_policy: AttachmentMemoryPolicy = typer.Option(
+        AttachmentMemoryPolicy.WARN,
+        "--attachment-memory-policy",
+        help="Warn and continue, or stop the export, when the attachment memory limit is exceeded.",
+    ),
+    gzip_bitwarden_export: bool = typer.Option(
+        False,
+        help="Gzip each section of the raw Bitwarden data attached to the 'Bitwarden Export' entry.",
+    ),
+    bitwarden_export: bool = typer.Option(
+        True,
+        help="Attach the raw Bitwarden data to a 'Bitwarden Export' entry. Without it, the raw items are not kept "
+        "in memory unless a JMESPath password needs them, so --stream-items only holds one item at a time.",
+    ),
+    argon2_memory: Optional[int] = typer.Option(
+        None,
+        "--argon2-memory",
+        min=1,
+        help="Argon2 memory cost of the KDBX key derivation in MiB.",
+        show_default="pykeepass default",
+    ),
+    argon2_iterations: Optional[int] = typer.Option(
+        None,
+        "--argon2-iterations",
+        min=1,
+        help="Argon2 iterations of the KDBX key derivation.",
+        show_default="pykeepass default",
+    ),
+    argon2_parallelism: Optional[int] = typer.Option(
+        None,
+        "--argon2-parallelism",
+        min=1,
+        help="Argon2 lanes of the KDBX key derivation.",
+        show_default="Available CPU cores",
+    ),
+    compression: bool = typer.Option(
+        True,
+        help="Gzip the KDBX payload.",
+    ),
+    target_unlock_time: Optional[float] = typer.Option(
+        None,
+        "--target-unlock-time",
+        min=0.01,
+        help="Calibrate the Argon2 iterations so that unlocking the KDBX takes about this many seconds here.",
+        show_default="Calibration disabled",
+    ),
+    split_by_organization: bool = typer.Option(
+        False,
+        help="Write 'My Vault' and every organization to its own KDBX file, named after --kdbx-file, "
+        "built in parallel, with a <name>.manifest.json listing which file holds which organization.",
+    ),
+    organization_passwords: Optional[List[str]] = typer.Option(
+        None,
+        "--organization-password",
+        help="Password of one organization's KDBX file with --split-by-organization, as "
+        "<organization id or name>=<password>, 'My Vault' for the personal vault. The password supports the "
+        "same prefixes as --kdbx-password. Can be repeated.",
+        show_default="--kdbx-password",
+    ),
+    organization_workers: Optional[int] = typer.Option(
+        None,
+        "--organization-workers",
+        min=1,
+        help="Maximum number of KDBX files built at the same time with --split-by-organization.",
+        show_default="Available CPU cores",
+    ),
+    shard_max_size: int = typer.Option(
+        0,
+        "--shard-max-size",
+        min=0,
+        help="Split the export into <name>.001.kdbx, <name>.002.kdbx, ... with at most this many MiB of "
+        "attachments each, 0 for no limit. The first file holds an index of the file of every item.",
+    ),
+    shard_max_entries: int = typer.Option(
+        0,
+        "--shard-max-entries",
+        min=0,
+        help="Split the export like --shard-max-size, with at most this many items per file, 0 for no limit.",
+    ),
+    pipelined: bool = typer.Option(
+        False,
+        help="Write KeePass entries while later attachments are still downloading, instead of after all downloads.",
+    ),
+    verify: bool = typer.Option(
+        False,
+        help="Store a digest of every entry in the KDBX file, then read the saved file back and check every entry "
+        "against it, reporting mismatches by Bitwarden item ID.",
+    ),
 ) -> None:
     """
     CLI interface for exporting Bitwarden data to KeePass.
     """
-    keepass_exporter.create_database_cli(kdbx_password, kdbx_file)
+    # Imported here, so that --version and --help do not load pykeepass and the other export dependencies.
+    # pylint: disable=import-outside-toplevel
+    from bitwarden_exporter.exporter import keepass_exporter, keepass_kdf, keepass_organizations, keepass_shards
+
+    binary_memory_budget = keepass_exporter.BinaryMemoryBudget(
+        limit_bytes=attachment_memory_limit * 1024 * 1024, policy=attachment_memory_policy
+    )
+    kdbx_format = keepass_kdf.KdbxFormat(
+        argon2_memory_mib=argon2_memory,
+        argon2_iterations=argon2_iterations,
+        argon2_parallelism=argon2_parallelism or keepass_kdf.available_cores(),
+        compression=compression,
+        target_unlock_seconds=target_unlock_time,
+    )
+    if gzip_bitwarden_export and not bitwarden_export:
+        raise typer.BadParameter("--gzip-bitwarden-export cannot be combined with --no-bitwarden-export")
+    if pipelined and (split_by_organization or shard_max_size or shard_max_entries):
+        raise typer.BadParameter("--pipelined cannot be combined with --split-by-organization or sharding")
+    if split_by_organization and (shard_max_size or shard_max_entries):
+        raise typer.BadParameter("--split-by-organization cannot be combined with --shard-max-size/--shard-max-entries")
+    if shard_max_size or shard_max_entries:
+        keepass_shards.create_sharded_databases_cli(
+            kdbx_password,
+            kdbx_file,
+            max_bytes=shard_max_size * 1024 * 1024,
+            max_entries=shard_max_entries,
+            binary_memory_budget=binary_memory_budget,
+            gzip_bitwarden_export=gzip_bitwarden_export,
+            kdbx_format=kdbx_format,
+            verify=verify,
+            bitwarden_export=bitwarden_export,
+        )
+        return
+    if split_by_organization:
+        keepass_organizations.create_organization_databases_cli(
+            kdbx_password,
+            kdbx_file,
+            organization_passwords=organization_passwords,
+            workers=organization_workers,
+            binary_memory_budget=binary_memory_budget,
+            gzip_bitwarden_export=gzip_bitwarden_export,
+            kdbx_format=kdbx_format,
+            verify=verify,
+            bitwarden_export=bitwarden_export,
+        )
+        return
+    keepass_exporter.create_database_cli(
+        kdbx_password,
+        kdbx_file,
+        binary_memory_budget=binary_memory_budget,
+        gzip_bitwarden_export=gzip_bitwarden_export,
+        kdbx_format=kdbx_format,
+        pipelined=pipelined,
+        verify=verify,
+        bitwarden_export=bitwarden_export,
+    )
+
+
+@target_exporter.command(name="jsonl", help="Export Bitwarden data to an encrypted JSON Lines file.")
+def target_exporter_jsonl(
+    jsonl_password: str = typer.Option(..., "--jsonl-password", "-p", help=JSONL_EXPORT_PASSWORD_HELP),
+    jsonl_file: str = typer.Option(
+        f"bitwarden_dump_{int(time.time())}.jsonl",
+        "--jsonl-file",
+        "-o",
+        help="Bitwarden Export Location",
+        show_default="bitwarden_dump_<timestamp>.jsonl",
+    ),
+    attachment_mode: JsonlAttachmentMode = typer.Option(
+        JsonlAttachmentMode.INLINE,
+        "--attachments",
+        help="Write the content of every attachment, or only reference them without downloading.",
+    ),
+) -> None:
+    """
+    CLI interface for exporting Bitwarden data to an encrypted JSONL file, one record at a time.
+    """
+    from bitwarden_exporter.exporter import jsonl_exporter  # pylint: disable=import-outside-toplevel
+
+    jsonl_exporter.create_jsonl_export_cli(jsonl_password, jsonl_file, attachment_mode)
+
+
+@target_exporter.command(name="archive", help="Export Bitwarden data to an encrypted zip archive, without temp files.")
+def target_exporter_archive(
+    archive_password: str = typer.Option(..., "--archive-password", "-p", help=ARCHIVE_EXPORT_PASSWORD_HELP),
+    archive_file: str = typer.Option(
+        f"bitwarden_dump_{int(time.time())}.zip.enc",
+        "--archive-file",
+        "-o",
+        help="Bitwarden Export Location, '-' to write the archive to stdout and the logs to stderr.",
+        show_default="bitwarden_dump_<timestamp>.zip.enc",
+    ),
+) -> None:
+    """
+    CLI interface for exporting Bitwarden data to an encrypted zip archive, streaming attachments from Bitwarden.
+    """
+    from bitwarden_exporter.exporter import archive_exporter  # pylint: disable=import-outside-toplevel
+
+    archive_exporter.create_archive_export_cli(archive_password, archive_file)
 
 
 target_importer = typer.Typer()
@@ -116,11 +428,34 @@ target.add_typer(target_exporter, name="exporter", help="Select the exporter to
 target.add_typer(target_importer, name="importer", help="TO BE IMPLEMENTED", chain=True, deprecated=True)
 
 
+def writes_archive_to_stdout(args: List[str]) -> bool:
+    """
+    Tell whether the command line runs the archive exporter with "-" as its archive file, before typer parses it.
+
+    Args:
+        args: The command line arguments, without the program name.
+
+    Returns:
+        bool: True if the archive is written to stdout.
+    """
+    if "archive" not in args:
+        return False
+    archive_args = args[args.index("archive") + 1 :]
+    for index, arg in enumerate(archive_args):
+        if arg in ("-o", "--archive-file") and archive_args[index + 1 : index + 2] == ["-"]:
+            return True
+        if arg in ("-o-", "--archive-file=-"):
+            return True
+    return False
+
+
 def main() -> None:
     """
     Main entry point for the Bitwarden to KeePass exporter CLI.
     """
-    print(APPLICATION_NAME_ASCII)
+    # An archive written to stdout must not be preceded by the banner; open_archive_output sends everything
+    # printed after it to stderr.
+    print(APPLICATION_NAME_ASCII, file=sys.stderr if writes_archive_to_stdout(sys.argv[1:]) else sys.stdout)
     app()
 
 
@@ -2,51 +2,62 @@
 This module provides a command-line interface (CLI) for interacting with Bitwarden.
 
 Functions:
+    bw_command_name(cmd: List[str]) -> str:
     bw_exec(cmd: List[str], ret_encoding: str = "UTF-8", env_vars: Optional[Dict[str, str]] = None) -> str:
+    bw_run(cmd: List[str], ret_encoding: str = "UTF-8", env_vars: Optional[Dict[str, str]] = None) -> str:
+    bw_exec_stream(cmd: List[str], ret_encoding: str = "UTF-8", is_raw: bool = True) -> Iterator[Any]:
+
+Classes:
+    AttachmentStream:
+        Content of one attachment, read from the Bitwarden CLI without a temporary file.
+    AttachmentDownloader:
+        Bounded, adaptive worker pool for concurrent attachment downloads.
 
 Exceptions:
     BitwardenException:
         Raised when there is an error executing a Bitwarden CLI command.
 """
 
+import http.client
+import json
 import logging
 import os
 import os.path
+import socket
 import subprocess  # nosec B404
-from typing import Dict, List, Optional
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from types import TracebackType
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Type
 
-from . import BITWARDEN_EXPORTER_GLOBAL_SETTINGS
+from . import BITWARDEN_EXPORTER_GLOBAL_SETTINGS, BwBackend
+from .bw_serve import get_serve_client
+from .download_manifest import DownloadManifest
 from .exceptions import BitwardenException
+from .profiler import profile_span
+from .utils import iter_json_array
 
 LOGGER = logging.getLogger(__name__)
 
 
-def download_file(item_id: str, attachment_id: str, download_location: str) -> None:
+def partial_download_path(download_location: str) -> str:
+    """
+    Path an attachment is downloaded to before it is renamed to download_location.
     """
-    Download an attachment from Bitwarden to a local path.
+    return f"{download_location}.part"
 
-    Args:
-        item_id: The Bitwarden item identifier.
-        attachment_id: The attachment identifier within the item.
-        download_location: Absolute or relative path where the file will be saved. Parent
-            directories are created if missing. If the file already exists, the download is skipped.
 
-    Returns:
-        None
+def bw_command_name(cmd: List[str]) -> str:
     """
-    parent_dir = os.path.dirname(download_location)
-    if not os.path.exists(parent_dir):
-        os.makedirs(parent_dir)
+    Name of a Bitwarden CLI command without its arguments, e.g. `bw list items` or `bw get attachment`.
 
-    if os.path.exists(download_location):
-        LOGGER.warning("Skipping download: application detected existing file at target location")
-        LOGGER.info("File already exists, skipping download")
-        return
-
-    bw_exec(
-        ["get", "attachment", attachment_id, "--itemid", item_id, "--output", download_location],
-        is_raw=False,
-    )
+    Only the subcommand and the object type are kept, so the name never contains IDs, paths, or secrets.
+    """
+    if cmd and cmd[0] in ("list", "get") and len(cmd) > 1:
+        return f"bw {cmd[0]} {cmd[1]}"
+    return f"bw {cmd[0]}" if cmd else "bw"
 
 
 def bw_exec(
@@ -68,20 +79,62 @@ def bw_exec(
         str: The command's stdout content.
 
     Raises:
-        ValueError: If the command returns a non-zero exit status.
+        BitwardenException: If the command returns a non-zero exit status or times out.
     """
-    cmd = [BITWARDEN_EXPORTER_GLOBAL_SETTINGS.bw_executable] + cmd
+    try:
+        return bw_run(cmd, ret_encoding=ret_encoding, env_vars=env_vars, is_raw=is_raw)
+    except subprocess.CalledProcessError as e:
+        LOGGER.info("Error executing command %s", e)
+        raise BitwardenException("Error executing command, enable debug logging for more information")
+    except subprocess.TimeoutExpired as e:
+        LOGGER.info("Timeout executing command %s", e)
+        raise BitwardenException("Timeout executing command, enable debug logging for more information")
 
-    if is_raw:
-        cmd.append("--raw")
 
-    cli_env_vars = os.environ.copy()
+def bw_run(
+    cmd: List[str],
+    ret_encoding: str = "UTF-8",
+    env_vars: Optional[Dict[str, str]] = None,
+    is_raw: bool = True,
+) -> str:
+    """
+    Execute the Bitwarden CLI and return stdout, leaving error handling to the caller.
 
-    if env_vars is not None:
-        cli_env_vars.update(env_vars)
+    Unlike bw_exec, failures are raised as subprocess errors and do not raise BitwardenException, so the
+    temporary directory is left untouched and callers such as AttachmentDownloader can retry.
 
-    LOGGER.debug("Executing CLI :: %s", " ".join(cmd))
-    try:
+    With the serve backend selected, the command is sent to the shared `bw serve` instead of a new process.
+
+    Args:
+        cmd: Arguments to pass to the bw executable (e.g., ["list", "items"]).
+        ret_encoding: The character encoding for stdout/stderr decoding.
+        env_vars: Optional environment variables to add/override for this invocation.
+        is_raw: When True, appends --raw to the command to simplify parsing.
+
+    Returns:
+        str: The command's stdout content.
+
+    Raises:
+        subprocess.CalledProcessError: If the command returns a non-zero exit status.
+        subprocess.TimeoutExpired: If the command does not finish in time.
+    """
+    with profile_span(bw_command_name(cmd), "bw", backend=BITWARDEN_EXPORTER_GLOBAL_SETTINGS.bw_backend.value):
+        if BITWARDEN_EXPORTER_GLOBAL_SETTINGS.bw_backend == BwBackend.SERVE:
+            if env_vars:
+                LOGGER.debug("Extra environment variables are ignored by the bw serve backend")
+            return get_serve_client().exec(cmd, ret_encoding=ret_encoding)
+
+        cmd = [BITWARDEN_EXPORTER_GLOBAL_SETTINGS.bw_executable] + cmd
+
+        if is_raw:
+            cmd.append("--raw")
+
+        cli_env_vars = os.environ.copy()
+
+        if env_vars is not None:
+            cli_env_vars.update(env_vars)
+
+        LOGGER.debug("Executing CLI :: %s", " ".join(cmd))
         command_out = subprocess.run(
             cmd, capture_output=True, check=False, encoding=ret_encoding, env=cli_env_vars, timeout=10
         )  # nosec B603
@@ -90,9 +143,394 @@ def bw_exec(
             LOGGER.info("Error executing command %s", command_out.stderr)
         command_out.check_returncode()
         return command_out.stdout
-    except subprocess.CalledProcessError as e:
-        LOGGER.info("Error executing command %s", e)
-        raise BitwardenException("Error executing command, enable debug logging for more information")
-    except subprocess.TimeoutExpired as e:
-        LOGGER.info("Timeout executing command %s", e)
-        raise BitwardenException("Timeout executing command, enable debug logging for more information")
+
+
+def bw_exec_stream(cmd: List[str], ret_encoding: str = "UTF-8", is_raw: bool = True) -> Iterator[Any]:
+    """
+    Execute a Bitwarden CLI command that prints a JSON array and yield the elements as they are decoded.
+
+    stdout is read incrementally from the pipe, so the full output is never held as one string. The command
+    is killed when waiting for it takes longer than the same hard timeout used by bw_exec; the time the caller
+    spends on the yielded elements, while the command is blocked on a full pipe, does not count. With the serve
+    backend the response is decoded at once and its elements are yielded.
+
+    Args:
+        cmd: Arguments to pass to the bw executable (e.g., ["list", "items"]).
+        ret_encoding: The character encoding for stdout/stderr decoding.
+        is_raw: When True, appends --raw to the command to simplify parsing.
+
+    Yields:
+        The decoded array elements.
+
+    Raises:
+        BitwardenException: If the command fails, times out, or does not print a JSON array.
+    """
+    if BITWARDEN_EXPORTER_GLOBAL_SETTINGS.bw_backend == BwBackend.SERVE:
+        yield from json.loads(bw_exec(cmd, ret_encoding=ret_encoding, is_raw=is_raw))
+        return
+
+    # The span stays open while the caller processes the yielded elements, so it includes their processing time.
+    span_name = f"{bw_command_name(cmd)} (stream)"
+    cmd = [BITWARDEN_EXPORTER_GLOBAL_SETTINGS.bw_executable] + cmd
+
+    if is_raw:
+        cmd.append("--raw")
+
+    LOGGER.debug("Executing CLI :: %s", " ".join(cmd))
+    with (
+        profile_span(span_name, "bw", backend=BwBackend.CLI.value),
+        tempfile.TemporaryFile() as stderr_file,
+        subprocess.Popen(
+            cmd, stdout=subprocess.PIPE, stderr=stderr_file, encoding=ret_encoding, env=os.environ.copy()
+        ) as process,
+    ):  # nosec B603
+
+        # Seconds spent waiting for the command, and since when it is waited for; None while the caller runs.
+        waited_seconds = 0.0
+        waiting_since: Optional[float] = time.monotonic()
+        finished = threading.Event()
+
+        def kill_on_timeout() -> None:
+            while not finished.wait(0.5):
+                since = waiting_since
+                if since is not None and waited_seconds + time.monotonic() - since > 10:
+                    LOGGER.info("Timeout executing command %s", " ".join(cmd))
+                    process.kill()
+                    return
+
+        watchdog = threading.Thread(target=kill_on_timeout, name="bw-stream-timeout", daemon=True)
+        watchdog.start()
+        try:
+            if process.stdout is None:
+                raise BitwardenException("Unable to read output of Bitwarden CLI")
+            for element in iter_json_array(process.stdout):
+                waited_seconds += time.monotonic() - (waiting_since or 0.0)
+                waiting_since = None
+                yield element
+                waiting_since = time.monotonic()
+            return_code = process.wait()
+        finally:
+            finished.set()
+            if process.poll() is None:
+                process.kill()
+
+        stderr_file.seek(0)
+        stderr = stderr_file.read().decode(ret_encoding, errors="replace")
+        if len(stderr) > 0:
+            LOGGER.warning("Error while executing a command. Enable debug logging for more information")
+            LOGGER.info("Error executing command %s", stderr)
+        if return_code != 0:
+            LOGGER.info("Error executing command %s, exit code %s", " ".join(cmd), return_code)
+            raise BitwardenException("Error executing command, enable debug logging for more information")
+
+
+class AttachmentStream:  # pylint: disable=too-many-instance-attributes
+    """
+    Content of one attachment, read straight from `bw get attachment --raw` or `bw serve`, without a file.
+
+    The command starts when the stream is created, so streams can be opened ahead of the one being read; each
+    waits once its pipe is full. A read that waits longer than the hard timeout of bw_exec for data kills the
+    command. Like bw_run, failures are raised as subprocess errors, so the caller can retry.
+
+    Usage:
+        with AttachmentStream(item_id, attachment_id) as stream:
+            while chunk := stream.read(65536):
+                ...
+    """
+
+    def __init__(self, item_id: str, attachment_id: str, timeout: float = 10) -> None:
+        """
+        Start the download.
+
+        Args:
+            item_id: The Bitwarden item identifier.
+            attachment_id: The attachment identifier within the item.
+            timeout: Seconds a read may wait for data.
+
+        Raises:
+            subprocess.CalledProcessError: If `bw serve` answers with an error or cannot be reached.
+            subprocess.TimeoutExpired: If `bw serve` does not answer in time.
+        """
+        self.__cmd = ["get", "attachment", attachment_id, "--itemid", item_id, "--raw"]
+        self.__timeout = timeout
+        self.__waiting_since: Optional[float] = None
+        self.__timed_out = False
+        self.__finished = threading.Event()
+        self.__process: Optional["subprocess.Popen[bytes]"] = None
+        self.__connection: Optional[Any] = None
+        self.__stderr_file: Any = None
+        self.__stdout: Any = None
+
+        if BITWARDEN_EXPORTER_GLOBAL_SETTINGS.bw_backend == BwBackend.SERVE:
+            self.__connection, self.__stdout = get_serve_client().open_attachment(item_id, attachment_id)
+            return
+
+        cmd = [BITWARDEN_EXPORTER_GLOBAL_SETTINGS.bw_executable] + self.__cmd
+        LOGGER.debug("Executing CLI :: %s", " ".join(cmd))
+        self.__stderr_file = tempfile.TemporaryFile()  # pylint: disable=consider-using-with
+        self.__process = subprocess.Popen(  # pylint: disable=consider-using-with
+            cmd, stdout=subprocess.PIPE, stderr=self.__stderr_file, env=os.environ.copy()
+        )  # nosec B603
+        self.__stdout = self.__process.stdout
+        threading.Thread(target=self.__kill_on_timeout, name="bw-attachment-timeout", daemon=True).start()
+
+    def __enter__(self) -> "AttachmentStream":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        """
+        Stop the download; when the content was read without an error, check that the command succeeded.
+
+        Raises:
+            subprocess.CalledProcessError: If the command failed.
+            subprocess.TimeoutExpired: If a read timed out.
+        """
+        self.close(check=exc_type is None)
+
+    def read(self, size: int) -> bytes:
+        """
+        Read up to size bytes of the content, an empty result at the end.
+
+        Raises:
+            subprocess.CalledProcessError: If the connection to `bw serve` broke.
+            subprocess.TimeoutExpired: If `bw serve` does not send data in time.
+        """
+        self.__waiting_since = time.monotonic()
+        try:
+            return bytes(self.__stdout.read(size))
+        except socket.timeout:
+            raise subprocess.TimeoutExpired(self.__cmd, self.__timeout)
+        except (OSError, http.client.HTTPException) as e:
+            if self.__connection is None:
+                raise
+            raise subprocess.CalledProcessError(1, self.__cmd, stderr=str(e))
+        finally:
+            self.__waiting_since = None
+
+    def close(self, check: bool = True) -> None:
+        """
+        Stop the download and release its process or connection.
+
+        Args:
+            check: Raise if the command failed or timed out; the content must have been read to the end.
+
+        Raises:
+            subprocess.CalledProcessError: If check is set and the command failed.
+            subprocess.TimeoutExpired: If check is set and a read timed out.
+        """
+        self.__finished.set()
+        if self.__connection is not None:
+            self.__connection.close()
+            return
+        if self.__process is None:
+            return
+        process, self.__process = self.__process, None
+        if not check and process.poll() is None:
+            process.kill()
+        self.__stdout.close()
+        return_code = process.wait()
+        self.__stderr_file.seek(0)
+        stderr = self.__stderr_file.read().decode("utf-8", errors="replace")
+        self.__stderr_file.close()
+        if not check:
+            return
+        if self.__timed_out:
+            raise subprocess.TimeoutExpired(self.__cmd, self.__timeout)
+        if return_code != 0:
+            raise subprocess.CalledProcessError(return_code, self.__cmd, stderr=stderr)
+        if stderr:
+            LOGGER.warning("Error while executing a command. Enable debug logging for more information")
+            LOGGER.info("Error executing command %s", stderr)
+
+    def __kill_on_timeout(self) -> None:
+        while not self.__finished.wait(0.5):
+            since = self.__waiting_since
+            if since is not None and time.monotonic() - since > self.__timeout and self.__process is not None:
+                LOGGER.info("Timeout executing command %s", " ".join(self.__cmd))
+                self.__timed_out = True
+                self.__process.kill()
+                return
+
+
+class AttachmentDownloader:  # pylint: disable=too-many-instance-attributes
+    """
+    Bounded worker pool that downloads attachments concurrently.
+
+    Downloads are scheduled with schedule() and run in the background while the caller keeps processing items.
+    The number of downloads in flight adapts to the health of the CLI: a failure or timeout halves it and delays
+    the retry, a success allows one more again. Failures are collected and reported together on exit.
+
+    Every attachment is downloaded next to its location and renamed once complete, so a file at the location is
+    always complete. With a download manifest, an existing file is only kept when it matches the manifest, and
+    every finished download is recorded in it.
+
+    Usage:
+        with AttachmentDownloader(max_workers=4) as downloader:
+            downloader.schedule(item_id, attachment_id, download_location)
+    """
+
+    def __init__(
+        self,
+        max_workers: int,
+        max_attempts: int = 3,
+        backoff_seconds: float = 1.0,
+        manifest: Optional[DownloadManifest] = None,
+    ) -> None:
+        """
+        Initialize the download pool.
+
+        Args:
+            max_workers: Upper bound of concurrent bw processes.
+            max_attempts: Number of tries per attachment before it is reported as failed.
+            backoff_seconds: Base delay before a retry, doubled for each further attempt.
+            manifest: Manifest of a resumable export, see DownloadManifest.
+        """
+        if max_workers < 1:
+            raise BitwardenException("Download workers must be at least 1")
+        self.__max_workers = max_workers
+        self.__manifest = manifest
+        self.__max_attempts = max_attempts
+        self.__backoff_seconds = backoff_seconds
+        self.__limit = max_workers
+        self.__in_flight = 0
+        self.__condition = threading.Condition()
+        self.__failures: List[Tuple[str, str, str]] = []
+        self.__futures: List["Future[None]"] = []
+        self.__executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bw-download")
+
+    def __enter__(self) -> "AttachmentDownloader":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        """
+        Wait for all scheduled downloads and report failures.
+
+        Raises:
+            BitwardenException: If one or more attachments could not be downloaded.
+        """
+        self.__executor.shutdown(wait=True, cancel_futures=exc_type is not None)
+        if exc_type is not None:
+            return
+
+        for future in self.__futures:
+            future.result()
+
+        self.raise_failures()
+
+    def raise_failures(self) -> None:
+        """
+        Report the attachments that could not be downloaded so far.
+
+        Raises:
+            BitwardenException: If one or more attachments could not be downloaded.
+        """
+        with self.__condition:
+            failures = list(self.__failures)
+        if failures:
+            LOGGER.warning("Some attachments could not be downloaded. Enable debug logging for more information")
+            for item_id, attachment_id, reason in failures:
+                LOGGER.info("Failed to download attachment %s of item %s: %s", attachment_id, item_id, reason)
+            raise BitwardenException(
+                f"Failed to download {len(failures)} attachment(s), enable debug logging for more information"
+            )
+
+    def schedule(self, item_id: str, attachment_id: str, download_location: str) -> "Future[None]":
+        """
+        Queue an attachment download.
+
+        Args:
+            item_id: The Bitwarden item identifier.
+            attachment_id: The attachment identifier within the item.
+            download_location: Path where the file will be saved. Parent directories are created if missing. The
+                download is skipped if the file already exists, or with a manifest, if the manifest has it complete.
+
+        Returns:
+            Future[None]: Done when the download succeeded or failed for good, see raise_failures.
+        """
+        future = self.__executor.submit(self.__download, item_id, attachment_id, download_location)
+        self.__futures.append(future)
+        return future
+
+    def __acquire(self) -> None:
+        with self.__condition:
+            while self.__in_flight >= self.__limit:
+                self.__condition.wait()
+            self.__in_flight += 1
+
+    def __release(self, success: bool) -> None:
+        with self.__condition:
+            self.__in_flight -= 1
+            if success:
+                self.__limit = min(self.__max_workers, self.__limit + 1)
+            else:
+                self.__limit = max(1, self.__limit // 2)
+            self.__condition.notify_all()
+
+    def __download(self, item_id: str, attachment_id: str, download_location: str) -> None:
+        with profile_span("download attachment", "download") as span:
+            span["attempts"] = self.__download_with_retries(item_id, attachment_id, download_location)
+            if os.path.exists(download_location):
+                span["bytes"] = os.path.getsize(download_location)
+
+    def __download_with_retries(self, item_id: str, attachment_id: str, download_location: str) -> int:
+        """
+        Returns:
+            int: The number of attempts made.
+        """
+        os.makedirs(os.path.dirname(download_location), exist_ok=True)
+
+        if self.__manifest is None and os.path.exists(download_location):
+            LOGGER.warning("Skipping download: application detected existing file at target location")
+            LOGGER.info("File already exists, skipping download")
+            return 0
+        if self.__manifest is not None and self.__manifest.is_complete(item_id, attachment_id, download_location):
+            LOGGER.warning("Skipping download: application resumed an attachment downloaded by a previous run")
+            LOGGER.info("Attachment %s matches the download manifest, skipping download", attachment_id)
+            return 0
+
+        partial_location = partial_download_path(download_location)
+        for attempt in range(1, self.__max_attempts + 1):
+            self.__acquire()
+            error: Optional[BaseException] = None
+            retry = False
+            try:
+                bw_run(
+                    ["get", "attachment", attachment_id, "--itemid", item_id, "--output", partial_location],
+                    is_raw=False,
+                )
+            except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+                error = e
+                retry = attempt < self.__max_attempts
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                # Always give the slot back, otherwise the other downloads wait for it forever.
+                self.__release(success=error is None)
+                if error is not None:
+                    if os.path.exists(partial_location):
+                        os.remove(partial_location)
+                    if not retry:
+                        with self.__condition:
+                            self.__failures.append((item_id, attachment_id, str(error) or type(error).__name__))
+            if error is None:
+                os.replace(partial_location, download_location)
+                if self.__manifest is not None:
+                    self.__manifest.record(item_id, attachment_id, download_location)
+                return attempt
+            if not retry:
+                return attempt
+            LOGGER.warning("Attachment download failed, application will retry with reduced concurrency")
+            LOGGER.info("Retrying download of attachment %s, attempt %s: %s", attachment_id, attempt, error)
+            time.sleep(self.__backoff_seconds * 2 ** (attempt - 1))
+        return self.__max_attempts
@@ -5,22 +5,48 @@ Process bitwarden items.
 import json
 import logging
 import os.path
-from datetime import datetime, timezone
-from typing import Any, Dict, List
-
-from pydantic import BaseModel
-
-from . import BITWARDEN_EXPORTER_GLOBAL_SETTINGS
-from .bw_cli import bw_exec, download_file
-from .bw_models import BwCollection, BwFolder, BwItem, BwItemAttachment, BwOrganization
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, Generator, Iterable, Iterator, List, NamedTuple, Optional, Tuple, TypeVar
+
+from pydantic import BaseModel, Field
+
+from . import BITWARDEN_EXPORTER_GLOBAL_SETTINGS, BwDecodeMode, BwFetchMode
+from .bw_cli import AttachmentDownloader, bw_exec, bw_exec_stream
+from .bw_models import (
+    BwCollection,
+    BwFolder,
+    BwItem,
+    BwItemAttachment,
+    BwOrganization,
+    decode_item_dicts,
+    decode_items,
+)
+from .bw_state_cache import ExportStateCache
+from .download_manifest import DownloadManifest
 from .exceptions import BitwardenException
+from .log_handlers import log_stage
+from .profiler import profile_span
+from .remove_downloads import remove_downloaded
+from .utils import index_items, paused_gc, resolve_secret
 
 LOGGER = logging.getLogger(__name__)
 
+ItemT = TypeVar("ItemT")
+
 
 class RawItems(BaseModel):
     """
     Raw items from Bitwarden.
+
+    Attributes:
+        cli_outputs: Output of the Bitwarden CLI command each section was decoded from, exactly as printed, keyed
+            by section name. The list sections hold that output as their only element. Sections read from an
+            export or streamed have no entry. Excluded from dumps.
+        items_by_id: The item dicts of items by ID, for JMESPath secrets, see utils.search_items. Set once all
+            items are processed. Excluded from dumps.
     """
 
     status: Dict[str, Any] = {}
@@ -28,6 +54,8 @@ class RawItems(BaseModel):
     organizations: List[Any] = []
     collections: List[Any] = []
     items: List[Any] = []
+    cli_outputs: Dict[str, str] = Field(default_factory=dict, exclude=True, repr=False)
+    items_by_id: Dict[str, List[Any]] = Field(default_factory=dict, exclude=True, repr=False)
 
 
 class BwProcessResult(BaseModel):
@@ -106,38 +134,230 @@ def add_items_to_organization(
             collection.items[bw_item.id] = bw_item
 
 
+class BwVaultLists(BaseModel):
+    """
+    Decoded output of the Bitwarden CLI list commands, before it is turned into models.
+
+    Attributes:
+        outputs: Output of each `bw list` command as printed, keyed by object type; empty in EXPORT mode.
+    """
+
+    folders: List[Any] = []
+    organizations: List[Any] = []
+    collections: List[Any] = []
+    items: List[Any] = []
+    outputs: Dict[str, str] = {}
+
+
+def fetch_vault_lists(fetch_mode: BwFetchMode, include_items: bool = True, items_as_json: bool = False) -> BwVaultLists:
+    """
+    Fetch folders, organizations, collections, and items from an unlocked vault.
+
+    Modes:
+    - SEQUENTIAL: Run `bw list` for each object type, one after another.
+    - PARALLEL: Run the same `bw list` calls concurrently.
+    - EXPORT: Read folders and items from a single `bw export --format json`, and collections and
+      organization items from one `bw export --organizationid` per organization, run concurrently.
+      Bitwarden exports do not contain attachments, so none are downloaded in this mode.
+
+    Args:
+        fetch_mode: How the lists are fetched.
+        include_items: When False, items are not listed, e.g. because the caller streams them with bw_exec_stream.
+            Ignored in EXPORT mode, where items are part of the export.
+        items_as_json: Leave items empty and only keep the output of `bw list items` in outputs, for
+            decode_items. Ignored in EXPORT mode.
+
+    Returns:
+        BwVaultLists
+
+    Raises:
+        BitwardenException: If CLI execution fails or an export is encrypted.
+    """
+    object_types = ["folders", "organizations", "collections"] + (["items"] if include_items else [])
+
+    if fetch_mode in (BwFetchMode.SEQUENTIAL, BwFetchMode.PARALLEL):
+        if fetch_mode == BwFetchMode.SEQUENTIAL:
+            outputs = {object_type: bw_exec(["list", object_type], is_raw=False) for object_type in object_types}
+        else:
+            with ThreadPoolExecutor(max_workers=len(object_types), thread_name_prefix="bw-list") as executor:
+                futures = {
+                    object_type: executor.submit(bw_exec, ["list", object_type], is_raw=False)
+                    for object_type in object_types
+                }
+                outputs = {object_type: future.result() for object_type, future in futures.items()}
+        return BwVaultLists(
+            **{
+                object_type: json.loads(output)
+                for object_type, output in outputs.items()
+                if not (items_as_json and object_type == "items")
+            },
+            outputs=outputs,
+        )
+
+    LOGGER.warning("Fetching: application is reading the vault from 'bw export', attachments are not included")
+    bw_organizations_dict: List[Dict[str, Any]] = json.loads(bw_exec(["list", "organizations"], is_raw=False))
+    export_cmds = [["export", "--format", "json"]] + [
+        ["export", "--organizationid", bw_organization_dict["id"], "--format", "json"]
+        for bw_organization_dict in bw_organizations_dict
+    ]
+    with ThreadPoolExecutor(max_workers=len(export_cmds), thread_name_prefix="bw-export") as executor:
+        bw_exports = [json.loads(bw_export) for bw_export in executor.map(bw_exec, export_cmds)]
+
+    bw_vault_lists = BwVaultLists(organizations=bw_organizations_dict)
+    for bw_export in bw_exports:
+        if bw_export.get("encrypted"):
+            raise BitwardenException("Encrypted Bitwarden exports are not supported")
+        for bw_folder_dict in bw_export.get("folders", []):
+            bw_vault_lists.folders.append({"object": "folder", **bw_folder_dict})
+        for bw_collection_dict in bw_export.get("collections", []):
+            bw_vault_lists.collections.append({"object": "collection", **bw_collection_dict})
+        for bw_item_dict in bw_export.get("items", []):
+            bw_vault_lists.items.append({"object": "item", **bw_item_dict})
+    return bw_vault_lists
+
+
+def validate_items(
+    bw_item_dicts: Iterable[Dict[str, Any]], raw_items: Optional[List[Dict[str, Any]]]
+) -> Iterator[BwItem]:
+    """
+    Validate items one at a time, as they are decoded.
+
+    Args:
+        bw_item_dicts: Decoded items, e.g. streamed from bw_exec_stream.
+        raw_items: Receives every decoded item before it is validated; None to not keep them.
+
+    Yields:
+        BwItem: The validated items.
+    """
+    for bw_item_dict in bw_item_dicts:
+        if raw_items is not None:
+            raw_items.append(bw_item_dict)
+        with profile_span("validate item", "validation"):
+            bw_item = BwItem(**bw_item_dict)
+        yield bw_item
+
+
+def release_consumed(items: List[ItemT]) -> Iterator[ItemT]:
+    """
+    Yield the items in order, removing each from the list as it is handed out.
+
+    Iterating over a list keeps every item alive until the iteration ends; with this, nothing but the caller
+    holds on to an item once it was consumed.
+
+    Args:
+        items: The items; emptied as they are consumed.
+
+    Yields:
+        The items, in the order of the list.
+    """
+    items.reverse()
+    while items:
+        yield items.pop()
+
+
+def open_state_cache() -> Optional[ExportStateCache]:
+    """
+    Open the incremental export cache when one is configured.
+
+    Returns:
+        ExportStateCache | None: The cache, or None when no cache directory is configured.
+
+    Raises:
+        BitwardenException: If a cache directory is configured without a cache password.
+    """
+    if not BITWARDEN_EXPORTER_GLOBAL_SETTINGS.cache_dir:
+        return None
+    if not BITWARDEN_EXPORTER_GLOBAL_SETTINGS.cache_password:
+        raise BitwardenException("A cache password is required to use the export cache")
+    return ExportStateCache(
+        BITWARDEN_EXPORTER_GLOBAL_SETTINGS.cache_dir,
+        resolve_secret(BITWARDEN_EXPORTER_GLOBAL_SETTINGS.cache_password, None),
+    )
+
+
+def open_download_manifest() -> Optional[DownloadManifest]:
+    """
+    Open the download manifest of the temporary directory when resume is enabled.
+
+    Returns:
+        DownloadManifest | None: The manifest, or None when resume is disabled.
+    """
+    if not BITWARDEN_EXPORTER_GLOBAL_SETTINGS.resume:
+        return None
+    return DownloadManifest(BITWARDEN_EXPORTER_GLOBAL_SETTINGS.get_tmp_dir())
+
+
+class PreparedVault(NamedTuple):
+    """
+    A fetched vault whose items are still to be processed.
+
+    Not a pydantic model: validation would copy bw_items_dict and wrap bw_items_iter.
+
+    Attributes:
+        bw_process_items: Folders, organizations with their collections, and the raw data; items are added as
+            they are processed.
+        bw_items_iter: The items, validated as they are consumed.
+        bw_items_dict: Receives the raw items, it is the list inside bw_process_items.raw_items.items.
+    """
+
+    bw_process_items: BwProcessResult
+    bw_items_iter: Iterator[BwItem]
+    bw_items_dict: List[Dict[str, Any]]
+
+
 # pylint: disable=too-many-locals,too-many-statements,too-many-branches
-def process_list(allow_duplicates: bool = False) -> BwProcessResult:
+def prepare_vault(keep_raw_items: bool = True, stream_items: Optional[bool] = None) -> PreparedVault:
     """
-    Run the Bitwarden-to-KeePass export process end-to-end.
+    Verify the vault is unlocked, fetch its lists, and validate folders, organizations, and collections.
 
-    Steps:
-    1. Verify BW vault is unlocked and fetch folders, organizations, collections, and items via the Bitwarden CLI.
-    2. Download item attachments and materialize SSH keys into temporary files.
-    3. Organize items by organization/collection and by folder; collect items without either.
-    4. Persist all content to a KeePass database via KeePassStorage, including JSON exports as attachments.
-    5. Optionally, remove the temporary directory when not in debug mode.
+    Items are fetched too, but only validated when the returned iterator is consumed, see process_list.
+
+    Args:
+        keep_raw_items: Keep the decoded items in raw_items, for the Bitwarden Export entry and JMESPath secrets.
+            Without it, bw_items_dict stays empty. Callers only set it when one of them needs the items: the raw
+            dicts take several times the memory of the CLI output, and with streamed items they are all that
+            would otherwise still hold the whole vault.
+        stream_items: Decode `bw list items` one item at a time; None to follow the global settings. Ignored
+            in EXPORT mode.
 
     Returns:
-        BwProcessResult
+        PreparedVault
 
     Raises:
-        BitwardenException: If the vault is locked or an invariant fails during processing.
-        ValueError: If CLI execution fails (propagated from bw_exec).
+        BitwardenException: If the vault is locked.
     """
     bw_process_items: BwProcessResult = BwProcessResult()
 
-    bw_current_status = json.loads(bw_exec(["status"], is_raw=False))
+    bw_status_output = bw_exec(["status"], is_raw=False)
+    bw_current_status = json.loads(bw_status_output)
     bw_process_items.raw_items.status.update(bw_current_status)
+    bw_process_items.raw_items.cli_outputs["status"] = bw_status_output
 
     if bw_current_status["status"] != "unlocked":
         raise BitwardenException("Vault is not unlocked")
     LOGGER.debug("Vault status: %s", json.dumps(bw_current_status))
 
-    bw_folders_dict = json.loads((bw_exec(["list", "folders"], is_raw=False)))
-
-    for bw_folder_dict in bw_folders_dict:
-        bw_folder = BwFolder(**bw_folder_dict)
+    if stream_items is None:
+        stream_items = BITWARDEN_EXPORTER_GLOBAL_SETTINGS.stream_items
+    if BITWARDEN_EXPORTER_GLOBAL_SETTINGS.fetch_mode == BwFetchMode.EXPORT:
+        if stream_items:
+            LOGGER.warning("Streaming items is not supported with the export fetch mode, decoding the export at once")
+        stream_items = False
+
+    decode_mode = BITWARDEN_EXPORTER_GLOBAL_SETTINGS.decode_mode
+    batch_decode = (
+        decode_mode != BwDecodeMode.PER_ITEM
+        and not stream_items
+        and BITWARDEN_EXPORTER_GLOBAL_SETTINGS.fetch_mode != BwFetchMode.EXPORT
+    )
+
+    bw_vault_lists = fetch_vault_lists(
+        BITWARDEN_EXPORTER_GLOBAL_SETTINGS.fetch_mode, include_items=not stream_items, items_as_json=batch_decode
+    )
+
+    for bw_folder_dict in bw_vault_lists.folders:
+        with profile_span("validate folder", "validation"):
+            bw_folder = BwFolder(**bw_folder_dict)
         if not bw_folder.id:
             continue
 
@@ -146,87 +366,361 @@ def process_list(allow_duplicates: bool = False) -> BwProcessResult:
     LOGGER.warning("Fetching summary: application retrieved folders from Bitwarden CLI")
     LOGGER.info("Total Folders Fetched: %s", len(bw_process_items.folders))
 
-    bw_organizations_dict = json.loads((bw_exec(["list", "organizations"], is_raw=False)))
-    bw_process_items.raw_items.organizations.append(bw_organizations_dict)
+    bw_process_items.raw_items.organizations.append(bw_vault_lists.organizations)
 
-    for bw_organization_dict in bw_organizations_dict:
-        bw_organization = BwOrganization(**bw_organization_dict)
+    for bw_organization_dict in bw_vault_lists.organizations:
+        with profile_span("validate organization", "validation"):
+            bw_organization = BwOrganization(**bw_organization_dict)
         bw_process_items.organizations[bw_organization.id] = bw_organization
 
     LOGGER.warning("Fetching summary: application retrieved organizations from Bitwarden CLI")
     LOGGER.info("Total Organizations Fetched: %s", len(bw_process_items.organizations))
 
-    bw_collections_dict = json.loads((bw_exec(["list", "collections"], is_raw=False)))
-    bw_process_items.raw_items.collections.append(bw_collections_dict)
+    bw_process_items.raw_items.collections.append(bw_vault_lists.collections)
     LOGGER.warning("Fetching summary: application retrieved collections from Bitwarden CLI")
-    LOGGER.info("Total Collections Fetched: %s", len(bw_collections_dict))
+    LOGGER.info("Total Collections Fetched: %s", len(bw_vault_lists.collections))
 
-    for bw_collection_dict in bw_collections_dict:
-        bw_collection = BwCollection(**bw_collection_dict)
+    for bw_collection_dict in bw_vault_lists.collections:
+        with profile_span("validate collection", "validation"):
+            bw_collection = BwCollection(**bw_collection_dict)
         organization = bw_process_items.organizations[bw_collection.organizationId]
         organization.collections[bw_collection.id] = bw_collection
 
-    bw_items_dict: List[Dict[str, Any]] = json.loads((bw_exec(["list", "items"], is_raw=False)))
+    bw_items_dict: List[Dict[str, Any]] = []
     bw_process_items.raw_items.items.append(bw_items_dict)
 
-    LOGGER.warning("Fetching summary: application retrieved items from Bitwarden CLI")
-    LOGGER.info("Total Items Fetched: %s", len(bw_items_dict))
-    for bw_item_dict in bw_items_dict:
-        bw_item = BwItem(**bw_item_dict)
-        LOGGER.debug("Processing Item %s", bw_item.name)
-        if bw_item.attachments and len(bw_item.attachments) > 0:
-            for attachment in bw_item.attachments:
-                attachment.local_file_path = os.path.join(
-                    BITWARDEN_EXPORTER_GLOBAL_SETTINGS.tmp_dir, bw_item.id, attachment.id
-                )
-                LOGGER.warning("Downloading attachment: application is saving Bitwarden attachment to a temporary path")
-                LOGGER.info(
-                    "%s:: Downloading Attachment %s to %s",
-                    bw_item.name,
-                    attachment.fileName,
-                    attachment.local_file_path,
-                )
-                download_file(bw_item.id, attachment.id, attachment.local_file_path)
-
-        if bw_item.sshKey:
-            LOGGER.debug("Processing SSH Key Item %s", bw_item.name)
-
-            download_location = os.path.join(BITWARDEN_EXPORTER_GLOBAL_SETTINGS.tmp_dir, bw_item.id)
-            if not os.path.exists(download_location):
-                os.makedirs(download_location)
-
-            epoch_id = str(datetime.now(timezone.utc).timestamp())
-            attachment_priv_key = BwItemAttachment(
-                id=epoch_id,
+    for object_type in ("organizations", "collections"):
+        if object_type in bw_vault_lists.outputs:
+            bw_process_items.raw_items.cli_outputs[object_type] = bw_vault_lists.outputs.pop(object_type)
+    # The output of `bw list items` is as large as the vault, it is only kept with the raw items.
+    bw_items_output = bw_vault_lists.outputs.pop("items", "")
+    if keep_raw_items and bw_items_output:
+        bw_process_items.raw_items.cli_outputs["items"] = bw_items_output
+
+    raw_items_sink = bw_items_dict if keep_raw_items else None
+    if stream_items:
+        bw_items_iter: Iterator[BwItem] = validate_items(
+            bw_exec_stream(["list", "items"], is_raw=False), raw_items_sink
+        )
+    elif batch_decode:
+        with paused_gc() if decode_mode == BwDecodeMode.BATCH_NOGC else nullcontext():
+            # The raw items are still needed for the Bitwarden Export entry and JMESPath secrets, so they are
+            # parsed once and validated from the dicts; otherwise the output is validated directly.
+            if keep_raw_items:
+                bw_items_dict.extend(json.loads(bw_items_output))
+            with profile_span("validate items", "validation") as span:
+                if keep_raw_items:
+                    bw_items = decode_item_dicts(bw_items_dict)
+                else:
+                    bw_items = decode_items(bw_items_output)
+                span["count"] = len(bw_items)
+        bw_items_iter = release_consumed(bw_items)
+        LOGGER.warning("Fetching summary: application retrieved items from Bitwarden CLI")
+        LOGGER.info("Total Items Fetched: %s", len(bw_items))
+    else:
+        bw_items_iter = validate_items(release_consumed(bw_vault_lists.items), raw_items_sink)
+        LOGGER.warning("Fetching summary: application retrieved items from Bitwarden CLI")
+        LOGGER.info("Total Items Fetched: %s", len(bw_vault_lists.items))
+
+    return PreparedVault(bw_process_items=bw_process_items, bw_items_iter=bw_items_iter, bw_items_dict=bw_items_dict)
+
+
+def prepare_item(
+    bw_item: BwItem,
+    downloader: AttachmentDownloader,
+    state_cache: Optional[ExportStateCache],
+    downloaded_attachments: List[Tuple[BwItem, BwItemAttachment]],
+    download_attachments: bool = True,
+) -> List["Future[None]"]:
+    """
+    Restore the attachments of an item from the export cache or schedule their download, and keep its SSH key
+    as in-memory attachments.
+
+    Args:
+        bw_item: The item.
+        downloader: Downloads the attachments in the background.
+        state_cache: Export cache to restore attachments from, if configured.
+        downloaded_attachments: Receives the downloaded attachments when a cache is configured, to store them in
+            the cache.
+        download_attachments: When False, attachments are left as Bitwarden references, without local_file_path.
+
+    Returns:
+        List[Future[None]]: The scheduled downloads of the item.
+    """
+    downloads: List["Future[None]"] = []
+    LOGGER.debug("Processing Item %s", bw_item.name)
+    if download_attachments and bw_item.attachments and len(bw_item.attachments) > 0:
+        for attachment in bw_item.attachments:
+            attachment.local_file_path = os.path.join(
+                BITWARDEN_EXPORTER_GLOBAL_SETTINGS.get_tmp_dir(), bw_item.id, attachment.id
+            )
+            if state_cache and state_cache.restore_attachment(bw_item, attachment):
+                LOGGER.debug("%s:: Attachment %s restored from cache", bw_item.name, attachment.fileName)
+                continue
+            LOGGER.warning("Downloading attachment: application is saving Bitwarden attachment to a temporary path")
+            LOGGER.info(
+                "%s:: Downloading Attachment %s to %s",
+                bw_item.name,
+                attachment.fileName,
+                attachment.local_file_path,
+            )
+            downloads.append(downloader.schedule(bw_item.id, attachment.id, attachment.local_file_path))
+            if state_cache:
+                downloaded_attachments.append((bw_item, attachment))
+
+    if bw_item.sshKey:
+        LOGGER.debug("Processing SSH Key Item %s", bw_item.name)
+
+        bw_item.attachments.append(
+            BwItemAttachment(
+                id="sshKey-privateKey",
                 fileName="id_key",
-                size="",
+                size=str(len(bw_item.sshKey.privateKey.encode("utf-8"))),
                 sizeName="",
                 url="",
-                local_file_path=os.path.join(BITWARDEN_EXPORTER_GLOBAL_SETTINGS.tmp_dir, bw_item.id, epoch_id),
+                content=bw_item.sshKey.privateKey.encode("utf-8"),
             )
-            with open(attachment_priv_key.local_file_path, "w", encoding="utf-8") as ssh_priv_file:
-                ssh_priv_file.write(bw_item.sshKey.privateKey)
-            bw_item.attachments.append(attachment_priv_key)
-
-            attachment_pub_key = BwItemAttachment(
-                id=epoch_id + "-pub",
+        )
+        bw_item.attachments.append(
+            BwItemAttachment(
+                id="sshKey-publicKey",
                 fileName="id_key.pub",
-                size="",
+                size=str(len(bw_item.sshKey.publicKey.encode("utf-8"))),
                 sizeName="",
                 url="",
-                local_file_path=os.path.join(BITWARDEN_EXPORTER_GLOBAL_SETTINGS.tmp_dir, bw_item.id, epoch_id + "-pub"),
+                content=bw_item.sshKey.publicKey.encode("utf-8"),
             )
-            with open(attachment_pub_key.local_file_path, "w", encoding="utf-8") as ssh_pub_file:
-                ssh_pub_file.write(bw_item.sshKey.publicKey)
-            bw_item.attachments.append(attachment_pub_key)
-
-        if bw_item.organizationId:
-            add_items_to_organization(bw_item.organizationId, bw_process_items.organizations, bw_item, allow_duplicates)
-        elif bw_item.folderId:
-            add_items_to_folder(bw_item.folderId, bw_process_items.folders, bw_item)
-        else:
-            bw_process_items.no_folder_items.append(bw_item)
+        )
+    return downloads
+
+
+def place_item(bw_item: BwItem, bw_process_items: BwProcessResult, allow_duplicates: bool = False) -> None:
+    """
+    Add an item to its organization collections, its folder, or the items without folder.
+    """
+    if bw_item.organizationId:
+        add_items_to_organization(bw_item.organizationId, bw_process_items.organizations, bw_item, allow_duplicates)
+    elif bw_item.folderId:
+        add_items_to_folder(bw_item.folderId, bw_process_items.folders, bw_item)
+    else:
+        bw_process_items.no_folder_items.append(bw_item)
+
+
+def iter_items(bw_processed_items: BwProcessResult) -> Iterator[BwItem]:
+    """
+    Iterate the processed items by organization collection, folder, then without folder, the order KeePassStorage
+    writes them; an item in several collections is repeated.
+    """
+    for organization in bw_processed_items.organizations.values():
+        for collection in organization.collections.values():
+            yield from collection.items.values()
+    for folder in bw_processed_items.folders.values():
+        yield from folder.items.values()
+    yield from bw_processed_items.no_folder_items
+
+
+def store_downloaded(
+    state_cache: Optional[ExportStateCache], downloaded_attachments: List[Tuple[BwItem, BwItemAttachment]]
+) -> None:
+    """
+    Store the downloaded attachments in the export cache, if configured.
+    """
+    if state_cache:
+        for bw_item, attachment in downloaded_attachments:
+            state_cache.store_attachment(bw_item, attachment)
+        state_cache.save()
+
+
+@log_stage("process_list")
+def process_list(
+    allow_duplicates: bool = False, keep_raw_items: bool = True, download_attachments: bool = True
+) -> BwProcessResult:
+    """
+    Run the Bitwarden-to-KeePass export process end-to-end.
+
+    Steps:
+    1. Verify BW vault is unlocked and fetch folders, organizations, collections, and items via the Bitwarden CLI,
+       see fetch_vault_lists for the available fetch modes.
+       Items are validated in one batch with decode_items, unless the decode mode is per-item or items are
+       streamed or read from an export.
+    2. Restore attachments of unchanged items from the export cache, if configured, download the others
+       concurrently in the background, and keep SSH keys as in-memory attachments. With resume enabled,
+       attachments a previous run recorded in the download manifest are not downloaded again.
+    3. Organize items by organization/collection and by folder; collect items without either. Index the raw items by ID
+       for JMESPath secrets.
+    4. Persist all content to a KeePass database via KeePassStorage, including JSON exports as attachments.
+    5. Optionally, remove the temporary directory when not in debug mode.
+
+    Args:
+        allow_duplicates: If True, add items of several collections to every collection.
+        keep_raw_items: Keep the decoded items in raw_items, see prepare_vault.
+        download_attachments: Download attachments; when False they are left as Bitwarden references.
+
+    Returns:
+        BwProcessResult
+
+    Raises:
+        BitwardenException: If the vault is locked or an invariant fails during processing.
+        ValueError: If CLI execution fails (propagated from bw_exec).
+    """
+    prepared_vault = prepare_vault(keep_raw_items=keep_raw_items)
+    bw_process_items = prepared_vault.bw_process_items
+
+    state_cache = open_state_cache()
+    downloaded_attachments: List[Tuple[BwItem, BwItemAttachment]] = []
+
+    item_count = 0
+    try:
+        with AttachmentDownloader(
+            BITWARDEN_EXPORTER_GLOBAL_SETTINGS.download_workers,
+            manifest=open_download_manifest() if download_attachments else None,
+        ) as downloader:
+            for bw_item in prepared_vault.bw_items_iter:
+                item_count += 1
+                prepare_item(bw_item, downloader, state_cache, downloaded_attachments, download_attachments)
+                place_item(bw_item, bw_process_items, allow_duplicates)
+    except BaseException:
+        # Downloads that were still running when processing failed may have written files after the cleanup.
+        remove_downloaded(failed=True)
+        raise
+
+    store_downloaded(state_cache, downloaded_attachments)
+    bw_process_items.raw_items.items_by_id = index_items(bw_process_items.raw_items.items)
 
     LOGGER.warning("Summary: application finished processing items and is about to write to KeePass")
-    LOGGER.info("Total Items Fetched: %s", len(bw_items_dict))
+    LOGGER.info("Total Items Fetched: %s", item_count)
     return bw_process_items
+
+
+_PIPELINE_END = object()
+
+
+def run_pipeline(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    prepared_vault: PreparedVault,
+    downloader: AttachmentDownloader,
+    state_cache: Optional[ExportStateCache],
+    downloaded_attachments: List[Tuple[BwItem, BwItemAttachment]],
+    allow_duplicates: bool,
+    queue_size: int,
+    keep_items: bool = True,
+    download_attachments: bool = True,
+) -> Generator[Tuple[BwProcessResult, Iterator[BwItem]], None, int]:
+    """
+    Run the producer thread of process_list_pipelined and yield the vault and the consumer iterator once.
+
+    Returns:
+        int: The number of items the producer handed out.
+    """
+    bw_process_items = prepared_vault.bw_process_items
+    ready_items: "queue.Queue[Any]" = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    item_count = 0
+
+    def produce() -> None:
+        nonlocal item_count
+        try:
+            for bw_item in prepared_vault.bw_items_iter:
+                if stop.is_set():
+                    break
+                item_count += 1
+                downloads = prepare_item(bw_item, downloader, state_cache, downloaded_attachments, download_attachments)
+                if keep_items:
+                    place_item(bw_item, bw_process_items, allow_duplicates)
+                ready_items.put((bw_item, downloads))
+            ready_items.put(_PIPELINE_END)
+        except Exception as e:  # pylint: disable=broad-except
+            ready_items.put(e)
+
+    def consume() -> Iterator[BwItem]:
+        while True:
+            ready_item = ready_items.get()
+            if ready_item is _PIPELINE_END:
+                return
+            if isinstance(ready_item, Exception):
+                raise ready_item
+            bw_item, downloads = ready_item
+            wait(downloads)
+            if downloads:
+                downloader.raise_failures()
+            yield bw_item
+
+    producer = threading.Thread(target=produce, name="bw-pipeline", daemon=True)
+    producer.start()
+    try:
+        yield bw_process_items, consume()
+    finally:
+        stop.set()
+        # Unblock the producer and wait for it to finish.
+        while producer.is_alive():
+            try:
+                ready_items.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        producer.join()
+    return item_count
+
+
+@contextmanager
+def process_list_pipelined(
+    allow_duplicates: bool = False,
+    queue_size: int = 4096,
+    keep_items: bool = True,
+    download_attachments: bool = True,
+    stream_items: Optional[bool] = None,
+) -> Iterator[Tuple[BwProcessResult, Iterator[BwItem]]]:
+    """
+    Process the vault like process_list, and hand out every item as soon as its attachments are downloaded.
+
+    A producer thread validates the items, schedules their downloads, and puts them on a bounded queue. The
+    caller consumes the items in vault order while later attachments are still downloading; at most queue_size
+    items are waiting for the caller at any time. Items are also added to the returned BwProcessResult, which
+    is complete once the context exits.
+
+    Without keep_items, nothing holds on to an item once the caller is done with it: items are neither added to
+    the returned BwProcessResult nor kept in its raw items. Memory then stays flat with streamed items.
+
+    Consuming the items raises as soon as an attachment could not be downloaded, reporting the failures so far.
+
+    Args:
+        allow_duplicates: If True, add items of several collections to every collection.
+        queue_size: Maximum number of processed items waiting to be consumed.
+        keep_items: Add the items to the returned BwProcessResult and keep the raw items.
+        download_attachments: Download attachments; when False they are left as Bitwarden references.
+        stream_items: Decode `bw list items` one item at a time; None to follow the global settings. Ignored
+            in EXPORT mode.
+
+    Yields:
+        Tuple[BwProcessResult, Iterator[BwItem]]: The vault, with organizations, collections, and folders
+            complete, and the items ready to be written.
+
+    Raises:
+        BitwardenException: If the vault is locked, an invariant fails, or attachments could not be downloaded.
+    """
+    prepared_vault = prepare_vault(keep_raw_items=keep_items, stream_items=stream_items)
+
+    state_cache = open_state_cache()
+    downloaded_attachments: List[Tuple[BwItem, BwItemAttachment]] = []
+    try:
+        with AttachmentDownloader(
+            BITWARDEN_EXPORTER_GLOBAL_SETTINGS.download_workers,
+            manifest=open_download_manifest() if download_attachments else None,
+        ) as downloader:
+            item_count = yield from run_pipeline(
+                prepared_vault,
+                downloader,
+                state_cache,
+                downloaded_attachments,
+                allow_duplicates,
+                queue_size,
+                keep_items=keep_items,
+                download_attachments=download_attachments,
+            )
+    except BaseException:
+        # Downloads that were still running when the export failed may have written files after the cleanup.
+        remove_downloaded(failed=True)
+        raise
+
+    store_downloaded(state_cache, downloaded_attachments)
+
+    LOGGER.warning("Summary: application finished processing items")
+    LOGGER.info("Total Items Fetched: %s", item_count)
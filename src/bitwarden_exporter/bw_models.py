@@ -16,11 +16,13 @@ Classes:
     BwOrganization: Represents a Bitwarden organization.
     BwFolder: Represents a folder in Bitwarden.
 
+Functions:
+    decode_items: Validate the whole output of `bw list items` into BwItem models at once.
 """
 
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional, Union
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, TypeAdapter
 
 
 class BwItemLoginFido2Credentials(BaseModel):
@@ -115,6 +117,11 @@ class BwItemPasswordHistory(BaseModel):
 class BwItemAttachment(BaseModel):
     """
     Bitwarden Attachment Model.
+
+    Attributes:
+        local_file_path: Where a downloaded attachment was saved.
+        content: Attachment bytes generated by the exporter (e.g. SSH keys), used instead of local_file_path.
+            Never written to disk and excluded from dumps.
     """
 
     id: str
@@ -123,6 +130,7 @@ class BwItemAttachment(BaseModel):
     sizeName: str
     url: str
     local_file_path: str = ""
+    content: Optional[bytes] = Field(default=None, exclude=True, repr=False)
 
 
 class SSHKey(BaseModel):
@@ -254,3 +262,43 @@ class BwFolder(BaseModel):
     id: Optional[str] = None
     name: str
     items: Dict[str, BwItem] = Field(default_factory=dict)
+
+
+BW_ITEM_LIST_ADAPTER: TypeAdapter[List[BwItem]] = TypeAdapter(List[BwItem])
+
+
+def decode_items(payload: Union[str, bytes]) -> List[BwItem]:
+    """
+    Validate the JSON array printed by `bw list items` into BwItem models in a single call.
+
+    The payload is parsed and validated by pydantic-core directly, without building intermediate dicts and
+    without one BwItem(**dict) call per item.
+
+    Args:
+        payload: The JSON array, as text or bytes.
+
+    Returns:
+        List[BwItem]: The items, in the order of the payload.
+
+    Raises:
+        pydantic.ValidationError: If the payload is not a JSON array of valid items.
+    """
+    return BW_ITEM_LIST_ADAPTER.validate_json(payload)
+
+
+def decode_item_dicts(bw_items_dict: List[Dict[str, Any]]) -> List[BwItem]:
+    """
+    Validate items already parsed from the output of `bw list items` into BwItem models in a single call.
+
+    Used when the raw items are kept anyway, so the JSON is not parsed a second time by decode_items.
+
+    Args:
+        bw_items_dict: The parsed items.
+
+    Returns:
+        List[BwItem]: The items, in the order of the list.
+
+    Raises:
+        pydantic.ValidationError: If an item is not valid.
+    """
+    return BW_ITEM_LIST_ADAPTER.validate_python(bw_items_dict)
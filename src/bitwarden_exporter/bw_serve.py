@@ -0,0 +1,277 @@
+"""
+Persistent Bitwarden CLI backend using the Vault Management API of `bw serve`.
+
+Instead of starting a new `bw` process for every command, a single `bw serve` is started on a loopback port
+(or an already running one is attached to) and the commands used by the exporter are sent over pooled
+keep-alive HTTP connections.
+
+Classes:
+    BwServeClient: Translates bw CLI arguments into Vault Management API requests.
+
+Functions:
+    get_serve_client() -> BwServeClient: Shared client for the current process, started on first use.
+"""
+
+import atexit
+import http.client
+import json
+import logging
+import os
+import queue
+import shutil
+import socket
+import subprocess  # nosec B404
+import threading
+import time
+import urllib.parse
+from typing import Any, List, Optional, Tuple
+
+from . import BITWARDEN_EXPORTER_GLOBAL_SETTINGS
+from .exceptions import BitwardenException
+
+LOGGER = logging.getLogger(__name__)
+
+_SERVE_CLIENT: Optional["BwServeClient"] = None
+_SERVE_CLIENT_LOCK = threading.Lock()
+
+
+class BwServeClient:
+    """
+    Client for the Vault Management API exposed by `bw serve`.
+
+    exec() accepts the same argument lists as bw_cli.bw_run and returns stdout the CLI would have printed,
+    so callers do not need to know which backend is in use. Failures, including a server that cannot be reached,
+    are raised as the same subprocess exceptions as the CLI transport.
+    """
+
+    def __init__(self, base_url: Optional[str] = None, pool_size: int = 4, timeout: float = 10) -> None:
+        """
+        Initialize the client, nothing is started until start() is called.
+
+        Args:
+            base_url: URL of an already running `bw serve`, e.g. http://127.0.0.1:8087.
+                When None, a new `bw serve` is started on a free loopback port.
+            pool_size: Maximum number of idle keep-alive connections kept for reuse.
+            timeout: Socket timeout in seconds for each request.
+        """
+        self.__base_url = base_url
+        self.__timeout = timeout
+        self.__pool: "queue.LifoQueue[http.client.HTTPConnection]" = queue.LifoQueue(maxsize=pool_size)
+        self.__process: Optional["subprocess.Popen[bytes]"] = None
+        self.__host = ""
+        self.__port = 0
+
+    def start(self, startup_timeout: float = 30) -> None:
+        """
+        Start `bw serve` or attach to the configured URL, and wait until it answers.
+
+        Raises:
+            BitwardenException: If the server does not become ready in time.
+        """
+        if self.__base_url:
+            parsed_url = urllib.parse.urlparse(self.__base_url)
+            if parsed_url.scheme != "http" or not parsed_url.hostname:
+                raise BitwardenException("Only http:// URLs are supported for bw serve")
+            self.__host = parsed_url.hostname
+            self.__port = parsed_url.port or 80
+            LOGGER.warning("Bitwarden backend: application is attaching to a running 'bw serve'")
+            LOGGER.info("Attaching to bw serve at %s", self.__base_url)
+        else:
+            self.__host = "127.0.0.1"
+            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as free_socket:
+                free_socket.bind((self.__host, 0))
+                self.__port = free_socket.getsockname()[1]
+            cmd = [
+                BITWARDEN_EXPORTER_GLOBAL_SETTINGS.bw_executable,
+                "serve",
+                "--hostname",
+                self.__host,
+                "--port",
+                str(self.__port),
+            ]
+            LOGGER.warning("Bitwarden backend: application is starting 'bw serve' on a loopback port")
+            LOGGER.debug("Executing CLI :: %s", " ".join(cmd))
+            self.__process = subprocess.Popen(  # pylint: disable=consider-using-with
+                cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=os.environ.copy()
+            )  # nosec B603
+
+        deadline = time.monotonic() + startup_timeout
+        while True:
+            if self.__process is not None and self.__process.poll() is not None:
+                raise BitwardenException("bw serve exited during startup, enable debug logging for more information")
+            try:
+                self.__request("GET", "/status")
+                return
+            except (OSError, http.client.HTTPException, subprocess.SubprocessError) as e:
+                if time.monotonic() > deadline:
+                    LOGGER.info("bw serve not ready: %s", e)
+                    self.close()
+                    raise BitwardenException("Timeout waiting for bw serve, enable debug logging for more information")
+                time.sleep(0.2)
+
+    def close(self) -> None:
+        """
+        Close pooled connections and stop `bw serve` if it was started by this client.
+        """
+        while not self.__pool.empty():
+            self.__pool.get_nowait().close()
+        if self.__process is not None and self.__process.poll() is None:
+            self.__process.terminate()
+            try:
+                self.__process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.__process.kill()
+        self.__process = None
+
+    def exec(self, cmd: List[str], ret_encoding: str = "UTF-8") -> str:
+        """
+        Execute a bw command through the Vault Management API.
+
+        Supported commands: `status`, `list <object> [--organizationid <id>]` and
+        `get attachment <id> --itemid <item id> --output <path>`.
+
+        Args:
+            cmd: Arguments as they would be passed to the bw executable.
+            ret_encoding: The character encoding of the response body.
+
+        Returns:
+            str: JSON text in the same shape the CLI prints.
+
+        Raises:
+            subprocess.CalledProcessError: If the server answers with an error or cannot be reached.
+            subprocess.TimeoutExpired: If the server does not answer in time.
+            BitwardenException: If the command is not supported by this backend.
+        """
+        args = [arg for arg in cmd if arg != "--raw"]
+        if args == ["status"]:
+            return json.dumps(self.__request_json(cmd, "/status", ret_encoding)["template"])
+
+        if len(args) >= 2 and args[0] == "list":
+            query = {}
+            if "--organizationid" in args:
+                query["organizationid"] = args[args.index("--organizationid") + 1]
+            path = f"/list/object/{urllib.parse.quote(args[1])}"
+            if query:
+                path += "?" + urllib.parse.urlencode(query)
+            return json.dumps(self.__request_json(cmd, path, ret_encoding)["data"])
+
+        if len(args) == 7 and args[:2] == ["get", "attachment"] and args[3] == "--itemid" and args[5] == "--output":
+            path = f"/object/attachment/{urllib.parse.quote(args[2])}?" + urllib.parse.urlencode({"itemid": args[4]})
+            status, body = self.__request("GET", path)
+            if status != 200:
+                raise subprocess.CalledProcessError(1, cmd, stderr=body.decode(ret_encoding, errors="replace"))
+            with open(args[6], "wb") as attachment_file:
+                attachment_file.write(body)
+            return ""
+
+        LOGGER.info("Command not supported by bw serve backend: %s", " ".join(args))
+        raise BitwardenException("Command not supported by bw serve backend, enable debug logging for more information")
+
+    def open_attachment(
+        self, item_id: str, attachment_id: str
+    ) -> Tuple[http.client.HTTPConnection, http.client.HTTPResponse]:
+        """
+        Request an attachment on a new connection and return the response unread, to stream its body.
+
+        The caller reads the response and closes the connection, which is not returned to the pool. Reads time out
+        like every other request.
+
+        Raises:
+            subprocess.CalledProcessError: If the server answers with an error or cannot be reached.
+            subprocess.TimeoutExpired: If the server does not answer in time.
+        """
+        path = f"/object/attachment/{urllib.parse.quote(attachment_id)}?" + urllib.parse.urlencode({"itemid": item_id})
+        connection = http.client.HTTPConnection(self.__host, self.__port, timeout=self.__timeout)
+        try:
+            connection.request("GET", path)
+            response = connection.getresponse()
+        except socket.timeout:
+            connection.close()
+            raise subprocess.TimeoutExpired(["GET", path], self.__timeout)
+        except (OSError, http.client.HTTPException) as e:
+            connection.close()
+            raise subprocess.CalledProcessError(1, ["GET", path], stderr=str(e))
+        if response.status != 200:
+            body = response.read()
+            connection.close()
+            raise subprocess.CalledProcessError(1, ["GET", path], stderr=body.decode("utf-8", errors="replace"))
+        return connection, response
+
+    def __request_json(self, cmd: List[str], path: str, ret_encoding: str) -> Any:
+        status, body = self.__request("GET", path)
+        try:
+            response = json.loads(body.decode(ret_encoding))
+        except ValueError:
+            response = {}
+        if status != 200 or not response.get("success"):
+            raise subprocess.CalledProcessError(1, cmd, stderr=response.get("message", f"HTTP {status}"))
+        return response["data"]
+
+    def __request(self, method: str, path: str) -> Tuple[int, bytes]:
+        """
+        Send a request on a pooled connection, retrying once on a new connection when a kept-alive one went stale.
+
+        Raises:
+            subprocess.CalledProcessError: If the server cannot be reached, with the method and path as the command.
+            subprocess.TimeoutExpired: If the server does not answer in time.
+        """
+        try:
+            try:
+                return self.__send(method, path, fresh=False)
+            except ConnectionError as e:
+                LOGGER.debug("Retrying request on a new connection: %s", e)
+                return self.__send(method, path, fresh=True)
+        except (OSError, http.client.HTTPException) as e:
+            raise subprocess.CalledProcessError(1, [method, path], stderr=str(e))
+
+    def __send(self, method: str, path: str, fresh: bool) -> Tuple[int, bytes]:
+        connection: Optional[http.client.HTTPConnection] = None
+        if not fresh:
+            try:
+                connection = self.__pool.get_nowait()
+            except queue.Empty:
+                pass
+        if connection is None:
+            connection = http.client.HTTPConnection(self.__host, self.__port, timeout=self.__timeout)
+        try:
+            connection.request(method, path, headers={"Connection": "keep-alive"})
+            response = connection.getresponse()
+            body = response.read()
+        except socket.timeout:
+            connection.close()
+            raise subprocess.TimeoutExpired([method, path], self.__timeout)
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            raise
+
+        if response.will_close:
+            connection.close()
+        else:
+            try:
+                self.__pool.put_nowait(connection)
+            except queue.Full:
+                connection.close()
+        return response.status, body
+
+
+def get_serve_client() -> BwServeClient:
+    """
+    Return the shared BwServeClient, starting it on first use.
+
+    The client is closed, and a `bw serve` started by it is stopped, when the interpreter exits.
+    """
+    global _SERVE_CLIENT  # pylint: disable=global-statement
+    with _SERVE_CLIENT_LOCK:
+        if _SERVE_CLIENT is None:
+            if not BITWARDEN_EXPORTER_GLOBAL_SETTINGS.bw_serve_url and not shutil.which(
+                BITWARDEN_EXPORTER_GLOBAL_SETTINGS.bw_executable
+            ):
+                raise BitwardenException("Bitwarden CLI executable not found, required to start bw serve")
+            client = BwServeClient(
+                base_url=BITWARDEN_EXPORTER_GLOBAL_SETTINGS.bw_serve_url,
+                pool_size=BITWARDEN_EXPORTER_GLOBAL_SETTINGS.download_workers,
+            )
+            client.start()
+            atexit.register(client.close)
+            _SERVE_CLIENT = client
+        return _SERVE_CLIENT
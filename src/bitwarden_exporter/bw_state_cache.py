@@ -0,0 +1,183 @@
+"""
+Encrypted state cache for incremental exports.
+
+The cache remembers, for every exported item, its revisionDate and the attachments that were downloaded for it,
+together with an encrypted copy of each attachment. When an item did not change since the previous run, its
+attachments are restored from the cache instead of being downloaded again.
+
+The cache lives in its own directory and is never removed together with the temporary directory.
+
+Layout of the cache directory:
+    salt: Random salt used to derive the encryption key from the cache password.
+    state.enc: Encrypted JSON state, keyed by item ID.
+    blobs/<digest>.enc: Encrypted attachment contents.
+
+Classes:
+    ExportStateCache: Load, query, update, and save the cache.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import secrets
+from typing import Any, Dict
+
+from Cryptodome.Cipher import AES
+
+from .bw_models import BwItem, BwItemAttachment
+from .exceptions import BitwardenException
+
+LOGGER = logging.getLogger(__name__)
+
+CACHE_FORMAT_VERSION = 1
+
+
+class ExportStateCache:
+    """
+    Encrypted, revisionDate keyed cache of attachment blobs kept between export runs.
+
+    Files are encrypted with AES-256-GCM using a key derived from the cache password with scrypt. The
+    name of each file is used as associated data, so blobs cannot be swapped between attachments.
+    """
+
+    def __init__(self, cache_dir: str, cache_password: str) -> None:
+        """
+        Open the cache, creating it if the directory is empty.
+
+        Args:
+            cache_dir: Directory holding the cache, created if missing.
+            cache_password: Password used to derive the encryption key.
+
+        Raises:
+            BitwardenException: If the existing cache cannot be decrypted with the given password.
+        """
+        self.__cache_dir = os.path.abspath(cache_dir)
+        self.__blobs_dir = os.path.join(self.__cache_dir, "blobs")
+        os.makedirs(self.__blobs_dir, mode=0o700, exist_ok=True)
+
+        salt_path = os.path.join(self.__cache_dir, "salt")
+        if not os.path.exists(salt_path):
+            with open(salt_path, "wb") as salt_file:
+                salt_file.write(secrets.token_bytes(16))
+        with open(salt_path, "rb") as salt_file:
+            salt = salt_file.read()
+
+        self.__key = hashlib.scrypt(
+            cache_password.encode("utf-8"), salt=salt, n=2**15, r=8, p=1, maxmem=64 * 1024 * 1024, dklen=32
+        )
+
+        self.__previous_state: Dict[str, Any] = {}
+        self.__next_state: Dict[str, Any] = {}
+        state_path = os.path.join(self.__cache_dir, "state.enc")
+        if os.path.exists(state_path):
+            try:
+                state = json.loads(self.__decrypt_file(state_path, "state.enc"))
+            except ValueError:
+                LOGGER.info("Unable to decrypt cache state %s", state_path)
+                raise BitwardenException("Unable to decrypt export cache, check the cache password")
+            if state.get("version") != CACHE_FORMAT_VERSION:
+                LOGGER.warning("Export cache: application found an incompatible cache and will rebuild it")
+            else:
+                self.__previous_state = state["items"]
+        LOGGER.warning("Export cache: application loaded the incremental export cache")
+        LOGGER.info("Cache %s has %s items", self.__cache_dir, len(self.__previous_state))
+
+    def restore_attachment(self, bw_item: BwItem, attachment: BwItemAttachment) -> bool:
+        """
+        Restore an attachment from the cache into attachment.local_file_path if the item is unchanged.
+
+        Args:
+            bw_item: The item owning the attachment.
+            attachment: The attachment, with local_file_path already set.
+
+        Returns:
+            bool: True if the attachment was restored and does not need to be downloaded.
+        """
+        cached_item = self.__previous_state.get(bw_item.id)
+        if not cached_item or cached_item["revisionDate"] != bw_item.revisionDate:
+            return False
+        if cached_item["attachments"].get(attachment.id) != attachment.size:
+            return False
+
+        blob_name = self.__blob_name(bw_item.id, attachment.id)
+        blob_path = os.path.join(self.__blobs_dir, blob_name)
+        if not os.path.exists(blob_path):
+            return False
+
+        try:
+            data = self.__decrypt_file(blob_path, blob_name)
+        except ValueError:
+            LOGGER.info("Unable to decrypt cached attachment %s, downloading again", attachment.id)
+            return False
+        if attachment.size.isdigit() and int(attachment.size) != len(data):
+            LOGGER.info("Cached attachment %s has an unexpected size, downloading again", attachment.id)
+            return False
+
+        os.makedirs(os.path.dirname(attachment.local_file_path), exist_ok=True)
+        with open(attachment.local_file_path, "wb") as attachment_file:
+            attachment_file.write(data)
+        self.__remember(bw_item, attachment)
+        return True
+
+    def store_attachment(self, bw_item: BwItem, attachment: BwItemAttachment) -> None:
+        """
+        Encrypt a downloaded attachment into the cache.
+
+        Args:
+            bw_item: The item owning the attachment.
+            attachment: The attachment, downloaded to attachment.local_file_path.
+        """
+        blob_name = self.__blob_name(bw_item.id, attachment.id)
+        with open(attachment.local_file_path, "rb") as attachment_file:
+            self.__encrypt_file(os.path.join(self.__blobs_dir, blob_name), blob_name, attachment_file.read())
+        self.__remember(bw_item, attachment)
+
+    def save(self) -> None:
+        """
+        Write the state of this run and remove blobs of items or attachments that no longer exist.
+        """
+        self.__encrypt_file(
+            os.path.join(self.__cache_dir, "state.enc"),
+            "state.enc",
+            json.dumps({"version": CACHE_FORMAT_VERSION, "items": self.__next_state}).encode("utf-8"),
+        )
+        kept_blobs = {
+            self.__blob_name(item_id, attachment_id)
+            for item_id, cached_item in self.__next_state.items()
+            for attachment_id in cached_item["attachments"]
+        }
+        for blob_name in os.listdir(self.__blobs_dir):
+            if blob_name not in kept_blobs:
+                os.remove(os.path.join(self.__blobs_dir, blob_name))
+        LOGGER.warning("Export cache: application saved the incremental export cache")
+        LOGGER.info("Cache %s has %s items", self.__cache_dir, len(self.__next_state))
+
+    def __remember(self, bw_item: BwItem, attachment: BwItemAttachment) -> None:
+        cached_item = self.__next_state.setdefault(
+            bw_item.id, {"revisionDate": bw_item.revisionDate, "attachments": {}}
+        )
+        cached_item["attachments"][attachment.id] = attachment.size
+
+    @staticmethod
+    def __blob_name(item_id: str, attachment_id: str) -> str:
+        return hashlib.sha256(f"{item_id}/{attachment_id}".encode("utf-8")).hexdigest() + ".enc"
+
+    def __encrypt_file(self, path: str, name: str, data: bytes) -> None:
+        cipher = AES.new(self.__key, AES.MODE_GCM)
+        cipher.update(name.encode("utf-8"))
+        ciphertext, tag = cipher.encrypt_and_digest(data)
+        with open(f"{path}.tmp", "wb") as cache_file:
+            cache_file.write(bytes(cipher.nonce) + tag + ciphertext)
+        os.replace(f"{path}.tmp", path)
+
+    def __decrypt_file(self, path: str, name: str) -> bytes:
+        """
+        Raises:
+            ValueError: If the file was tampered with or encrypted with another key.
+        """
+        with open(path, "rb") as cache_file:
+            content = cache_file.read()
+        cipher = AES.new(self.__key, AES.MODE_GCM, nonce=content[:16])
+        cipher.update(name.encode("utf-8"))
+        return bytes(cipher.decrypt_and_verify(content[32:], content[16:32]))
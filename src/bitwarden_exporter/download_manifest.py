@@ -0,0 +1,133 @@
+"""
+Download manifest of resumable exports.
+
+With resume enabled, every attachment that finished downloading into the temporary directory is recorded, with
+its size and SHA-256, in a manifest kept in that directory. A new run with the same temporary directory skips
+the attachments whose file still matches the manifest and downloads the others again.
+
+The manifest is a JSON Lines file: a header line, then one line per finished download. Lines are appended and
+synced to disk as downloads finish, so an interrupted run loses at most the line being written; an incomplete
+last line is ignored.
+
+Classes:
+    DownloadManifest: Load, query, and append to the manifest.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Dict, Tuple
+
+LOGGER = logging.getLogger(__name__)
+
+MANIFEST_FILE_NAME = "download-manifest.jsonl"
+
+MANIFEST_FORMAT_VERSION = 1
+
+
+def file_sha256(path: str) -> str:
+    """
+    SHA-256 of a file, read in chunks.
+
+    Returns:
+        str: The hex digest.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as hashed_file:
+        while chunk := hashed_file.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DownloadManifest:
+    """
+    Size and SHA-256 of the attachments downloaded into a temporary directory, kept between export runs.
+
+    Safe to use from several download threads.
+    """
+
+    def __init__(self, tmp_dir: str) -> None:
+        """
+        Load the manifest of the directory, or start a new one.
+
+        Args:
+            tmp_dir: The temporary directory the attachments are downloaded to, created if missing.
+        """
+        os.makedirs(tmp_dir, mode=0o700, exist_ok=True)
+        self.__path = os.path.join(tmp_dir, MANIFEST_FILE_NAME)
+        self.__lock = threading.Lock()
+        self.__entries: Dict[Tuple[str, str], Tuple[int, str]] = {}
+
+        if os.path.exists(self.__path):
+            self.__load()
+        # Rewrite the loaded entries, so the lines of this run are not appended to an incomplete last line.
+        with open(f"{self.__path}.tmp", "w", encoding="utf-8") as manifest_file:
+            manifest_file.write(json.dumps({"version": MANIFEST_FORMAT_VERSION}) + "\n")
+            for (item_id, attachment_id), (size, sha256) in self.__entries.items():
+                manifest_file.write(self.__line(item_id, attachment_id, size, sha256))
+        os.replace(f"{self.__path}.tmp", self.__path)
+        LOGGER.warning("Resume: application loaded the download manifest of the temporary directory")
+        LOGGER.info("Manifest %s has %s attachments", self.__path, len(self.__entries))
+
+    def is_complete(self, item_id: str, attachment_id: str, path: str) -> bool:
+        """
+        Check whether an attachment was downloaded by a previous run and its file is unchanged.
+
+        Args:
+            item_id: The Bitwarden item identifier.
+            attachment_id: The attachment identifier within the item.
+            path: Where the attachment is downloaded to.
+
+        Returns:
+            bool: True if the file matches the size and SHA-256 in the manifest and need not be downloaded.
+        """
+        with self.__lock:
+            entry = self.__entries.get((item_id, attachment_id))
+        if entry is None or not os.path.exists(path):
+            return False
+        size, sha256 = entry
+        if os.path.getsize(path) != size or file_sha256(path) != sha256:
+            LOGGER.info("Attachment %s does not match the download manifest, downloading again", attachment_id)
+            return False
+        return True
+
+    def record(self, item_id: str, attachment_id: str, path: str) -> None:
+        """
+        Record a finished download and sync the manifest to disk.
+
+        Args:
+            item_id: The Bitwarden item identifier.
+            attachment_id: The attachment identifier within the item.
+            path: The downloaded file, at its final location.
+        """
+        size, sha256 = os.path.getsize(path), file_sha256(path)
+        with self.__lock:
+            with open(self.__path, "a", encoding="utf-8") as manifest_file:
+                manifest_file.write(self.__line(item_id, attachment_id, size, sha256))
+                manifest_file.flush()
+                os.fsync(manifest_file.fileno())
+            self.__entries[(item_id, attachment_id)] = (size, sha256)
+
+    @staticmethod
+    def __line(item_id: str, attachment_id: str, size: int, sha256: str) -> str:
+        return json.dumps({"itemId": item_id, "attachmentId": attachment_id, "size": size, "sha256": sha256}) + "\n"
+
+    def __load(self) -> None:
+        with open(self.__path, encoding="utf-8") as manifest_file:
+            lines = manifest_file.read().split("\n")
+        try:
+            header = json.loads(lines[0])
+        except ValueError:
+            header = {}
+        if header.get("version") != MANIFEST_FORMAT_VERSION:
+            LOGGER.warning("Resume: application found an incompatible download manifest and will start over")
+            return
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # The last line of an interrupted run, or the empty string after the final newline.
+                continue
+            self.__entries[(entry["itemId"], entry["attachmentId"])] = (entry["size"], entry["sha256"])
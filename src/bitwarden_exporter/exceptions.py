@@ -12,4 +12,4 @@ class BitwardenException(Exception):
 
     def __init__(self, *args: object, **kwargs: object) -> None:
         super().__init__(args, kwargs)
-        remove_downloaded()
+        remove_downloaded(failed=True)
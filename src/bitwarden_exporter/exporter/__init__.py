@@ -1,3 +1,47 @@
 """
 Exporter
+
+Holds what the command line needs to declare the exporter options, so that the exporters and their
+dependencies are only imported when an export runs.
 """
+
+from enum import Enum
+
+KDBX_EXPORT_PASSWORD_HELP = r"""
+Direct value: --kdbx-password "my-secret-password".
+From a file: --kdbx-password file:secret.txt.
+From environment: --kdbx-password env:SECRET_PASSWORD.
+From vault (JMESPath expression): --kdbx-password "jmespath:[?id=='xx-xx-xx-xxx-xxx'].fields[] | [?name=='export-password'].value".
+
+"""  # nosec B105
+
+
+class AttachmentMemoryPolicy(str, Enum):
+    """
+    What to do when the attachments held in memory exceed the configured limit.
+
+    Attributes:
+        WARN: Log a warning once and continue.
+        REFUSE: Stop the export with an error.
+    """
+
+    WARN = "warn"
+    REFUSE = "refuse"
+
+
+JSONL_EXPORT_PASSWORD_HELP = KDBX_EXPORT_PASSWORD_HELP.replace("--kdbx-password", "--jsonl-password")
+
+ARCHIVE_EXPORT_PASSWORD_HELP = KDBX_EXPORT_PASSWORD_HELP.replace("--kdbx-password", "--archive-password")
+
+
+class JsonlAttachmentMode(str, Enum):
+    """
+    How the JSONL exporter writes attachments.
+
+    Attributes:
+        INLINE: Download every attachment and write its content, base64 encoded, in chunk records.
+        REFERENCE: Do not download attachments, only record their Bitwarden ID, name, size, and URL.
+    """
+
+    INLINE = "inline"
+    REFERENCE = "reference"
@@ -0,0 +1,409 @@
+"""
+Export the vault to an encrypted zip archive, streamed without a temporary directory.
+
+Attachments are read straight from the output of `bw get attachment` into the archive, in chunks, so nothing is
+written to disk except the archive itself, and neither a whole attachment nor the whole vault is held in memory.
+The archive can also be written to stdout, to pipe it into another program.
+
+Archive members:
+    folders.json, organizations.json, collections.json: The Bitwarden objects, without items or collections.
+    items/<item id>.json: One Bitwarden item, with its attachments as listed by Bitwarden.
+    attachments/<item id>/<attachment id>: The content of an attachment; its name is in the item.
+    manifest.json: The last member, with the number of members of every kind and the attachment bytes.
+
+Encrypted file layout:
+    header: One line of plain JSON with the format version and the key derivation parameters.
+    frames: Up to FRAME_SIZE bytes of the zip archive each, as the 4 byte big-endian length of the ciphertext,
+        the nonce, the GCM tag, and the ciphertext, encrypted with AES-256-GCM and a key derived from the password
+        with scrypt. The associated data of a frame is the SHA-256 of the header line, the frame number, and
+        whether it is the last frame, so frames cannot be reordered or dropped, and a truncated file is detected.
+
+Use decrypt_archive to get the zip archive back.
+"""
+
+import hashlib
+import io
+import json
+import logging
+import os
+import secrets
+import subprocess  # nosec B404
+import sys
+import time
+import zipfile
+from collections import deque
+from types import TracebackType
+from typing import IO, Any, Deque, Dict, Iterator, List, Optional, Tuple, Type, Union
+
+from Cryptodome.Cipher import AES
+
+from .. import BITWARDEN_EXPORTER_GLOBAL_SETTINGS
+from ..bw_cli import AttachmentStream
+from ..bw_list_process import process_list_pipelined
+from ..bw_models import BwFolder, BwItem, BwItemAttachment, BwOrganization
+from ..exceptions import BitwardenException
+from ..log_handlers import log_stage
+from ..utils import resolve_secret
+from .jsonl_exporter import SCRYPT_N, SCRYPT_P, SCRYPT_R, derive_export_key
+
+LOGGER = logging.getLogger(__name__)
+
+ARCHIVE_FORMAT = "bitwarden-exporter-archive"
+
+ARCHIVE_FORMAT_VERSION = 1
+
+FRAME_SIZE = 1024 * 1024
+
+READ_SIZE = 64 * 1024
+
+DOWNLOAD_ATTEMPTS = 3
+
+
+def frame_associated_data(header_digest: bytes, frame_number: int, last: bool) -> bytes:
+    """
+    Associated data of a frame: binds it to its file, its position, and whether it ends the file.
+    """
+    return header_digest + frame_number.to_bytes(8, "big") + (b"\x01" if last else b"\x00")
+
+
+class EncryptedStreamWriter(io.RawIOBase):
+    """
+    Write-only, unseekable file object that encrypts what is written to it in frames.
+
+    The last frame is written by close(). After abort(), close() leaves it out, so the output is recognized as
+    incomplete. The output itself is flushed, not closed.
+    """
+
+    def __init__(self, output: IO[bytes], password: str) -> None:
+        """
+        Derive the key and write the header.
+
+        Args:
+            output: Destination of the encrypted stream.
+            password: Resolved password of the archive.
+        """
+        super().__init__()
+        salt = secrets.token_bytes(16)
+        header = {
+            "format": ARCHIVE_FORMAT,
+            "version": ARCHIVE_FORMAT_VERSION,
+            "cipher": "AES-256-GCM",
+            "kdf": {"name": "scrypt", "n": SCRYPT_N, "r": SCRYPT_R, "p": SCRYPT_P, "salt": salt.hex()},
+        }
+        header_line = json.dumps(header, separators=(",", ":")).encode("utf-8")
+        self.__output = output
+        self.__key = derive_export_key(password, salt)
+        self.__header_digest = hashlib.sha256(header_line).digest()
+        self.__buffer = bytearray()
+        self.__frames = 0
+        self.__aborted = False
+        self.__output.write(header_line + b"\n")
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: Any) -> int:
+        self.__buffer += data
+        while len(self.__buffer) >= FRAME_SIZE:
+            self.__write_frame(bytes(self.__buffer[:FRAME_SIZE]), last=False)
+            del self.__buffer[:FRAME_SIZE]
+        return len(data)
+
+    def abort(self) -> None:
+        """
+        Leave the last frame out when the stream is closed.
+        """
+        self.__aborted = True
+
+    def close(self) -> None:
+        if not self.closed:
+            if not self.__aborted:
+                self.__write_frame(bytes(self.__buffer), last=True)
+            self.__buffer = bytearray()
+            self.__output.flush()
+        super().close()
+
+    def __write_frame(self, plaintext: bytes, last: bool) -> None:
+        cipher = AES.new(self.__key, AES.MODE_GCM)
+        cipher.update(frame_associated_data(self.__header_digest, self.__frames, last))
+        ciphertext, tag = cipher.encrypt_and_digest(plaintext)
+        self.__output.write(len(ciphertext).to_bytes(4, "big") + bytes(cipher.nonce) + tag + ciphertext)
+        self.__frames += 1
+
+
+def decrypt_archive(encrypted: IO[bytes], output: IO[bytes], password: str) -> None:
+    """
+    Decrypt an archive written by create_archive_export_cli into the zip archive.
+
+    Frames are written to output as they are verified; when this raises, discard what was written.
+
+    Args:
+        encrypted: The encrypted archive.
+        output: Receives the zip archive.
+        password: Resolved password of the archive.
+
+    Raises:
+        BitwardenException: If the file is not an encrypted archive, the password is wrong, a frame was tampered
+            with, or the archive is incomplete.
+    """
+    header_line = encrypted.readline().rstrip(b"\n")
+    try:
+        header = json.loads(header_line)
+    except ValueError:
+        raise BitwardenException("Not an encrypted archive")
+    if header.get("format") != ARCHIVE_FORMAT or header.get("version") != ARCHIVE_FORMAT_VERSION:
+        raise BitwardenException("Not a supported encrypted archive")
+    kdf = header["kdf"]
+    key = derive_export_key(password, bytes.fromhex(kdf["salt"]), kdf["n"], kdf["r"], kdf["p"])
+    header_digest = hashlib.sha256(header_line).digest()
+
+    frame_number = 0
+    while length_bytes := encrypted.read(4):
+        content = encrypted.read(32 + int.from_bytes(length_bytes, "big"))
+        for last in (False, True):
+            cipher = AES.new(key, AES.MODE_GCM, nonce=content[:16])
+            cipher.update(frame_associated_data(header_digest, frame_number, last))
+            try:
+                output.write(cipher.decrypt_and_verify(content[32:], content[16:32]))
+            except ValueError:
+                continue
+            if last:
+                if encrypted.read(1):
+                    raise BitwardenException("The encrypted archive has data after its last frame")
+                return
+            break
+        else:
+            LOGGER.info("Unable to decrypt frame %s", frame_number)
+            if frame_number == 0:
+                raise BitwardenException("Unable to decrypt the archive, check the password")
+            raise BitwardenException("A frame of the encrypted archive was modified, reordered, or removed")
+        frame_number += 1
+    raise BitwardenException("The encrypted archive has no last frame, it is incomplete")
+
+
+def start_attachment_stream(bw_item: BwItem, attachment: BwItemAttachment) -> Union[AttachmentStream, Exception]:
+    """
+    Start downloading an attachment; a failure to start is returned, to be retried when the attachment is written.
+    """
+    try:
+        return AttachmentStream(bw_item.id, attachment.id)
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+        return e
+
+
+PendingItem = Tuple[BwItem, List[Optional[Union[AttachmentStream, Exception]]]]
+
+
+class ArchiveWriter:
+    """
+    Context manager writing the members of an encrypted archive, see the module documentation for the layout.
+    """
+
+    def __init__(self, output: IO[bytes], password: str) -> None:
+        """
+        Args:
+            output: Destination of the encrypted archive, flushed but not closed.
+            password: Resolved password of the archive.
+        """
+        self.__stream = EncryptedStreamWriter(output, password)
+        # pylint: disable-next=consider-using-with
+        self.__zip = zipfile.ZipFile(self.__stream, "w", compression=zipfile.ZIP_DEFLATED)
+        self.__counts: Dict[str, int] = {}
+        self.__attachment_bytes = 0
+
+    def __enter__(self) -> "ArchiveWriter":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        """
+        Write the manifest and close the archive; after an error, leave the archive incomplete.
+        """
+        if exc_type is not None:
+            self.__stream.abort()
+            self.__stream.close()
+            return
+        self.write_json(
+            "manifest.json",
+            {
+                "format": ARCHIVE_FORMAT,
+                "version": ARCHIVE_FORMAT_VERSION,
+                "counts": self.__counts,
+                "attachmentBytes": self.__attachment_bytes,
+            },
+        )
+        self.__zip.close()
+        self.__stream.close()
+        LOGGER.warning("Finalization: application wrote the encrypted archive")
+        LOGGER.info("Archive holds %s, %s attachment bytes", self.__counts, self.__attachment_bytes)
+
+    def write_json(self, name: str, content: Any) -> None:
+        """
+        Add a JSON member.
+        """
+        self.__zip.writestr(name, json.dumps(content, separators=(",", ":")))
+        kind = name.split("/")[0].removesuffix(".json")
+        self.__counts[kind] = self.__counts.get(kind, 0) + 1
+
+    def write_groups(self, organizations: Dict[str, BwOrganization], folders: Dict[str, BwFolder]) -> None:
+        """
+        Add the folders, organizations, and collections, without their items.
+        """
+        self.write_json("folders.json", [folder.model_dump(exclude={"items"}) for folder in folders.values()])
+        self.write_json(
+            "organizations.json",
+            [organization.model_dump(exclude={"collections"}) for organization in organizations.values()],
+        )
+        self.write_json(
+            "collections.json",
+            [
+                collection.model_dump(exclude={"items"})
+                for organization in organizations.values()
+                for collection in organization.collections.values()
+            ],
+        )
+
+    def write_items(self, bw_items: Iterator[BwItem], workers: int) -> None:
+        """
+        Add every item followed by its attachments, downloading the attachments of the next items meanwhile.
+
+        The downloads of up to `workers` attachments are started ahead of the one being written; each waits once
+        its pipe is full, so at most a pipe buffer per download is held.
+        """
+        pending: Deque[PendingItem] = deque()
+        started = 0
+        try:
+            for bw_item in bw_items:
+                streams: List[Optional[Union[AttachmentStream, Exception]]] = [
+                    None if attachment.content is not None else start_attachment_stream(bw_item, attachment)
+                    for attachment in bw_item.attachments
+                ]
+                pending.append((bw_item, streams))
+                started += sum(stream is not None for stream in streams)
+                while pending and (started > workers or not any(pending[0][1])):
+                    started -= self.__write_pending(pending.popleft())
+            while pending:
+                started -= self.__write_pending(pending.popleft())
+        finally:
+            for _, streams in pending:
+                for stream in streams:
+                    if isinstance(stream, AttachmentStream):
+                        stream.close(check=False)
+
+    def __write_pending(self, pending_item: PendingItem) -> int:
+        """
+        Returns:
+            int: The number of downloads of the item.
+        """
+        bw_item, streams = pending_item
+        self.write_json(
+            f"items/{bw_item.id}.json", bw_item.model_dump(exclude={"attachments": {"__all__": {"local_file_path"}}})
+        )
+        for index, attachment in enumerate(bw_item.attachments):
+            with self.__zip.open(f"attachments/{bw_item.id}/{attachment.id}", "w") as member:
+                if attachment.content is not None:
+                    member.write(attachment.content)
+                    self.__attachment_bytes += len(attachment.content)
+                else:
+                    self.__attachment_bytes += self.__copy_attachment(bw_item, attachment, streams, index, member)
+            self.__counts["attachments"] = self.__counts.get("attachments", 0) + 1
+        return sum(stream is not None for stream in streams)
+
+    @staticmethod
+    def __copy_attachment(
+        bw_item: BwItem,
+        attachment: BwItemAttachment,
+        streams: List[Optional[Union[AttachmentStream, Exception]]],
+        index: int,
+        member: IO[bytes],
+    ) -> int:
+        """
+        Copy a download into the archive, retrying a download that failed before it sent anything.
+
+        Returns:
+            int: The number of bytes copied.
+
+        Raises:
+            BitwardenException: If the attachment could not be downloaded.
+        """
+        for attempt in range(1, DOWNLOAD_ATTEMPTS + 1):
+            copied = 0
+            try:
+                stream = streams[index]
+                if not isinstance(stream, AttachmentStream):
+                    raise stream or BitwardenException("Attachment download was not started")
+                with stream:
+                    while chunk := stream.read(READ_SIZE):
+                        member.write(chunk)
+                        copied += len(chunk)
+                return copied
+            except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+                if copied or attempt == DOWNLOAD_ATTEMPTS:
+                    LOGGER.info("Failed to download attachment %s of item %s: %s", attachment.id, bw_item.id, e)
+                    raise BitwardenException(
+                        "Failed to download an attachment, enable debug logging for more information"
+                    )
+                LOGGER.warning("Attachment download failed, application will retry")
+                LOGGER.info("Retrying download of attachment %s, attempt %s: %s", attachment.id, attempt, e)
+                time.sleep(2 ** (attempt - 1))
+                streams[index] = start_attachment_stream(bw_item, attachment)
+        return 0
+
+
+def open_archive_output(archive_file: str) -> IO[bytes]:
+    """
+    Open the destination of the archive; "-" is stdout, and everything else printed goes to stderr from then on.
+
+    Raises:
+        BitwardenException: If a file already exists at archive_file.
+    """
+    if archive_file == "-":
+        sys.stdout.flush()
+        output = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+        os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+        LOGGER.warning("Initialization: application is writing a new encrypted archive to stdout")
+        return output
+    archive_path = os.path.abspath(archive_file)
+    if os.path.exists(archive_path):
+        raise BitwardenException(f"Archive already exists at {archive_path}")
+    LOGGER.warning("Initialization: application is creating a new encrypted archive")
+    LOGGER.info("Creating archive: %s", archive_path)
+    os.makedirs(os.path.dirname(archive_path), exist_ok=True)
+    return os.fdopen(os.open(archive_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), "wb")
+
+
+def create_archive_export_cli(archive_password: str, archive_file: str) -> None:
+    """
+    Export the vault to an encrypted zip archive, without a temporary directory.
+
+    Items are written as they are processed, see process_list_pipelined, and the attachments of each item right
+    after it. A JMESPath password needs the whole vault before the archive starts; the items are then held in
+    memory first, the attachments are still streamed.
+
+    Args:
+        archive_password: Password of the archive, with the same prefixes as the KeePass password.
+        archive_file: Destination path of the archive, "-" for stdout.
+    """
+    jmespath_password = archive_password.startswith("jmespath:")
+    if not jmespath_password:
+        archive_password = resolve_secret(archive_password, None)
+
+    with (
+        log_stage("archive_export"),
+        open_archive_output(archive_file) as output,
+        process_list_pipelined(keep_items=jmespath_password, download_attachments=False) as (
+            bw_processed_items,
+            bw_items,
+        ),
+    ):
+        if jmespath_password:
+            LOGGER.warning("A JMESPath archive password needs the whole vault first, application is holding the items")
+            bw_items = iter(list(bw_items))
+            archive_password = resolve_secret(archive_password, bw_processed_items.raw_items.items)
+        with ArchiveWriter(output, archive_password) as archive:
+            archive.write_groups(bw_processed_items.organizations, bw_processed_items.folders)
+            archive.write_items(bw_items, BITWARDEN_EXPORTER_GLOBAL_SETTINGS.download_workers)
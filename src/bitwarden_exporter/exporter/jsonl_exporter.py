@@ -0,0 +1,360 @@
+"""
+Export the vault to an encrypted JSON Lines file, one record at a time.
+
+The KeePass exporter holds the whole database and every attachment in memory until it is saved. This exporter
+encrypts and writes every record as soon as it is ready, and lets go of each item once it is written, so memory
+stays flat regardless of the vault size; with --stream-items the output of `bw list items` is not held either.
+
+File layout, one line each:
+    header: Plain JSON with the format version and the key derivation parameters.
+    records: Base64 of the nonce, GCM tag, and ciphertext of one JSON record, encrypted with AES-256-GCM and a
+        key derived from the password with scrypt. The associated data of a record is the SHA-256 of the header
+        line followed by the record number, so records cannot be reordered, dropped, or moved between files.
+    trailer: The last record, with the number of records of every type and the SHA-256 of all records before it.
+
+Records, told apart by their "record" key (Bitwarden objects keep their own "type"):
+    folder, organization, collection: The Bitwarden object, without its items or collections.
+    item: The Bitwarden item, with its attachments as listed by Bitwarden.
+    attachment_chunk: Up to ATTACHMENT_CHUNK_SIZE bytes of an attachment, base64 encoded, in order.
+    attachment: Follows the chunks of an attachment, with the number of chunks and the SHA-256 of the content.
+        In reference mode there are no chunks, and the attachment is only described.
+    trailer: See above.
+"""
+
+import base64
+import hashlib
+import json
+import logging
+import os
+import secrets
+from types import TracebackType
+from typing import Any, Dict, Iterator, Optional, Set, Type
+
+from Cryptodome.Cipher import AES
+
+from .. import BITWARDEN_EXPORTER_GLOBAL_SETTINGS
+from ..bw_list_process import iter_items, process_list, process_list_pipelined
+from ..bw_models import BwFolder, BwItem, BwItemAttachment, BwOrganization
+from ..exceptions import BitwardenException
+from ..log_handlers import log_stage
+from ..remove_downloads import remove_downloaded
+from ..utils import resolve_secret
+from . import JsonlAttachmentMode
+
+LOGGER = logging.getLogger(__name__)
+
+JSONL_FORMAT = "bitwarden-exporter-jsonl"
+
+JSONL_FORMAT_VERSION = 1
+
+ATTACHMENT_CHUNK_SIZE = 1024 * 1024
+
+SCRYPT_N = 2**15
+
+SCRYPT_R = 8
+
+SCRYPT_P = 1
+
+
+def derive_export_key(password: str, salt: bytes, n: int = SCRYPT_N, r: int = SCRYPT_R, p: int = SCRYPT_P) -> bytes:
+    """
+    Derive the AES-256 key of an encrypted export from its password.
+    """
+    return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p, maxmem=64 * 1024 * 1024, dklen=32)
+
+
+def record_associated_data(header_digest: bytes, record_number: int) -> bytes:
+    """
+    Associated data of a record: binds it to its file and its position.
+    """
+    return header_digest + record_number.to_bytes(8, "big")
+
+
+class EncryptedJsonlWriter:  # pylint: disable=too-many-instance-attributes
+    """
+    Context manager writing an encrypted JSONL export, see the module documentation for the format.
+
+    The trailer is only written when the context exits without an error, so an export that was cut off is
+    recognized as incomplete by iter_jsonl_export. When the export fails, the incomplete file is removed, so
+    the export can be run again to the same path.
+    """
+
+    def __init__(self, jsonl_file: str, jsonl_password: str) -> None:
+        """
+        Args:
+            jsonl_file: Destination path of the export.
+            jsonl_password: Resolved password of the export.
+
+        Raises:
+            BitwardenException: If a file already exists at jsonl_file.
+        """
+        self.__jsonl_file = os.path.abspath(jsonl_file)
+        if os.path.exists(self.__jsonl_file):
+            raise BitwardenException(f"JSONL export already exists at {self.__jsonl_file}")
+        self.__jsonl_password = jsonl_password
+        self.__key = b""
+        self.__header_digest = b""
+        self.__records = 0
+        self.__counts: Dict[str, int] = {}
+        self.__digest = hashlib.sha256()
+        self.__attachment_bytes = 0
+        self.__jsonl: Any = None
+
+    def __enter__(self) -> "EncryptedJsonlWriter":
+        """
+        Create the file, derive the key, and write the header.
+        """
+        LOGGER.warning("Initialization: application is creating a new encrypted JSONL export")
+        LOGGER.info("Creating JSONL export: %s", self.__jsonl_file)
+        os.makedirs(os.path.dirname(self.__jsonl_file), exist_ok=True)
+        salt = secrets.token_bytes(16)
+        header = {
+            "format": JSONL_FORMAT,
+            "version": JSONL_FORMAT_VERSION,
+            "cipher": "AES-256-GCM",
+            "kdf": {"name": "scrypt", "n": SCRYPT_N, "r": SCRYPT_R, "p": SCRYPT_P, "salt": salt.hex()},
+        }
+        header_line = json.dumps(header, separators=(",", ":")).encode("utf-8")
+        self.__key = derive_export_key(self.__jsonl_password, salt)
+        self.__header_digest = hashlib.sha256(header_line).digest()
+        # pylint: disable-next=consider-using-with
+        self.__jsonl = os.fdopen(os.open(self.__jsonl_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), "wb")
+        self.__jsonl.write(header_line + b"\n")
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> Optional[bool]:
+        """
+        Write the trailer and close the file, or remove the file when the export failed.
+
+        Raises:
+            BitwardenException: If an error occurred while the export was written.
+        """
+        try:
+            if exc_type is None:
+                self.write_record(
+                    {
+                        "record": "trailer",
+                        "records": self.__records,
+                        "counts": self.__counts,
+                        "attachmentBytes": self.__attachment_bytes,
+                        "sha256": self.__digest.hexdigest(),
+                    }
+                )
+        except BaseException:
+            self.__jsonl.close()
+            self.__remove_incomplete_file()
+            raise
+        self.__jsonl.close()
+
+        if exc_type is not None:
+            LOGGER.info("Error in processing %s", exc_value)
+            self.__remove_incomplete_file()
+            raise BitwardenException("Error in processing, the JSONL export is incomplete")
+
+        LOGGER.warning("Finalization: application wrote the encrypted JSONL export")
+        LOGGER.info("Wrote %s records to %s: %s", self.__records - 1, self.__jsonl_file, self.__counts)
+        return True
+
+    def __remove_incomplete_file(self) -> None:
+        """
+        Remove the export file created on entering, it does not hold the whole export.
+        """
+        if os.path.exists(self.__jsonl_file):
+            os.remove(self.__jsonl_file)
+            LOGGER.warning("Finalization: application removed the incomplete JSONL export")
+            LOGGER.info("Removed %s", self.__jsonl_file)
+
+    def write_record(self, record: Dict[str, Any]) -> None:
+        """
+        Encrypt and append one record.
+        """
+        plaintext = json.dumps(record, separators=(",", ":")).encode("utf-8")
+        if record["record"] != "trailer":
+            self.__digest.update(plaintext)
+            self.__counts[record["record"]] = self.__counts.get(record["record"], 0) + 1
+        cipher = AES.new(self.__key, AES.MODE_GCM)
+        cipher.update(record_associated_data(self.__header_digest, self.__records))
+        ciphertext, tag = cipher.encrypt_and_digest(plaintext)
+        self.__jsonl.write(base64.b64encode(bytes(cipher.nonce) + tag + ciphertext) + b"\n")
+        self.__records += 1
+
+    def write_groups(self, organizations: Dict[str, BwOrganization], folders: Dict[str, BwFolder]) -> None:
+        """
+        Write the folders, organizations, and collections, without their items.
+        """
+        for folder in folders.values():
+            self.write_record({"record": "folder", **folder.model_dump(exclude={"items"})})
+        for organization in organizations.values():
+            self.write_record({"record": "organization", **organization.model_dump(exclude={"collections"})})
+            for collection in organization.collections.values():
+                self.write_record({"record": "collection", **collection.model_dump(exclude={"items"})})
+
+    def write_item(self, bw_item: BwItem, remove_downloaded_files: bool = False) -> None:
+        """
+        Write an item, followed by its attachments.
+
+        Attachments with content or a local_file_path are written inline, the others as references.
+
+        Args:
+            bw_item: The item.
+            remove_downloaded_files: Delete every downloaded attachment once it is written.
+        """
+        self.write_record(
+            {"record": "item", **bw_item.model_dump(exclude={"attachments": {"__all__": {"local_file_path"}}})}
+        )
+        for attachment in bw_item.attachments:
+            self.write_attachment(bw_item, attachment)
+            if remove_downloaded_files and attachment.local_file_path:
+                os.remove(attachment.local_file_path)
+
+    def write_attachment(self, bw_item: BwItem, attachment: BwItemAttachment) -> None:
+        """
+        Write the content of an attachment in chunks, if it has any, then its description.
+        """
+        record: Dict[str, Any] = {
+            "record": "attachment",
+            "itemId": bw_item.id,
+            **attachment.model_dump(exclude={"local_file_path"}),
+            "inline": attachment.content is not None or bool(attachment.local_file_path),
+        }
+        if record["inline"]:
+            digest = hashlib.sha256()
+            chunks = 0
+            for chunk in iter_attachment_chunks(attachment):
+                digest.update(chunk)
+                self.__attachment_bytes += len(chunk)
+                self.write_record(
+                    {
+                        "record": "attachment_chunk",
+                        "itemId": bw_item.id,
+                        "id": attachment.id,
+                        "index": chunks,
+                        "data": base64.b64encode(chunk).decode("ascii"),
+                    }
+                )
+                chunks += 1
+            record.update({"chunks": chunks, "sha256": digest.hexdigest()})
+        self.write_record(record)
+
+
+def iter_attachment_chunks(attachment: BwItemAttachment) -> Iterator[bytes]:
+    """
+    Read the content of an attachment, from memory or its local file, in chunks of ATTACHMENT_CHUNK_SIZE.
+    """
+    if attachment.content is not None:
+        for offset in range(0, len(attachment.content), ATTACHMENT_CHUNK_SIZE):
+            yield attachment.content[offset : offset + ATTACHMENT_CHUNK_SIZE]
+        return
+    with open(attachment.local_file_path, "rb") as attachment_file:
+        while chunk := attachment_file.read(ATTACHMENT_CHUNK_SIZE):
+            yield chunk
+
+
+def iter_jsonl_export(jsonl_file: str, jsonl_password: str) -> Iterator[Dict[str, Any]]:
+    """
+    Decrypt the records of a JSONL export, checking the trailer at the end.
+
+    Args:
+        jsonl_file: Path of the export.
+        jsonl_password: Resolved password of the export.
+
+    Yields:
+        Dict[str, Any]: The records, the trailer last.
+
+    Raises:
+        BitwardenException: If the file is not a JSONL export, the password is wrong, a record was tampered with,
+            or the export is incomplete.
+    """
+    with open(jsonl_file, "rb") as jsonl:
+        header_line = jsonl.readline().rstrip(b"\n")
+        try:
+            header = json.loads(header_line)
+        except ValueError:
+            raise BitwardenException(f"{jsonl_file} is not a JSONL export")
+        if header.get("format") != JSONL_FORMAT or header.get("version") != JSONL_FORMAT_VERSION:
+            raise BitwardenException(f"{jsonl_file} is not a supported JSONL export")
+        kdf = header["kdf"]
+        key = derive_export_key(jsonl_password, bytes.fromhex(kdf["salt"]), kdf["n"], kdf["r"], kdf["p"])
+        header_digest = hashlib.sha256(header_line).digest()
+
+        digest = hashlib.sha256()
+        for record_number, line in enumerate(jsonl):
+            content = base64.b64decode(line)
+            cipher = AES.new(key, AES.MODE_GCM, nonce=content[:16])
+            cipher.update(record_associated_data(header_digest, record_number))
+            try:
+                plaintext = bytes(cipher.decrypt_and_verify(content[32:], content[16:32]))
+            except ValueError:
+                LOGGER.info("Unable to decrypt record %s of %s", record_number, jsonl_file)
+                if record_number == 0:
+                    raise BitwardenException("Unable to decrypt the JSONL export, check the password")
+                raise BitwardenException("A record of the JSONL export was modified, reordered, or removed")
+            record = json.loads(plaintext)
+            if record["record"] == "trailer":
+                if record["records"] != record_number or record["sha256"] != digest.hexdigest():
+                    raise BitwardenException("The trailer of the JSONL export does not match its records")
+                yield record
+                return
+            digest.update(plaintext)
+            yield record
+    raise BitwardenException("The JSONL export has no trailer, it is incomplete")
+
+
+def create_jsonl_export_cli(
+    jsonl_password: str, jsonl_file: str, attachment_mode: JsonlAttachmentMode = JsonlAttachmentMode.INLINE
+) -> None:
+    """
+    Export the vault to an encrypted JSONL file.
+
+    Items are decoded one at a time from `bw list items` and written while later attachments are still
+    downloading, see process_list_pipelined, and every downloaded attachment is deleted once it is written,
+    unless the export cache needs it or resume is enabled. An item is written once, with all its collection IDs.
+
+    A JMESPath password needs the whole vault before the first record is encrypted; the vault is then processed
+    first, like the KeePass exporter does, and memory is no longer flat.
+
+    Args:
+        jsonl_password: Password of the export, with the same prefixes as the KeePass password.
+        jsonl_file: Destination path of the export.
+        attachment_mode: Write the content of attachments, or only reference them.
+    """
+    download_attachments = attachment_mode == JsonlAttachmentMode.INLINE
+    remove_downloaded_files = (
+        not BITWARDEN_EXPORTER_GLOBAL_SETTINGS.cache_dir and not BITWARDEN_EXPORTER_GLOBAL_SETTINGS.resume
+    )
+
+    if jsonl_password.startswith("jmespath:"):
+        LOGGER.warning("A JMESPath JSONL password needs the whole vault first, application is not streaming")
+        bw_processed_items = process_list(download_attachments=download_attachments)
+        jsonl_password = resolve_secret(
+            jsonl_password, bw_processed_items.raw_items.items, bw_processed_items.raw_items.items_by_id
+        )
+        with log_stage("jsonl_export"), EncryptedJsonlWriter(jsonl_file, jsonl_password) as writer:
+            writer.write_groups(bw_processed_items.organizations, bw_processed_items.folders)
+            written_item_ids: Set[str] = set()
+            for bw_item in iter_items(bw_processed_items):
+                if bw_item.id in written_item_ids:
+                    continue
+                written_item_ids.add(bw_item.id)
+                writer.write_item(bw_item)
+        remove_downloaded()
+        return
+
+    jsonl_password = resolve_secret(jsonl_password, None)
+    with (
+        log_stage("jsonl_export"),
+        EncryptedJsonlWriter(jsonl_file, jsonl_password) as writer,
+        process_list_pipelined(keep_items=False, download_attachments=download_attachments, stream_items=True) as (
+            bw_processed_items,
+            bw_items,
+        ),
+    ):
+        writer.write_groups(bw_processed_items.organizations, bw_processed_items.folders)
+        for bw_item in bw_items:
+            writer.write_item(bw_item, remove_downloaded_files)
+    remove_downloaded()
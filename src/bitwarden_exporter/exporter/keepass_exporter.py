@@ -6,78 +6,232 @@ organizations, collections, folders, and items (including fields, URIs, OTP, SSH
 attachments) to KeePass groups, entries, custom properties, and binaries.
 """
 
+import gzip
+import hashlib
 import json
 import logging
 import os
+import secrets
+import time
 import urllib.parse
 from types import TracebackType
-from typing import Any, Dict, List, Optional, Type, Union
+from typing import Any, Dict, FrozenSet, List, Optional, Set, Tuple, Type, Union
 
-from pykeepass import PyKeePass, create_database  # type: ignore
+from construct import Container  # type: ignore
+from pykeepass import PyKeePass  # type: ignore
 from pykeepass.entry import Entry  # type: ignore
 from pykeepass.group import Group  # type: ignore
+from pykeepass.pykeepass import BLANK_DATABASE_LOCATION, BLANK_DATABASE_PASSWORD  # type: ignore
 
-from ..bw_list_process import RawItems, process_list
+from ..bw_list_process import BwProcessResult, RawItems, process_list, process_list_pipelined
 from ..bw_models import BwField, BwFolder, BwItem, BwOrganization
 from ..exceptions import BitwardenException
+from ..log_handlers import log_stage
+from ..profiler import profile_span, profiled
 from ..remove_downloads import remove_downloaded
 from ..utils import resolve_secret
+from . import AttachmentMemoryPolicy
+from .keepass_kdf import KdbxFormat, argon2_type_of, calibrate_kdbx_format, derive_argon2_key
+from .keepass_verify import (
+    VERIFICATION_INDEX_FILE_NAME,
+    VERIFICATION_INDEX_TITLE,
+    build_verification_index,
+    item_digest,
+    verify_database,
+)
 
 LOGGER = logging.getLogger(__name__)
 
-KDBX_EXPORT_PASSWORD_HELP = r"""
-Direct value: --kdbx-password "my-secret-password".
-From a file: --kdbx-password file:secret.txt.
-From environment: --kdbx-password env:SECRET_PASSWORD.
-From vault (JMESPath expression): --kdbx-password "jmespath:[?id=='xx-xx-xx-xxx-xxx'].fields[] | [?name=='export-password'].value".
 
-"""  # nosec B105
+class BinaryMemoryBudget:
+    """
+    Track the attachment bytes a KeePass database holds in memory until it is saved.
+    """
+
+    def __init__(self, limit_bytes: int = 0, policy: AttachmentMemoryPolicy = AttachmentMemoryPolicy.WARN) -> None:
+        """
+        Args:
+            limit_bytes: Maximum number of attachment bytes to hold; 0 disables the limit.
+            policy: What to do when the limit is exceeded.
+        """
+        self.limit_bytes = limit_bytes
+        self.policy = policy
+        self.held_bytes = 0
+        self.peak_bytes = 0
+        self.__warned = False
+
+    def reserve(self, size: int) -> None:
+        """
+        Account for a binary of the given size before it is read into memory.
+
+        Raises:
+            BitwardenException: If the limit would be exceeded and the policy is REFUSE.
+        """
+        if self.limit_bytes and self.held_bytes + size > self.limit_bytes:
+            LOGGER.info("Attachments need %s bytes, limit is %s bytes", self.held_bytes + size, self.limit_bytes)
+            if self.policy == AttachmentMemoryPolicy.REFUSE:
+                raise BitwardenException("Attachment memory limit exceeded, enable debug logging for more information")
+            if not self.__warned:
+                LOGGER.warning("Attachment memory limit exceeded. Enable debug logging for more information")
+                self.__warned = True
+        self.held_bytes += size
+        self.peak_bytes = max(self.peak_bytes, self.held_bytes)
+
+    def release(self, size: int) -> None:
+        """
+        Give back a reservation for a binary that was not added.
+        """
+        self.held_bytes -= size
+
+
+def needs_raw_items(bitwarden_export: bool, *passwords: str) -> bool:
+    """
+    Whether the raw items must be kept, for the "Bitwarden Export" entry or a JMESPath password.
+    """
+    return bitwarden_export or any(password.startswith("jmespath:") for password in passwords)
 
 
-def create_database_cli(
+def create_database_cli(  # pylint: disable=too-many-arguments,too-many-positional-arguments
     kdbx_password: str,
     kdbx_file: str,
     allow_duplicates: bool = False,
+    binary_memory_budget: Optional[BinaryMemoryBudget] = None,
+    gzip_bitwarden_export: bool = False,
+    kdbx_format: Optional[KdbxFormat] = None,
+    pipelined: bool = False,
+    verify: bool = False,
+    bitwarden_export: bool = True,
 ) -> None:
     """
     Create a new KeePass database.
+
+    With pipelined, entries are written while later attachments are still downloading, see
+    process_list_pipelined. The database holds the same groups, entries, and attachments either way.
+
+    With verify, the saved database is read back and checked against a digest of every entry, see keepass_verify.
+
+    Without bitwarden_export, no "Bitwarden Export" entry is written, and the raw items are only kept when the
+    password is a JMESPath expression.
     """
-    bw_processed_items = process_list(allow_duplicates)
+    if pipelined and kdbx_password.startswith("jmespath:"):
+        LOGGER.warning("A JMESPath KeePass password needs the whole vault first, application is not pipelining")
+        pipelined = False
+
+    if pipelined:
+        with (
+            log_stage("process_list_pipelined"),
+            process_list_pipelined(allow_duplicates, keep_items=bitwarden_export) as (
+                bw_processed_items,
+                bw_items,
+            ),
+        ):
+            kdbx_password = resolve_secret(kdbx_password, None)
+            with KeePassStorage(kdbx_file, kdbx_password, binary_memory_budget, kdbx_format, verify) as storage:
+                storage.process_groups(bw_processed_items.organizations, bw_processed_items.folders)
+                for bw_item in bw_items:
+                    storage.process_item(
+                        bw_item, bw_processed_items.organizations, bw_processed_items.folders, allow_duplicates
+                    )
+                if bitwarden_export:
+                    storage.process_bw_exports(bw_processed_items.raw_items, gzip_sections=gzip_bitwarden_export)
+        remove_downloaded()
+        return
+
+    bw_processed_items = process_list(allow_duplicates, keep_raw_items=needs_raw_items(bitwarden_export, kdbx_password))
+
+    kdbx_password = resolve_secret(
+        kdbx_password, bw_processed_items.raw_items.items, bw_processed_items.raw_items.items_by_id
+    )
+
+    write_database(
+        kdbx_file,
+        kdbx_password,
+        bw_processed_items,
+        binary_memory_budget,
+        gzip_bitwarden_export,
+        kdbx_format,
+        verify,
+        bitwarden_export,
+    )
 
-    kdbx_password = resolve_secret(kdbx_password, bw_processed_items.raw_items.items)
+    remove_downloaded()
 
-    with KeePassStorage(kdbx_file, kdbx_password) as storage:
+
+def write_database(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    kdbx_file: str,
+    kdbx_password: str,
+    bw_processed_items: BwProcessResult,
+    binary_memory_budget: Optional[BinaryMemoryBudget] = None,
+    gzip_bitwarden_export: bool = False,
+    kdbx_format: Optional[KdbxFormat] = None,
+    verify: bool = False,
+    bitwarden_export: bool = True,
+) -> None:
+    """
+    Write processed Bitwarden data to a new KeePass database.
+
+    Args:
+        kdbx_file: Destination path of the KeePass database.
+        kdbx_password: Resolved password of the KeePass database.
+        bw_processed_items: Organizations, folders, items, and raw data to write.
+        binary_memory_budget: Limit for the attachment bytes held in memory until the database is saved.
+        gzip_bitwarden_export: Gzip each section attached to the "Bitwarden Export" entry.
+        kdbx_format: Key derivation and payload settings.
+        verify: Read the saved database back and check every entry, see keepass_verify.
+        bitwarden_export: Attach the raw Bitwarden data to a "Bitwarden Export" entry.
+    """
+    with KeePassStorage(kdbx_file, kdbx_password, binary_memory_budget, kdbx_format, verify) as storage:
         storage.process_organizations(bw_processed_items.organizations)
         storage.process_folders(bw_processed_items.folders)
         storage.process_no_folder_items(bw_processed_items.no_folder_items)
-        storage.process_bw_exports(bw_processed_items.raw_items)
-
-    remove_downloaded()
+        if bitwarden_export:
+            storage.process_bw_exports(bw_processed_items.raw_items, gzip_sections=gzip_bitwarden_export)
 
 
-class KeePassStorage:
+class KeePassStorage:  # pylint: disable=too-many-instance-attributes
     """
     Adapter that creates and populates a KeePass database using Bitwarden data models.
 
-    This context manager creates a new KDBX database on entering and saves it on exit.
+    This context manager creates a new KDBX database on entering and saves it on exit. With verify, it also
+    writes a digest index of its entries, and reads the saved database back to check them, see keepass_verify.
     """
 
     __py_kee_pass: PyKeePass
     __my_vault_group: Group
 
-    def __init__(self, kdbx_file: str, kdbx_password: str) -> None:
+    def __init__(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        kdbx_file: str,
+        kdbx_password: str,
+        binary_memory_budget: Optional[BinaryMemoryBudget] = None,
+        kdbx_format: Optional[KdbxFormat] = None,
+        verify: bool = False,
+    ) -> None:
         """
         Initialize a new KeePassStorage context.
 
         Args:
             kdbx_file: Destination path for the KeePass database file (.kdbx).
             kdbx_password: Password used to protect the KeePass database.
+            binary_memory_budget: Limit for the attachment bytes held in memory until the database is saved.
+            kdbx_format: Key derivation and payload settings, pykeepass defaults with Argon2 lanes per core if unset.
+            verify: Write a digest index of the entries and check the saved database against it on exit.
 
         Raises:
             BitwardenException: If a file already exists at the given kdbx_file path.
         """
         self.__kdbx_file = os.path.abspath(kdbx_file)
         self.__kdbx_password = kdbx_password
+        self.__binary_memory_budget = binary_memory_budget or BinaryMemoryBudget()
+        self.__kdbx_format = kdbx_format or KdbxFormat()
+        self.__transformed_key = b""
+        self.__kdf_seconds = 0.0
+        self.__serialization_seconds = 0.0
+        self.__group_index: Dict[Tuple[str, ...], Group] = {}
+        self.__entries_by_item_id: Dict[Tuple[int, str], Entry] = {}
+        self.__verify = verify
+        self.__item_digests: Dict[str, Dict[str, str]] = {}
+        self.__processed_item_ids: Set[str] = set()
         if os.path.exists(self.__kdbx_file):
             raise BitwardenException(f"KeePass Database already exists at {self.__kdbx_file}")
 
@@ -95,7 +249,12 @@ class KeePassStorage:
             LOGGER.warning("Initialization: application is creating destination directory for KeePass file")
             LOGGER.info("Creating Directory %s", __kdbx_dir)
             os.makedirs(__kdbx_dir)
-        self.__py_kee_pass = create_database(self.__kdbx_file, password=self.__kdbx_password)
+        with profile_span("KeePassStorage.create_database", "keepass"):
+            self.__py_kee_pass = PyKeePass(BLANK_DATABASE_LOCATION, BLANK_DATABASE_PASSWORD)
+            self.__py_kee_pass.filename = self.__kdbx_file
+            self.__py_kee_pass.password = self.__kdbx_password
+            self.__apply_kdbx_format()
+            self.__save()
 
         LOGGER.warning("Initialization: application is creating the root 'My Vault' group in KeePass")
         LOGGER.info("Creating Keepass group My Vault")
@@ -111,6 +270,8 @@ class KeePassStorage:
         """
         Save the database and translate exceptions to BitwardenException.
 
+        When processing or saving failed, the incomplete database file is removed instead of being left behind.
+
         Args:
             exc_type: Exception type, if any, raised within the context.
             exc_value: Exception instance raised within the context.
@@ -120,63 +281,167 @@ class KeePassStorage:
             bool | None: True to suppress further exception handling if no error occurred; None otherwise.
 
         Raises:
-            BitwardenException: If saving the database fails, or if an error occurred during processing.
+            BitwardenException: If saving the database fails, if an error occurred during processing, or if
+                verification is enabled and the saved database does not match what was written.
         """
+        if exc_type is not None:
+            LOGGER.info("Error in processing %s", exc_value)
+            self.__remove_incomplete_file()
+            raise BitwardenException("Error in processing, enable debug logging for more information")
+
         try:
-            self.__py_kee_pass.save()
+            if self.__verify:
+                self.__add_index_entry(
+                    VERIFICATION_INDEX_TITLE,
+                    VERIFICATION_INDEX_FILE_NAME,
+                    build_verification_index(self.__item_digests, self.__processed_item_ids),
+                )
+            self.__save()
             LOGGER.warning("Finalization: application saved the KeePass database to disk")
             LOGGER.info("Keepass Database Saved")
+            LOGGER.warning("Finalization: peak attachment memory was %s bytes", self.__binary_memory_budget.peak_bytes)
+            LOGGER.warning(
+                "Finalization: key derivation took %.3fs, serialization took %.3fs",
+                self.__kdf_seconds,
+                self.__serialization_seconds,
+            )
         except Exception as e:  # pylint: disable=broad-except
             LOGGER.error("Error in saving Keepass Database %s", e)
+            self.__remove_incomplete_file()
             raise BitwardenException("Error in saving Keepass Database, enable debug logging for more information")
 
-        if exc_type is not None:
-            LOGGER.info("Error in processing %s", exc_value)
-            raise BitwardenException("Error in processing, enable debug logging for more information")
+        if self.__verify:
+            with profile_span("KeePassStorage.verify", "keepass"):
+                verify_database(self.__kdbx_file, self.__kdbx_password, self.__transformed_key)
 
         return True
 
-    def __add_group_recursive(self, group_path: str, parent_group: Optional[Group] = None) -> Group:
+    def __remove_incomplete_file(self) -> None:
         """
-        Recursively add a group to Keepass
+        Remove the database file created on entering, it does not hold the whole export.
         """
-        if not parent_group:
-            parent_group = self.__py_kee_pass.root_group
+        if os.path.exists(self.__kdbx_file):
+            os.remove(self.__kdbx_file)
+            LOGGER.warning("Finalization: application removed the incomplete KeePass database")
+            LOGGER.info("Removed %s", self.__kdbx_file)
+
+    def __apply_kdbx_format(self) -> None:
+        """
+        Apply the KDF and compression settings with a fresh salt, seed, and IV, and derive the key once.
+
+        The blank database pykeepass starts from always has the same KDF salt, master seed, and encryption IV, so
+        they are replaced as well. The derived key is kept and passed to every save, which then skips the KDF.
+        """
+        kdbx_format = calibrate_kdbx_format(self.__kdbx_format)
+        dynamic_header = self.__py_kee_pass.kdbx.header.value.dynamic_header
+        kdf_parameters = dynamic_header.kdf_parameters.data.dict
+        argon2_type = argon2_type_of(kdf_parameters)
+
+        if kdbx_format.argon2_memory_mib:
+            kdf_parameters["M"].value = kdbx_format.argon2_memory_mib * 1024 * 1024
+        if kdbx_format.argon2_iterations:
+            kdf_parameters["I"].value = kdbx_format.argon2_iterations
+        kdf_parameters["P"].value = kdbx_format.argon2_parallelism
+        kdf_parameters["S"].value = secrets.token_bytes(len(kdf_parameters["S"].value))
+        dynamic_header.master_seed.data = secrets.token_bytes(len(dynamic_header.master_seed.data))
+        dynamic_header.encryption_iv.data = secrets.token_bytes(len(dynamic_header.encryption_iv.data))
+        dynamic_header.compression_flags.data.compression = kdbx_format.compression
+        # The header is written from its raw bytes when they are present, drop them to write the new values.
+        del self.__py_kee_pass.kdbx.header.data
+
+        LOGGER.warning("Initialization: application is deriving the KeePass database key")
+        LOGGER.info(
+            "Argon2: %s MiB, %s iterations, %s lanes, compression %s",
+            kdf_parameters["M"].value // (1024 * 1024),
+            kdf_parameters["I"].value,
+            kdf_parameters["P"].value,
+            kdbx_format.compression,
+        )
+        start = time.perf_counter()
+        with profile_span("KeePassStorage.derive_key", "keepass"):
+            self.__transformed_key = derive_argon2_key(
+                self.__kdbx_password,
+                kdf_parameters["S"].value,
+                argon2_type,
+                kdf_parameters["I"].value,
+                kdf_parameters["M"].value // 1024,
+                kdf_parameters["P"].value,
+            )
+        self.__kdf_seconds += time.perf_counter() - start
 
-        if group_path.startswith("/"):
-            group_path = group_path[1:]
+    def __save(self) -> None:
+        start = time.perf_counter()
+        with profile_span("KeePassStorage.save", "keepass"):
+            self.__py_kee_pass.save(transformed_key=self.__transformed_key)
+        self.__serialization_seconds += time.perf_counter() - start
+
+    def __add_group_recursive(self, group_path: str, parent_path: str = "") -> Group:
+        """
+        Recursively add a group to Keepass, or return it if it already exists.
 
-        if group_path.endswith("/"):
-            group_path = group_path[:-1]
+        Groups are resolved through an index of path segments to Group, so every segment costs a dictionary
+        lookup instead of a scan of the parent's subgroups.
 
-        if group_path == "":
+        Args:
+            group_path: Slash separated path of the group, relative to parent_path.
+            parent_path: Slash separated path of the parent group, the root group when empty.
+        """
+        group_segments = tuple(segment for segment in group_path.split("/") if segment)
+        if not group_segments:
             raise BitwardenException("Group Path is empty")
+        parent_segments = tuple(segment for segment in parent_path.split("/") if segment)
+        return self.__add_group_segments(parent_segments + group_segments)
+
+    def __add_group_segments(self, path_segments: Tuple[str, ...]) -> Group:
+        group = self.__group_index.get(path_segments)
+        if group is not None:
+            return group
+        if len(path_segments) == 1:
+            parent_group = self.__py_kee_pass.root_group
+        else:
+            parent_group = self.__add_group_segments(path_segments[:-1])
+        group = self.__py_kee_pass.add_group(parent_group, group_name=path_segments[-1])
+        self.__group_index[path_segments] = group
+        return group
 
-        existing_subgroups: List[Group] = parent_group.subgroups
-        if "/" in group_path:
-            group_name = group_path.split("/")[0]
-            for subgroup in existing_subgroups:
-                if subgroup.name == group_name:
-                    return self.__add_group_recursive(
-                        group_path="/".join(group_path.split("/")[1:]), parent_group=subgroup
-                    )
-            new_group = self.__py_kee_pass.add_group(parent_group, group_name=group_name)
-            return self.__add_group_recursive(group_path="/".join(group_path.split("/")[1:]), parent_group=new_group)
-        for subgroup in existing_subgroups:
-            if subgroup.name == group_path:
-                return subgroup
-        return self.__py_kee_pass.add_group(parent_group, group_name=group_path)
+    def __add_item_entry(self, group: Group, bw_item: BwItem) -> None:
+        """
+        Add the entry of a processed item to a group, translating errors to BitwardenException.
+
+        The item counts as processed for the verification index, see keepass_verify.
+        """
+        self.__processed_item_ids.add(bw_item.id)
+        try:
+            self.__add_entry(group, bw_item)
+        except Exception as e:  # pylint: disable=broad-except
+            LOGGER.info("Error adding entry %s", e)
+            raise BitwardenException("Error adding entry, enable debug logging for more information")
 
     def __add_entry(self, group: Group, bw_item: BwItem) -> Entry:
         """
         Add an entry to Keepass
+
+        The entry is built and appended to the group directly. pykeepass' add_entry searches the group for an
+        entry with the same title and username first, which makes building a database quadratic and rejects
+        distinct Bitwarden items that share a title and username. Duplicates are detected by Bitwarden item ID
+        instead: adding the same item to the same group again returns the existing entry.
         """
-        entry: Union[Entry | Group] = self.__py_kee_pass.add_entry(
-            destination_group=group,
+        # Groups are only handed out by the group index and live as long as the storage, so id() is stable.
+        entry_key = (id(group), bw_item.id)
+        existing_entry = self.__entries_by_item_id.get(entry_key)
+        if existing_entry is not None:
+            LOGGER.warning("Duplicate item detected in the same group. Enable debug logging for more information")
+            LOGGER.info("Item %s is already in group %s, skipping", bw_item.name, group.name)
+            return existing_entry
+
+        entry = Entry(
             title=bw_item.name,
             username="" if (not bw_item.login) or (not bw_item.login.username) else bw_item.login.username,
             password="" if (not bw_item.login) or (not bw_item.login.password) else bw_item.login.password,
+            kp=self.__py_kee_pass,
         )
+        group.append(entry)
+        self.__entries_by_item_id[entry_key] = entry
         LOGGER.warning("KeePass write: application is creating a new entry in the database")
         LOGGER.info("Adding Entry %s", bw_item.name)
 
@@ -200,13 +465,28 @@ class KeePassStorage:
         bw_item.fields.extend(identity_fields)
 
         bw_item.fields += self.__add_uri(entry, bw_item)
-        self.__add_fields(entry, bw_item)
-        self.__add_attachment(entry, bw_item)
+        custom_properties = self.__add_fields(entry, bw_item)
+        attachment_digests = self.__add_attachment(entry, bw_item)
         self.__add_otp(entry, bw_item)
 
         if bw_item.notes:
             entry.notes = bw_item.notes
 
+        if self.__verify:
+            # From the item as it was mapped, not from the entry, so that a mapping that went wrong in the
+            # database is caught when the saved database is read back.
+            login = bw_item.login
+            strings = {
+                **custom_properties,
+                "Title": bw_item.name,
+                "UserName": login.username if login else None,
+                "Password": login.password if login else None,
+                "URL": login.uris[0].uri if login and login.uris else None,
+                "Notes": bw_item.notes,
+                "otp": login.totp if login else None,
+            }
+            self.__item_digests.setdefault(bw_item.id, {})[str(entry.uuid)] = item_digest(strings, attachment_digests)
+
         return entry
 
     @staticmethod
@@ -285,81 +565,161 @@ class KeePassStorage:
         entry.otp = bw_item.login.totp
         return None
 
+    @staticmethod
+    def __deduplicate_names(names: List[str], taken: Set[str], reserved: FrozenSet[str] = frozenset()) -> List[str]:
+        """
+        Make names unique in a single pass, keeping the first occurrence and adding -1, -2, ... to the others.
+
+        Args:
+            names: Names in order of appearance.
+            taken: Names that already exist and must not be reused; updated with the returned names.
+            reserved: Names that are never used, even on their first occurrence.
+
+        Returns:
+            List[str]: The unique names, in the same order.
+        """
+        next_suffix: Dict[str, int] = {}
+        unique_names: List[str] = []
+        for name in names:
+            unique_name = name
+            if unique_name in taken or unique_name in reserved:
+                suffix = next_suffix.get(name, 1)
+                while f"{name}-{suffix}" in taken or f"{name}-{suffix}" in reserved:
+                    suffix += 1
+                next_suffix[name] = suffix + 1
+                unique_name = f"{name}-{suffix}"
+            taken.add(unique_name)
+            unique_names.append(unique_name)
+        return unique_names
+
     def __fix_duplicate_field_names(self, entry: Entry, item: BwItem) -> None:
         """
-        Fix duplicate field names
+        Fix duplicate field names, otp is reserved in keepass and renamed as well
         """
-        all_field_names = [] + list(entry.custom_properties.keys())
-        for field in item.fields:
-            if field.name in all_field_names:
-                LOGGER.warning("Duplicate field name detected. Enable debug logging for more information")
-                LOGGER.info('%s: Field with name "%s" already exists, Adding -1', item.name, field.name)
-                field.name = f"{field.name}-1"
-                self.__fix_duplicate_field_names(entry, item)
+        field_names = [field.name for field in item.fields]
+        unique_names = self.__deduplicate_names(field_names, set(entry.custom_properties.keys()), frozenset({"otp"}))
+        for field, unique_name in zip(item.fields, unique_names):
+            if field.name == unique_name:
+                continue
             if field.name == "otp":
                 LOGGER.warning("Reserved field name detected. Enable debug logging for more information")
-                LOGGER.info("%s: Field with name otp is reserved in keepass, Changing to otp-1", item.name)
-                field.name = "otp-1"
-                self.__fix_duplicate_field_names(entry, item)
-            all_field_names.append(field.name)
+                LOGGER.info("%s: Field with name otp is reserved in keepass, Changing to %s", item.name, unique_name)
+            else:
+                LOGGER.warning("Duplicate field name detected. Enable debug logging for more information")
+                LOGGER.info(
+                    '%s: Field with name "%s" already exists, Changing to %s', item.name, field.name, unique_name
+                )
+            field.name = unique_name
 
-    def __add_fields(self, entry: Entry, item: BwItem) -> None:  # pylint: disable=too-many-branches
+    def __add_fields(self, entry: Entry, item: BwItem) -> Dict[str, str]:
         """
         Add fields to Keepass
+
+        Returns:
+            Dict[str, str]: The value written for every field, by custom property name.
         """
         LOGGER.warning("KeePass write: application is adding Bitwarden custom fields into KeePass custom properties")
         LOGGER.info("%s: Adding Custom Fields to custom_properties", item.name)
         self.__fix_duplicate_field_names(entry, item)
+        custom_properties: Dict[str, str] = {}
         for field in item.fields:
-            if field.type == 0:
-                if field.value:
-                    entry.set_custom_property(field.name, field.value, protect=False)
-                else:
-                    entry.set_custom_property(field.name, "", protect=False)
-            elif field.type == 1:
-                if field.value:
-                    entry.set_custom_property(field.name, field.value, protect=True)
-                else:
-                    entry.set_custom_property(field.name, "", protect=True)
-            elif field.type == 2:
-                entry.set_custom_property(field.name, field.value, protect=False)
+            if field.type in (0, 1, 2):
+                value = field.value or ""
             elif field.type == 3 and field.linkedId:
                 if field.linkedId == 100:
-                    entry.set_custom_property(field.name, "Linked to Username", protect=False)
+                    value = "Linked to Username"
                 elif field.linkedId == 101:
-                    entry.set_custom_property(field.name, "Linked to Password", protect=False)
+                    value = "Linked to Password"
                 else:
                     raise BitwardenException(f"{item.name}:: {field.name}:: Unknown linkedId {field.linkedId}")
             else:
                 raise BitwardenException(f"{item.name}:: {field.name}:: Unknown Field Type {field.type}")
+            entry.set_custom_property(field.name, value, protect=field.type == 1)
+            custom_properties[field.name] = value
+        return custom_properties
 
     def __fix_duplicate_attachment_names(self, entry: Entry, item: BwItem) -> None:
         """
         Fix duplicate attachment names
         """
-        all_attachment_names = [] + [attachment.fileName for attachment in entry.attachments]
-        for attachment in item.attachments:
-            if attachment.fileName in all_attachment_names:
-                LOGGER.warning("Duplicate attachment name detected. Enable debug logging for more information")
-                LOGGER.info('%s: Attachment with name "%s" already exists, Adding -1', item.name, attachment.fileName)
-                attachment.fileName = f"{attachment.fileName}-1"
-                self.__fix_duplicate_attachment_names(entry, item)
-            all_attachment_names.append(attachment.fileName)
+        attachment_names = [attachment.fileName for attachment in item.attachments]
+        unique_names = self.__deduplicate_names(
+            attachment_names, {attachment.filename for attachment in entry.attachments}
+        )
+        for attachment, unique_name in zip(item.attachments, unique_names):
+            if attachment.fileName == unique_name:
+                continue
+            LOGGER.warning("Duplicate attachment name detected. Enable debug logging for more information")
+            LOGGER.info(
+                '%s: Attachment with name "%s" already exists, Changing to %s',
+                item.name,
+                attachment.fileName,
+                unique_name,
+            )
+            attachment.fileName = unique_name
 
-    def __add_attachment(self, entry: Entry, item: BwItem) -> None:
+    def __add_attachment(self, entry: Entry, item: BwItem) -> List[Tuple[str, str]]:
         """
         Add an attachment to Keepass
+
+        Returns:
+            List[Tuple[str, str]]: Name and hex SHA-256 of every attachment when verifying, otherwise empty.
         """
         LOGGER.warning("KeePass write: application is attaching downloaded Bitwarden files to the entry")
         LOGGER.info("%s: Adding Attachments", item.name)
         self.__fix_duplicate_attachment_names(entry, item)
+        attachment_digests: List[Tuple[str, str]] = []
         for attachment in item.attachments:
             LOGGER.warning("KeePass write: application is embedding an attachment binary into the KeePass entry")
             LOGGER.info('%s: Adding Attachment to keepass "%s"', item.name, attachment.fileName)
-            with open(attachment.local_file_path, "rb") as file_attach:
-                binary_id = self.__py_kee_pass.add_binary(data=file_attach.read(), protected=True, compressed=False)
-                entry.add_attachment(binary_id, attachment.fileName)
+            data: Union[bytes, bytearray]
+            if attachment.content is not None:
+                self.__binary_memory_budget.reserve(len(attachment.content))
+                data = b"\x01" + attachment.content
+                attachment.content = None
+            else:
+                data = self.__read_binary_file(attachment.local_file_path)
+            if self.__verify:
+                attachment_digests.append((attachment.fileName, hashlib.sha256(memoryview(data)[1:]).hexdigest()))
+            entry.add_attachment(self.__add_binary(data), attachment.fileName)
+        return attachment_digests
 
+    def __read_binary_file(self, file_path: str) -> bytearray:
+        """
+        Read a file for a protected binary, accounted against the memory budget.
+
+        The file is read into a single preallocated buffer that already carries the KDBX4 protected flag byte,
+        so it is not copied again on the way into the database.
+        """
+        size = os.path.getsize(file_path)
+        self.__binary_memory_budget.reserve(size)
+        try:
+            data = bytearray(size + 1)
+            data[0] = 1
+            with open(file_path, "rb") as file_attach, memoryview(data) as data_view:
+                read_size = file_attach.readinto(data_view[1:])
+            if read_size != size:
+                raise BitwardenException(f"Attachment changed while reading {file_path}")
+        except BaseException:
+            self.__binary_memory_budget.release(size)
+            raise
+        return data
+
+    def __add_binary(self, data: Union[bytes, bytearray]) -> int:
+        """
+        Add a protected binary whose first byte is the KDBX4 protected flag and return its ID.
+
+        pykeepass' add_binary copies the data and every existing binary on each call; KDBX4 binaries are
+        appended to the inner header directly instead.
+        """
+        if self.__py_kee_pass.version >= (4, 0):
+            inner_header_binaries = self.__py_kee_pass.payload.inner_header.binary
+            inner_header_binaries.append(Container(type="binary", data=data))
+            return len(inner_header_binaries) - 1
+        return int(self.__py_kee_pass.add_binary(data=bytes(data[1:]), protected=True, compressed=False))
+
+    @profiled("keepass")
+    @log_stage("KeePassStorage.process_organizations")
     def process_organizations(self, bw_organizations: Dict[str, BwOrganization]) -> None:
         """
         Function to write to Keepass
@@ -375,21 +735,17 @@ class KeePassStorage:
             for collection in collections.values():
                 LOGGER.warning("KeePass write: application is creating a collection group under the organization")
                 LOGGER.info("%s:: Processing Collection %s", organization.name, collection.name)
-                collection_group = self.__add_group_recursive(
-                    group_path=collection.name, parent_group=organization_group
-                )
+                collection_group = self.__add_group_recursive(group_path=collection.name, parent_path=organization.name)
                 items = collection.items
                 collection.items = {}
                 collection_group.notes = json.dumps(collection.model_dump(), indent=4)
                 for item in items.values():
                     LOGGER.warning("KeePass write: application is converting a Bitwarden item into a KeePass entry")
                     LOGGER.info("%s::%s:: Processing Item %s", organization.name, collection.name, item.name)
-                    try:
-                        self.__add_entry(collection_group, item)
-                    except Exception as e:  # pylint: disable=broad-except
-                        LOGGER.info("Error adding entry %s", e)
-                        raise BitwardenException("Error adding entry, enable debug logging for more information")
+                    self.__add_item_entry(collection_group, item)
 
+    @profiled("keepass")
+    @log_stage("KeePassStorage.process_folders")
     def process_folders(self, bw_folders: Dict[str, BwFolder]) -> None:
         """
         Function to write to Keepass
@@ -400,19 +756,86 @@ class KeePassStorage:
                 continue
             LOGGER.warning("KeePass write: application is creating a personal folder group in 'My Vault'")
             LOGGER.info("Processing Folder %s", folder.name)
-            folder_group: Group = self.__add_group_recursive(group_path=folder.name, parent_group=self.__my_vault_group)
+            folder_group: Group = self.__add_group_recursive(group_path=folder.name, parent_path="My Vault")
             items = folder.items
             folder.items = {}
             folder_group.notes = json.dumps(folder.model_dump(), indent=4)
             for item in items.values():
                 LOGGER.warning("KeePass write: application is adding an item from a personal folder into KeePass")
                 LOGGER.info("%s:: Processing Item %s", folder.name, item.name)
-                try:
-                    self.__add_entry(folder_group, item)
-                except Exception as e:  # pylint: disable=broad-except
-                    LOGGER.info("Error adding entry %s", e)
-                    raise BitwardenException("Error adding entry, enable debug logging for more information")
+                self.__add_item_entry(folder_group, item)
 
+    @profiled("keepass")
+    def process_groups(self, bw_organizations: Dict[str, BwOrganization], bw_folders: Dict[str, BwFolder]) -> None:
+        """
+        Create the groups of all organizations, collections, and folders, without items, for process_item.
+
+        Groups are created in the same order and with the same notes as process_organizations and process_folders
+        create them.
+        """
+        for organization in bw_organizations.values():
+            LOGGER.warning("KeePass write: application is creating groups for a Bitwarden organization")
+            LOGGER.info("Processing Organization %s", organization.name)
+            organization_group: Group = self.__add_group_recursive(group_path=organization.name)
+            organization_group.notes = json.dumps(
+                organization.model_copy(update={"collections": {}}).model_dump(), indent=4
+            )
+            for collection in organization.collections.values():
+                LOGGER.warning("KeePass write: application is creating a collection group under the organization")
+                LOGGER.info("%s:: Processing Collection %s", organization.name, collection.name)
+                collection_group = self.__add_group_recursive(group_path=collection.name, parent_path=organization.name)
+                collection_group.notes = json.dumps(collection.model_copy(update={"items": {}}).model_dump(), indent=4)
+
+        for folder in bw_folders.values():
+            if folder.name == "No Folder":
+                continue
+            LOGGER.warning("KeePass write: application is creating a personal folder group in 'My Vault'")
+            LOGGER.info("Processing Folder %s", folder.name)
+            folder_group: Group = self.__add_group_recursive(group_path=folder.name, parent_path="My Vault")
+            folder_group.notes = json.dumps(folder.model_copy(update={"items": {}}).model_dump(), indent=4)
+
+    def process_item(
+        self,
+        bw_item: BwItem,
+        bw_organizations: Dict[str, BwOrganization],
+        bw_folders: Dict[str, BwFolder],
+        allow_duplicates: bool = False,
+    ) -> None:
+        """
+        Add one item to the groups created by process_groups, where the process_* methods would add it.
+
+        Args:
+            bw_item: The item, with its attachments downloaded.
+            bw_organizations: The organizations with their collections.
+            bw_folders: The folders.
+            allow_duplicates: Add an item of several collections to every collection instead of the first one.
+        """
+        if bw_item.organizationId:
+            organization = bw_organizations[bw_item.organizationId]
+            collection_ids = bw_item.collectionIds or []
+            if not allow_duplicates:
+                collection_ids = collection_ids[:1]
+            groups = [
+                self.__add_group_recursive(
+                    group_path=organization.collections[collection_id].name, parent_path=organization.name
+                )
+                for collection_id in collection_ids
+            ]
+        elif bw_item.folderId:
+            folder = bw_folders[bw_item.folderId]
+            if folder.name == "No Folder":
+                return
+            groups = [self.__add_group_recursive(group_path=folder.name, parent_path="My Vault")]
+        else:
+            groups = [self.__my_vault_group]
+
+        for group in groups:
+            LOGGER.warning("KeePass write: application is converting a Bitwarden item into a KeePass entry")
+            LOGGER.info("%s:: Processing Item %s", group.name, bw_item.name)
+            self.__add_item_entry(group, bw_item)
+
+    @profiled("keepass")
+    @log_stage("KeePassStorage.process_no_folder_items")
     def process_no_folder_items(self, no_folder_items: List[BwItem]) -> None:
         """
         Function to write to Keepass
@@ -423,15 +846,20 @@ class KeePassStorage:
         for item in no_folder_items:
             LOGGER.warning("KeePass write: application is adding an ungrouped item into 'My Vault'")
             LOGGER.info("Processing Item %s", item.name)
-            try:
-                self.__add_entry(self.__my_vault_group, item)
-            except Exception as e:
-                LOGGER.info("Error adding entry %s", e)
-                raise BitwardenException("Error adding entry, enable debug logging for more information")
+            self.__add_item_entry(self.__my_vault_group, item)
 
-    def process_bw_exports(self, raw_items: RawItems) -> None:
+    @profiled("keepass")
+    def process_bw_exports(self, raw_items: RawItems, gzip_sections: bool = False) -> None:
         """
-        Function to write to Keepass
+        Attach every section of the raw Bitwarden data to a "Bitwarden Export" entry.
+
+        Sections are attached as the Bitwarden CLI printed them, see RawItems.cli_outputs, so the vault is not
+        serialized a second time; list sections are wrapped in a JSON array, matching RawItems. Sections without
+        CLI output are serialized as compact JSON.
+
+        Args:
+            raw_items: The raw Bitwarden data collected by process_list.
+            gzip_sections: Compress each section with gzip and attach it as `<section>.gz`.
         """
         entry: Union[Entry | Group] = self.__py_kee_pass.add_entry(
             destination_group=self.__py_kee_pass.root_group,
@@ -439,8 +867,48 @@ class KeePassStorage:
             username="",
             password="",  # nosec CWE-259
         )
-        for key, value in raw_items.model_dump().items():
-            binary_id = self.__py_kee_pass.add_binary(
-                data=json.dumps(value, indent=4).encode(), protected=True, compressed=False
-            )
+        for key, field in RawItems.model_fields.items():
+            if field.exclude:
+                continue
+            value = getattr(raw_items, key)
+            cli_output = raw_items.cli_outputs.get(key)
+            if cli_output is None:
+                section = json.dumps(value, separators=(",", ":")).encode("utf-8")
+            elif isinstance(value, list):
+                section = b"".join((b"[", cli_output.encode("utf-8"), b"]"))
+            else:
+                section = cli_output.encode("utf-8")
+
+            if gzip_sections:
+                section = gzip.compress(section, mtime=0)
+                key = f"{key}.gz"
+
+            self.__binary_memory_budget.reserve(len(section))
+            binary_id = self.__add_binary(b"\x01" + section)
             entry.add_attachment(binary_id, key)
+
+    @profiled("keepass")
+    def process_shard_index(self, shard_index: Dict[str, Any]) -> None:
+        """
+        Attach the index of a sharded export, as JSON, to a "Bitwarden Shard Index" entry.
+
+        Args:
+            shard_index: The shards and the shard of every Bitwarden item ID, see keepass_shards.
+        """
+        self.__add_index_entry(
+            "Bitwarden Shard Index", "shard_index.json", json.dumps(shard_index, indent=4).encode("utf-8")
+        )
+
+    def __add_index_entry(self, title: str, file_name: str, section: bytes) -> None:
+        """
+        Add an entry to the root group with a JSON index of the export as its only attachment.
+        """
+        entry: Union[Entry | Group] = self.__py_kee_pass.add_entry(
+            destination_group=self.__py_kee_pass.root_group,
+            title=title,
+            username="",
+            password="",  # nosec CWE-259
+        )
+        self.__binary_memory_budget.reserve(len(section))
+        binary_id = self.__add_binary(b"\x01" + section)
+        entry.add_attachment(binary_id, file_name)
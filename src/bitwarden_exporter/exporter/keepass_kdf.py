@@ -0,0 +1,142 @@
+"""
+Key derivation and payload settings of the written KDBX files.
+
+KdbxFormat holds the Argon2 and compression settings. calibrate_kdbx_format turns a target unlock time into a
+number of Argon2 iterations for this machine, and derive_argon2_key derives the transformed key once, so that
+KeePassStorage can pass it to every save instead of running the KDF again.
+"""
+
+import logging
+import os
+import secrets
+import time
+from typing import Dict, Optional
+
+import argon2
+from construct import Container  # type: ignore
+from pydantic import BaseModel, Field
+from pykeepass.kdbx_parsing.common import compute_key_composite  # type: ignore
+from pykeepass.kdbx_parsing.kdbx import KDBX  # type: ignore
+from pykeepass.kdbx_parsing.kdbx4 import kdf_uuids  # type: ignore
+from pykeepass.pykeepass import BLANK_DATABASE_LOCATION  # type: ignore
+
+from ..exceptions import BitwardenException
+
+LOGGER = logging.getLogger(__name__)
+
+
+def available_cores() -> int:
+    """
+    Number of CPU cores this process may run on.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+class KdbxFormat(BaseModel):
+    """
+    Key derivation and payload settings of the written KDBX file.
+
+    Attributes:
+        argon2_memory_mib: Argon2 memory cost in MiB; the pykeepass default when unset.
+        argon2_iterations: Argon2 iterations; the pykeepass default when unset. Replaced by the calibrated value
+            when target_unlock_seconds is set.
+        argon2_parallelism: Argon2 lanes, defaults to the number of available cores.
+        compression: Gzip the database payload.
+        target_unlock_seconds: Calibrate argon2_iterations so that deriving the key takes about this long on
+            this machine; disabled when unset.
+    """
+
+    argon2_memory_mib: Optional[int] = None
+    argon2_iterations: Optional[int] = None
+    argon2_parallelism: int = Field(default_factory=available_cores)
+    compression: bool = True
+    target_unlock_seconds: Optional[float] = None
+
+
+def derive_argon2_key(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    kdbx_password: str, salt: bytes, argon2_type: argon2.low_level.Type, iterations: int, memory_kib: int, lanes: int
+) -> bytes:
+    """
+    Derive the KDBX 4 transformed key from a password, like pykeepass does when a database is opened or saved.
+    """
+    return bytes(
+        argon2.low_level.hash_secret_raw(
+            secret=compute_key_composite(password=kdbx_password, keyfile=None),
+            salt=salt,
+            hash_len=32,
+            type=argon2_type,
+            time_cost=iterations,
+            memory_cost=memory_kib,
+            parallelism=lanes,
+            version=19,
+        )
+    )
+
+
+def calibrate_argon2_iterations(
+    argon2_type: argon2.low_level.Type, memory_kib: int, lanes: int, target_seconds: float
+) -> int:
+    """
+    Pick the number of Argon2 iterations that derives a key in about target_seconds on this machine.
+
+    One derivation with two iterations is timed, the time of one iteration is extrapolated from it.
+
+    Returns:
+        int: The number of iterations, at least 1.
+    """
+    start = time.perf_counter()
+    derive_argon2_key("calibration", secrets.token_bytes(32), argon2_type, 2, memory_kib, lanes)
+    seconds_per_iteration = (time.perf_counter() - start) / 2
+    iterations = max(1, round(target_seconds / seconds_per_iteration))
+    LOGGER.warning("Initialization: application calibrated the KDF to the target unlock time")
+    LOGGER.info(
+        "Argon2 with %s KiB and %s lanes takes %.3fs per iteration, using %s iterations for %.2fs",
+        memory_kib,
+        lanes,
+        seconds_per_iteration,
+        iterations,
+        target_seconds,
+    )
+    return iterations
+
+
+def argon2_type_of(kdf_parameters: Dict[str, Container]) -> argon2.low_level.Type:
+    """
+    Argon2 variant of the KDF parameters in a KDBX header.
+
+    Raises:
+        BitwardenException: If the KDF is not Argon2.
+    """
+    if kdf_parameters["$UUID"].value not in (kdf_uuids["argon2"], kdf_uuids["argon2id"]):
+        raise BitwardenException("Only Argon2 KeePass databases are supported")
+    if kdf_parameters["$UUID"].value == kdf_uuids["argon2id"]:
+        return argon2.low_level.Type.ID
+    return argon2.low_level.Type.D
+
+
+def calibrate_kdbx_format(kdbx_format: KdbxFormat) -> KdbxFormat:
+    """
+    Resolve target_unlock_seconds into a number of Argon2 iterations.
+
+    The Argon2 variant and the default memory cost are read from the header of the blank database KeePassStorage
+    starts from, without deriving its key.
+
+    Returns:
+        KdbxFormat: A copy with argon2_iterations set and target_unlock_seconds cleared, or kdbx_format itself
+            when no target unlock time is set.
+    """
+    if not kdbx_format.target_unlock_seconds:
+        return kdbx_format
+    kdf_parameters = KDBX.header.parse_file(BLANK_DATABASE_LOCATION).value.dynamic_header.kdf_parameters.data.dict
+    memory_bytes = (
+        kdbx_format.argon2_memory_mib * 1024 * 1024 if kdbx_format.argon2_memory_mib else kdf_parameters["M"].value
+    )
+    iterations = calibrate_argon2_iterations(
+        argon2_type_of(kdf_parameters),
+        memory_bytes // 1024,
+        kdbx_format.argon2_parallelism,
+        kdbx_format.target_unlock_seconds,
+    )
+    return kdbx_format.model_copy(update={"argon2_iterations": iterations, "target_unlock_seconds": None})
@@ -0,0 +1,320 @@
+"""
+Export every Bitwarden organization, and the personal vault, to its own KeePass database.
+
+The vault is fetched once with process_list and split into one part per organization. The databases are built
+and encrypted in parallel in a process pool, with the KeePassStorage of keepass_exporter, and a JSON manifest
+records which file holds which organization.
+"""
+
+import dataclasses
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from .. import BITWARDEN_EXPORTER_GLOBAL_SETTINGS
+from ..bw_list_process import BwProcessResult, RawItems, process_list
+from ..exceptions import BitwardenException
+from ..log_handlers import configure_logging
+from ..profiler import profile_span
+from ..remove_downloads import remove_downloaded
+from ..utils import resolve_secret
+from .keepass_exporter import BinaryMemoryBudget, needs_raw_items, write_database
+from .keepass_kdf import KdbxFormat, available_cores, calibrate_kdbx_format
+
+LOGGER = logging.getLogger(__name__)
+
+MY_VAULT_NAME = "My Vault"
+
+
+class OrganizationDatabase(BaseModel):
+    """
+    One KDBX file of a per-organization export, as listed in the manifest.
+
+    Attributes:
+        file: File name of the database, relative to the manifest.
+        organization_id: ID of the Bitwarden organization, None for the personal vault.
+        organization_name: Name of the organization, "My Vault" for the personal vault.
+        items: Number of Bitwarden items in the database.
+        sha256: SHA-256 of the database file, filled in once it is written.
+    """
+
+    file: str
+    organization_id: Optional[str] = None
+    organization_name: str
+    items: int
+    sha256: str = ""
+
+
+def split_by_organization(bw_processed_items: BwProcessResult) -> List[Tuple[OrganizationDatabase, BwProcessResult]]:
+    """
+    Split processed Bitwarden data into the personal vault and one part per organization.
+
+    Every part only carries its own raw data, so the "Bitwarden Export" entry of one organization's database does
+    not contain the items of another. Parts hold no CLI output, their raw sections are serialized again.
+
+    Returns:
+        List[Tuple[OrganizationDatabase, BwProcessResult]]: "My Vault" first, then the organizations; the file
+            names of the manifest entries are not set yet.
+    """
+    raw_items = bw_processed_items.raw_items
+    raw_organizations = [raw_organization for part in raw_items.organizations for raw_organization in part]
+    raw_collections = [raw_collection for part in raw_items.collections for raw_collection in part]
+    raw_bw_items = [raw_item for part in raw_items.items for raw_item in part]
+
+    my_vault_items = [raw_item for raw_item in raw_bw_items if not raw_item.get("organizationId")]
+    parts = [
+        (
+            OrganizationDatabase(file="", organization_name=MY_VAULT_NAME, items=len(my_vault_items)),
+            BwProcessResult(
+                folders=bw_processed_items.folders,
+                no_folder_items=bw_processed_items.no_folder_items,
+                raw_items=RawItems(
+                    status=raw_items.status,
+                    folders=raw_items.folders,
+                    organizations=[[]],
+                    collections=[[]],
+                    items=[my_vault_items],
+                ),
+            ),
+        )
+    ]
+    for organization_id, organization in bw_processed_items.organizations.items():
+        organization_items = [
+            raw_item for raw_item in raw_bw_items if raw_item.get("organizationId") == organization_id
+        ]
+        parts.append(
+            (
+                OrganizationDatabase(
+                    file="",
+                    organization_id=organization_id,
+                    organization_name=organization.name,
+                    items=len(organization_items),
+                ),
+                BwProcessResult(
+                    organizations={organization_id: organization},
+                    raw_items=RawItems(
+                        status=raw_items.status,
+                        organizations=[
+                            [raw_org for raw_org in raw_organizations if raw_org.get("id") == organization_id]
+                        ],
+                        collections=[
+                            [
+                                raw_collection
+                                for raw_collection in raw_collections
+                                if raw_collection.get("organizationId") == organization_id
+                            ]
+                        ],
+                        items=[organization_items],
+                    ),
+                ),
+            )
+        )
+    return parts
+
+
+def resolve_organization_passwords(
+    kdbx_password: str,
+    organization_passwords: List[str],
+    databases: List[OrganizationDatabase],
+    raw_items: RawItems,
+) -> List[str]:
+    """
+    Resolve the password of every database of a per-organization export.
+
+    Args:
+        kdbx_password: Password of every database without its own password.
+        organization_passwords: `<organization id or name>=<secret>` overrides, "My Vault" names the personal
+            vault. Secrets support the same prefixes as the KDBX password.
+        databases: The databases, in the order of the returned passwords.
+        raw_items: Raw Bitwarden data for JMESPath secrets.
+
+    Returns:
+        List[str]: The resolved password of each database.
+
+    Raises:
+        BitwardenException: If an override is malformed or names no organization.
+    """
+    secrets_by_database: Dict[int, str] = {}
+    for organization_password in organization_passwords:
+        key, separator, secret = organization_password.partition("=")
+        matches = [
+            index
+            for index, database in enumerate(databases)
+            if key in (database.organization_id, database.organization_name)
+        ]
+        if not separator or not matches:
+            LOGGER.info("Organization password for %s matches no organization", key)
+            raise BitwardenException("Invalid organization password, enable debug logging for more information")
+        for index in matches:
+            secrets_by_database[index] = secret
+
+    default_password = resolve_secret(kdbx_password, raw_items.items, raw_items.items_by_id)
+    return [
+        (
+            resolve_secret(secrets_by_database[index], raw_items.items, raw_items.items_by_id)
+            if index in secrets_by_database
+            else default_password
+        )
+        for index in range(len(databases))
+    ]
+
+
+def init_database_worker(settings: Dict[str, Any]) -> None:
+    """
+    Set up a process of the per-organization export pool like the parent process.
+
+    Args:
+        settings: The fields of the parent's BITWARDEN_EXPORTER_GLOBAL_SETTINGS.
+    """
+    for key, value in settings.items():
+        setattr(BITWARDEN_EXPORTER_GLOBAL_SETTINGS, key, value)
+    configure_logging(
+        BITWARDEN_EXPORTER_GLOBAL_SETTINGS.debug,
+        BITWARDEN_EXPORTER_GLOBAL_SETTINGS.aggregate_logs,
+        BITWARDEN_EXPORTER_GLOBAL_SETTINGS.log_sample_interval,
+        use_queue=False,
+    )
+
+
+def write_organization_database(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    kdbx_file: str,
+    kdbx_password: str,
+    database: OrganizationDatabase,
+    bw_processed_items: BwProcessResult,
+    binary_memory_budget: Optional[BinaryMemoryBudget],
+    gzip_bitwarden_export: bool,
+    kdbx_format: Optional[KdbxFormat],
+    bitwarden_export: bool,
+    verify: bool,
+) -> OrganizationDatabase:
+    """
+    Write one database of a per-organization export, in a process of the pool.
+
+    Returns:
+        OrganizationDatabase: The manifest entry with the SHA-256 of the written file.
+    """
+    LOGGER.warning("KeePass write: application is writing the database of one organization")
+    LOGGER.info("Writing %s to %s", database.organization_name, kdbx_file)
+    write_database(
+        kdbx_file,
+        kdbx_password,
+        bw_processed_items,
+        binary_memory_budget=binary_memory_budget,
+        gzip_bitwarden_export=gzip_bitwarden_export,
+        kdbx_format=kdbx_format,
+        bitwarden_export=bitwarden_export,
+        verify=verify,
+    )
+    sha256 = hashlib.sha256()
+    with open(kdbx_file, "rb") as kdbx:
+        for chunk in iter(lambda: kdbx.read(1024 * 1024), b""):
+            sha256.update(chunk)
+    return database.model_copy(update={"sha256": sha256.hexdigest()})
+
+
+# pylint: disable-next=too-many-arguments,too-many-positional-arguments,too-many-locals
+def create_organization_databases_cli(
+    kdbx_password: str,
+    kdbx_file: str,
+    organization_passwords: Optional[List[str]] = None,
+    workers: Optional[int] = None,
+    allow_duplicates: bool = False,
+    binary_memory_budget: Optional[BinaryMemoryBudget] = None,
+    gzip_bitwarden_export: bool = False,
+    kdbx_format: Optional[KdbxFormat] = None,
+    verify: bool = False,
+    bitwarden_export: bool = True,
+) -> None:
+    """
+    Create one KeePass database per organization, and one for "My Vault", plus a JSON manifest.
+
+    The vault is fetched once, then the databases are built and encrypted in parallel in a process pool. For a
+    kdbx_file of `export.kdbx`, the databases are `export.my-vault.kdbx` and `export.<organization id>.kdbx`,
+    and the manifest `export.manifest.json` lists which file holds which organization.
+
+    Args:
+        kdbx_password: Password of every database without its own password.
+        kdbx_file: Path the database and manifest file names are derived from.
+        organization_passwords: `<organization id or name>=<secret>` password overrides, see
+            resolve_organization_passwords.
+        workers: Maximum number of databases built at the same time, the number of available cores if unset.
+        allow_duplicates: Add items of several collections to every collection.
+        binary_memory_budget: Limit for the attachment bytes each database holds in memory until it is saved.
+        gzip_bitwarden_export: Gzip each section attached to the "Bitwarden Export" entry.
+        kdbx_format: Key derivation and payload settings, shared by every database.
+        verify: Read every saved database back and check its entries, see keepass_verify.
+        bitwarden_export: Attach the raw Bitwarden data of its organization to a "Bitwarden Export" entry of every
+            database.
+
+    Raises:
+        BitwardenException: If a destination file exists, a password override is invalid, or a database fails.
+    """
+    kdbx_stem, kdbx_extension = os.path.splitext(os.path.abspath(kdbx_file))
+    manifest_file = f"{kdbx_stem}.manifest.json"
+    if os.path.exists(manifest_file):
+        raise BitwardenException(f"Manifest already exists at {manifest_file}")
+
+    organization_secrets = [password.partition("=")[2] for password in organization_passwords or []]
+    bw_processed_items = process_list(
+        allow_duplicates, keep_raw_items=needs_raw_items(bitwarden_export, kdbx_password, *organization_secrets)
+    )
+
+    parts = split_by_organization(bw_processed_items)
+    databases = [
+        database.model_copy(
+            update={
+                "file": os.path.basename(
+                    f"{kdbx_stem}.{database.organization_id or 'my-vault'}{kdbx_extension or '.kdbx'}"
+                )
+            }
+        )
+        for database, _ in parts
+    ]
+    kdbx_files = [os.path.join(os.path.dirname(kdbx_stem), database.file) for database in databases]
+    for path in kdbx_files:
+        if os.path.exists(path):
+            raise BitwardenException(f"KeePass Database already exists at {path}")
+
+    kdbx_passwords = resolve_organization_passwords(
+        kdbx_password, organization_passwords or [], databases, bw_processed_items.raw_items
+    )
+    # Calibrated once here, the workers would measure each other's load.
+    kdbx_format = calibrate_kdbx_format(kdbx_format or KdbxFormat())
+
+    max_workers = min(workers or available_cores(), len(parts))
+    LOGGER.warning("KeePass write: application is writing one KeePass database per organization in parallel")
+    LOGGER.info("Writing %s databases with %s processes", len(parts), max_workers)
+    with profile_span("write organization databases", "keepass", databases=len(parts), workers=max_workers):
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=init_database_worker,
+            initargs=(dataclasses.asdict(BITWARDEN_EXPORTER_GLOBAL_SETTINGS),),
+        ) as executor:
+            futures = [
+                executor.submit(
+                    write_organization_database,
+                    path,
+                    password,
+                    database,
+                    part,
+                    binary_memory_budget,
+                    gzip_bitwarden_export,
+                    kdbx_format,
+                    bitwarden_export,
+                    verify,
+                )
+                for path, password, database, (_, part) in zip(kdbx_files, kdbx_passwords, databases, parts)
+            ]
+            written_databases = [future.result() for future in futures]
+
+    with open(manifest_file, "w", encoding="utf-8") as manifest:
+        json.dump({"databases": [database.model_dump() for database in written_databases]}, manifest, indent=4)
+    LOGGER.warning("Finalization: application wrote the manifest of the organization databases")
+    LOGGER.info("Manifest written to %s", manifest_file)
+
+    remove_downloaded()
@@ -0,0 +1,194 @@
+"""
+Export a vault to several KeePass databases, each capped by attachment size or entry count.
+
+Items are assigned to shards in the order KeePassStorage writes them. Every shard holds the complete group tree
+of organizations, collections, and folders, so an item keeps its group path in whichever shard it lands. The
+first shard also holds the "Bitwarden Export" entry and a "Bitwarden Shard Index" entry that records the shard
+of every Bitwarden item ID.
+"""
+
+import logging
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from ..bw_list_process import BwProcessResult, iter_items, process_list
+from ..bw_models import BwItem
+from ..exceptions import BitwardenException
+from ..remove_downloads import remove_downloaded
+from ..utils import resolve_secret
+from .keepass_exporter import BinaryMemoryBudget, KeePassStorage, needs_raw_items
+from .keepass_kdf import KdbxFormat, calibrate_kdbx_format
+
+LOGGER = logging.getLogger(__name__)
+
+
+class KdbxShard(BaseModel):
+    """
+    One KDBX file of a sharded export, as listed in the shard index.
+
+    Attributes:
+        file: File name of the shard, relative to the first shard.
+        items: Number of Bitwarden items in the shard.
+        attachment_bytes: Sum of the attachment sizes reported by Bitwarden for the items of the shard.
+    """
+
+    file: str
+    items: int = 0
+    attachment_bytes: int = 0
+
+
+def attachment_bytes(bw_item: BwItem) -> int:
+    """
+    Size of the attachments of an item, as reported by Bitwarden.
+    """
+    return sum(int(attachment.size) for attachment in bw_item.attachments if attachment.size.isdigit())
+
+
+def assign_shards(
+    bw_processed_items: BwProcessResult, max_bytes: int = 0, max_entries: int = 0
+) -> Tuple[Dict[str, int], List[KdbxShard]]:
+    """
+    Assign every item to a shard, starting a new shard when the next item would exceed a limit.
+
+    All copies of an item go to the same shard. An item whose attachments alone exceed max_bytes gets a shard of
+    its own.
+
+    Args:
+        bw_processed_items: The processed vault.
+        max_bytes: Maximum attachment bytes per shard, 0 for no limit.
+        max_entries: Maximum items per shard, 0 for no limit.
+
+    Returns:
+        Tuple[Dict[str, int], List[KdbxShard]]: The shard number of every item ID, and the shards without file
+            names.
+    """
+    shard_of_item: Dict[str, int] = {}
+    shards = [KdbxShard(file="")]
+    for bw_item in iter_items(bw_processed_items):
+        if bw_item.id in shard_of_item:
+            continue
+        item_bytes = attachment_bytes(bw_item)
+        if max_bytes and item_bytes > max_bytes:
+            LOGGER.warning("Sharding: an item exceeds the shard size limit. Enable debug logging for more information")
+            LOGGER.info("Item %s has %s bytes of attachments", bw_item.name, item_bytes)
+        shard = shards[-1]
+        if shard.items and (
+            (max_bytes and shard.attachment_bytes + item_bytes > max_bytes)
+            or (max_entries and shard.items >= max_entries)
+        ):
+            shard = KdbxShard(file="")
+            shards.append(shard)
+        shard.items += 1
+        shard.attachment_bytes += item_bytes
+        shard_of_item[bw_item.id] = len(shards) - 1
+    return shard_of_item, shards
+
+
+def shard_part(bw_processed_items: BwProcessResult, shard_of_item: Dict[str, int], shard: int) -> BwProcessResult:
+    """
+    The part of the vault written to one shard: every organization, collection, and folder, with the shard's items.
+    """
+
+    def in_shard(items: Dict[str, BwItem]) -> Dict[str, BwItem]:
+        return {item_id: bw_item for item_id, bw_item in items.items() if shard_of_item[item_id] == shard}
+
+    return BwProcessResult(
+        organizations={
+            organization_id: organization.model_copy(
+                update={
+                    "collections": {
+                        collection_id: collection.model_copy(update={"items": in_shard(collection.items)})
+                        for collection_id, collection in organization.collections.items()
+                    }
+                }
+            )
+            for organization_id, organization in bw_processed_items.organizations.items()
+        },
+        folders={
+            folder_id: folder.model_copy(update={"items": in_shard(folder.items)})
+            for folder_id, folder in bw_processed_items.folders.items()
+        },
+        no_folder_items=[
+            bw_item for bw_item in bw_processed_items.no_folder_items if shard_of_item[bw_item.id] == shard
+        ],
+    )
+
+
+# pylint: disable-next=too-many-arguments,too-many-positional-arguments,too-many-locals
+def create_sharded_databases_cli(
+    kdbx_password: str,
+    kdbx_file: str,
+    max_bytes: int = 0,
+    max_entries: int = 0,
+    allow_duplicates: bool = False,
+    binary_memory_budget: Optional[BinaryMemoryBudget] = None,
+    gzip_bitwarden_export: bool = False,
+    kdbx_format: Optional[KdbxFormat] = None,
+    verify: bool = False,
+    bitwarden_export: bool = True,
+) -> None:
+    """
+    Create several KeePass databases that together hold the vault, capped by attachment size or entry count.
+
+    For a kdbx_file of `export.kdbx`, the shards are `export.001.kdbx`, `export.002.kdbx`, and so on, all with the
+    same password. They are written one after another, so only one shard's attachments are held in memory.
+
+    Args:
+        kdbx_password: Password of every shard.
+        kdbx_file: Path the shard file names are derived from.
+        max_bytes: Maximum attachment bytes per shard, 0 for no limit.
+        max_entries: Maximum items per shard, 0 for no limit.
+        allow_duplicates: Add items of several collections to every collection.
+        binary_memory_budget: Limit for the attachment bytes each shard holds in memory until it is saved.
+        gzip_bitwarden_export: Gzip each section attached to the "Bitwarden Export" entry.
+        kdbx_format: Key derivation and payload settings, shared by every shard.
+        verify: Read every saved shard back and check its entries, see keepass_verify.
+        bitwarden_export: Attach the raw Bitwarden data to a "Bitwarden Export" entry of the first shard.
+
+    Raises:
+        BitwardenException: If a shard file already exists.
+    """
+    kdbx_stem, kdbx_extension = os.path.splitext(os.path.abspath(kdbx_file))
+
+    bw_processed_items = process_list(allow_duplicates, keep_raw_items=needs_raw_items(bitwarden_export, kdbx_password))
+
+    kdbx_password = resolve_secret(
+        kdbx_password, bw_processed_items.raw_items.items, bw_processed_items.raw_items.items_by_id
+    )
+
+    shard_of_item, shards = assign_shards(bw_processed_items, max_bytes, max_entries)
+    kdbx_files: List[str] = []
+    for number, shard in enumerate(shards, start=1):
+        kdbx_files.append(f"{kdbx_stem}.{number:03d}{kdbx_extension or '.kdbx'}")
+        shard.file = os.path.basename(kdbx_files[-1])
+        if os.path.exists(kdbx_files[-1]):
+            raise BitwardenException(f"KeePass Database already exists at {kdbx_files[-1]}")
+    shard_index: Dict[str, Any] = {
+        "shards": [shard.model_dump() for shard in shards],
+        "items": {item_id: shards[shard].file for item_id, shard in shard_of_item.items()},
+    }
+    LOGGER.warning("KeePass write: application is splitting the vault into several KeePass databases")
+    LOGGER.info("Writing %s items to %s shards", len(shard_of_item), len(shards))
+
+    # Calibrated once for all shards.
+    kdbx_format = calibrate_kdbx_format(kdbx_format or KdbxFormat())
+    for shard_number, path in enumerate(kdbx_files):
+        bw_shard_items = shard_part(bw_processed_items, shard_of_item, shard_number)
+        # Every shard is saved and released before the next one, so each gets the whole budget.
+        shard_budget = (
+            BinaryMemoryBudget(binary_memory_budget.limit_bytes, binary_memory_budget.policy)
+            if binary_memory_budget
+            else None
+        )
+        with KeePassStorage(path, kdbx_password, shard_budget, kdbx_format, verify) as storage:
+            storage.process_organizations(bw_shard_items.organizations)
+            storage.process_folders(bw_shard_items.folders)
+            storage.process_no_folder_items(bw_shard_items.no_folder_items)
+            if shard_number == 0:
+                if bitwarden_export:
+                    storage.process_bw_exports(bw_processed_items.raw_items, gzip_sections=gzip_bitwarden_export)
+                storage.process_shard_index(shard_index)
+
+    remove_downloaded()
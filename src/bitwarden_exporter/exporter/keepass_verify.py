@@ -0,0 +1,231 @@
+"""
+Verification of a saved KeePass database against a digest index written with it.
+
+While the database is built, a digest of every entry is computed from the Bitwarden item it is written for, once
+the item is mapped to KeePass: title, username, password, URL, notes, OTP, the custom properties holding the
+Bitwarden fields and extra URIs, and the name and SHA-256 of every attachment. The digests are keyed by Bitwarden
+item ID, then by entry UUID, since an item of several collections can be written to several entries, and stored
+with the number of items as the `verification_index.json` attachment of a "Bitwarden Verification Index" entry
+inside the database.
+
+Once the database is saved, it is read back from disk and every entry is checked against the index in one pass,
+from the strings and attachments it holds, so an entry that is missing or differs is reported by the ID of its
+Bitwarden item. Empty strings are left out of the digest on both sides, KeePass does not tell them apart from
+strings that are not set.
+
+Entries are read from the XML tree directly: pykeepass runs an XPath query for every field it returns, which
+would take longer than writing the database.
+"""
+
+import base64
+import hashlib
+import json
+import logging
+import time
+import uuid
+from typing import AbstractSet, Any, Dict, Iterable, Iterator, Mapping, Optional, Tuple
+
+from pykeepass import PyKeePass  # type: ignore
+
+from ..exceptions import BitwardenException
+
+LOGGER = logging.getLogger(__name__)
+
+VERIFICATION_INDEX_TITLE = "Bitwarden Verification Index"
+
+VERIFICATION_INDEX_FILE_NAME = "verification_index.json"
+
+VERIFICATION_INDEX_VERSION = 2
+
+# Entries the exporter adds to the root group besides the Bitwarden items, they are not in the index.
+AUXILIARY_ENTRY_TITLES = frozenset({"Bitwarden Export", "Bitwarden Shard Index", VERIFICATION_INDEX_TITLE})
+
+
+def item_digest(strings: Mapping[str, Optional[str]], attachments: Iterable[Tuple[str, str]]) -> str:
+    """
+    Digest of the strings and attachments of an entry, the way they are compared when verifying.
+
+    Args:
+        strings: Value of every string of the entry, by key; empty values are left out.
+        attachments: Name and hex SHA-256 of every attachment of the entry.
+
+    Returns:
+        str: The hex SHA-256 of the strings and attachments.
+    """
+    content = {
+        "strings": sorted((key, value) for key, value in strings.items() if value),
+        "attachments": sorted(attachments),
+    }
+    return hashlib.sha256(json.dumps(content, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+def entry_digest(entry_element: Any, binary_sha256: Mapping[int, str]) -> str:
+    """
+    Digest of an entry of a saved database, see item_digest.
+
+    Args:
+        entry_element: The XML element of the entry.
+        binary_sha256: SHA-256 of the binaries of the database, by binary ID.
+
+    Returns:
+        str: The hex SHA-256 of the entry strings and attachments.
+    """
+    return item_digest(
+        {string.findtext("Key") or "": string.findtext("Value") for string in entry_element.iterfind("String")},
+        [
+            (binary.findtext("Key") or "", binary_sha256[int(binary.find("Value").get("Ref"))])
+            for binary in entry_element.iterfind("Binary")
+        ],
+    )
+
+
+def iter_entries(py_kee_pass: PyKeePass) -> Iterator[Tuple[str, Any, bool]]:
+    """
+    Iterate the entries of a database, without their history.
+
+    Yields:
+        Tuple[str, Any, bool]: The entry UUID, the XML element of the entry, and whether it is an auxiliary entry
+            of the exporter, see AUXILIARY_ENTRY_TITLES.
+    """
+    root_group = py_kee_pass.tree.find("Root/Group")
+    for entry_element in root_group.iter("Entry"):
+        if entry_element.getparent().tag != "Group":
+            continue
+        entry_uuid = str(uuid.UUID(bytes=base64.b64decode(entry_element.findtext("UUID"))))
+        auxiliary = entry_element.getparent() is root_group and any(
+            string.findtext("Key") == "Title" and string.findtext("Value") in AUXILIARY_ENTRY_TITLES
+            for string in entry_element.iterfind("String")
+        )
+        yield entry_uuid, entry_element, auxiliary
+
+
+def binary_digests(py_kee_pass: PyKeePass) -> Dict[int, str]:
+    """
+    SHA-256 of every binary of a database, by binary ID.
+
+    KDBX4 binaries are hashed in place; pykeepass' binaries property copies all of them.
+    """
+    if py_kee_pass.version >= (4, 0):
+        return {
+            binary_id: hashlib.sha256(memoryview(binary.data)[1:]).hexdigest()
+            for binary_id, binary in enumerate(py_kee_pass.payload.inner_header.binary)
+        }
+    return {binary_id: hashlib.sha256(data).hexdigest() for binary_id, data in enumerate(py_kee_pass.binaries)}
+
+
+def build_verification_index(
+    item_digests: Mapping[str, Mapping[str, str]], processed_item_ids: AbstractSet[str]
+) -> bytes:
+    """
+    Build the verification index of the items written to a database.
+
+    Args:
+        item_digests: The digest of every entry written for an item, by entry UUID, by Bitwarden item ID.
+        processed_item_ids: The IDs of the items the database was asked to hold.
+
+    Returns:
+        bytes: The verification index, as the JSON of the verification index attachment.
+
+    Raises:
+        BitwardenException: If the entries do not cover exactly the processed items.
+    """
+    missing_item_ids = processed_item_ids - item_digests.keys()
+    unexpected_item_ids = item_digests.keys() - processed_item_ids
+    if missing_item_ids or unexpected_item_ids:
+        LOGGER.info(
+            "Items without an entry: %s, entries without a processed item: %s",
+            sorted(missing_item_ids)[:10],
+            sorted(unexpected_item_ids)[:10],
+        )
+        raise BitwardenException(
+            f"{len(item_digests)} items have entries, but {len(processed_item_ids)} items were processed"
+        )
+    return json.dumps(
+        {"version": VERIFICATION_INDEX_VERSION, "itemCount": len(item_digests), "items": item_digests},
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def read_verification_index(py_kee_pass: PyKeePass) -> Dict[str, Tuple[str, str]]:
+    """
+    Read the verification index of a database.
+
+    Returns:
+        Dict[str, Tuple[str, str]]: Bitwarden item ID and digest of every entry, keyed by entry UUID.
+
+    Raises:
+        BitwardenException: If the database has no readable verification index, or its item count is off.
+    """
+    index_entry = py_kee_pass.find_entries(
+        title=VERIFICATION_INDEX_TITLE, group=py_kee_pass.root_group, recursive=False, first=True
+    )
+    attachments = index_entry.attachments if index_entry else []
+    if len(attachments) != 1 or attachments[0].filename != VERIFICATION_INDEX_FILE_NAME:
+        raise BitwardenException("The KeePass database has no verification index")
+    if py_kee_pass.version >= (4, 0):
+        data = bytes(py_kee_pass.payload.inner_header.binary[attachments[0].id].data[1:])
+    else:
+        data = py_kee_pass.binaries[attachments[0].id]
+    verification_index = json.loads(data)
+    if verification_index.get("version") != VERIFICATION_INDEX_VERSION:
+        raise BitwardenException("The verification index of the KeePass database has an unsupported version")
+    if len(verification_index["items"]) != verification_index["itemCount"]:
+        raise BitwardenException("The verification index of the KeePass database does not hold every item")
+    return {
+        entry_uuid: (item_id, digest)
+        for item_id, digests in verification_index["items"].items()
+        for entry_uuid, digest in digests.items()
+    }
+
+
+def verify_database(kdbx_file: str, kdbx_password: str, transformed_key: bytes = b"") -> None:
+    """
+    Read a saved database back from disk and check every entry against its verification index.
+
+    Args:
+        kdbx_file: Path of the database.
+        kdbx_password: Password of the database.
+        transformed_key: Key derived from the password, skips the key derivation when given.
+
+    Raises:
+        BitwardenException: If the database cannot be read or an entry is missing, unexpected, or differs.
+    """
+    start = time.perf_counter()
+    try:
+        py_kee_pass = PyKeePass(kdbx_file, kdbx_password, transformed_key=transformed_key or None)
+    except Exception as e:  # pylint: disable=broad-except
+        LOGGER.info("Error reading KeePass database %s: %s", kdbx_file, e)
+        raise BitwardenException("Unable to read the saved KeePass database, enable debug logging for more information")
+
+    verification_index = read_verification_index(py_kee_pass)
+    binary_sha256 = binary_digests(py_kee_pass)
+    entries = 0
+    unexpected_entries = 0
+    # Dict as an ordered set, an item is reported once even if several of its entries fail.
+    failed_item_ids: Dict[str, None] = {}
+    for entry_uuid, entry_element, auxiliary in iter_entries(py_kee_pass):
+        expected = verification_index.pop(entry_uuid, None)
+        if expected is None:
+            if auxiliary:
+                continue
+            unexpected_entries += 1
+            LOGGER.info("Entry %s is not in the verification index", entry_uuid)
+            continue
+        entries += 1
+        if entry_digest(entry_element, binary_sha256) != expected[1]:
+            failed_item_ids[expected[0]] = None
+            LOGGER.info("Item %s: entry %s differs from the exported item", expected[0], entry_uuid)
+    for entry_uuid, expected in verification_index.items():
+        failed_item_ids[expected[0]] = None
+        LOGGER.info("Item %s: entry %s is missing", expected[0], entry_uuid)
+
+    if failed_item_ids or unexpected_entries:
+        LOGGER.warning("Verification: the saved KeePass database does not match the export")
+        raise BitwardenException(
+            f"Verification of {kdbx_file} failed: {len(failed_item_ids)} items with missing or different entries, "
+            f"{unexpected_entries} unexpected entries, "
+            f"Bitwarden items: {', '.join(list(failed_item_ids)[:10]) or 'none'}"
+            + (", ..." if len(failed_item_ids) > 10 else "")
+        )
+    LOGGER.warning("Verification: application read back the KeePass database and checked every entry")
+    LOGGER.info("Verified %s entries of %s in %.3fs", entries, kdbx_file, time.perf_counter() - start)
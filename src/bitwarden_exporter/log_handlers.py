@@ -0,0 +1,133 @@
+"""
+Logging setup: a queue-based handler and optional aggregation of repeated log lines.
+
+Records are put on a queue by the logging thread and formatted and written to stdout by a listener thread, so
+a slow stdout or log collector does not slow down the export.
+
+With aggregation enabled, a message that was already logged in the current stage is counted instead of logged.
+At the end of each stage, one summary lists how often every repeated message occurred. With debug enabled,
+every Nth occurrence of a repeated message is still logged (the sampling interval). Errors are never
+aggregated.
+
+Functions:
+    configure_logging: Install the handlers on the root logger.
+    log_stage: Context manager or decorator marking a stage, logs the summary of its repeated messages.
+"""
+
+import atexit
+import logging
+import queue
+import sys
+import threading
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Iterator, Optional, Tuple
+
+from . import LOGGING_FORMAT
+
+LOGGER = logging.getLogger(__name__)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Queue handler that leaves formatting to the listener thread.
+
+    QueueHandler formats every record before it is queued, which is the cost this handler moves off the logging
+    thread. The queue never leaves the process, so records are queued as they are.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class LogAggregator(logging.Filter):
+    """
+    Thread safe filter that counts repeated messages of the current stage instead of logging them.
+
+    Messages are told apart by logger and format string, so the detail lines of different items count as the
+    same message.
+    """
+
+    def __init__(self, sample_interval: int = 0) -> None:
+        """
+        Args:
+            sample_interval: Still log every Nth occurrence of a repeated message, 0 to log none.
+        """
+        super().__init__()
+        self.sample_interval = sample_interval
+        self.__lock = threading.Lock()
+        self.__counts: Dict[Tuple[str, str], int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.ERROR or getattr(record, "log_summary", False):
+            return True
+        key = (record.name, str(record.msg))
+        with self.__lock:
+            count = self.__counts.get(key, 0) + 1
+            self.__counts[key] = count
+        return count == 1 or bool(self.sample_interval and count % self.sample_interval == 0)
+
+    def flush_stage(self, stage: str) -> None:
+        """
+        Log the summary of the repeated messages since the last stage and start counting again.
+        """
+        with self.__lock:
+            counts = self.__counts
+            self.__counts = {}
+        repeated = sorted(
+            ((count, name, msg) for (name, msg), count in counts.items() if count > 1), key=lambda row: -row[0]
+        )
+        if not repeated:
+            return
+        lines = [f"{'count':>8} message"]
+        lines.extend(f"{count:>8} {name}: {msg}" for count, name, msg in repeated)
+        LOGGER.warning(
+            "Log summary: stage %s repeated these messages\n%s", stage, "\n".join(lines), extra={"log_summary": True}
+        )
+
+
+_AGGREGATOR: Optional[LogAggregator] = None
+
+
+def configure_logging(debug: bool, aggregate: bool = False, sample_interval: int = 0, use_queue: bool = True) -> None:
+    """
+    Configure the root logger to write to stdout, replacing any previous configuration.
+
+    Args:
+        debug: Log at DEBUG level instead of WARNING, and sample repeated messages.
+        aggregate: Count repeated messages per stage instead of logging them.
+        sample_interval: With debug and aggregate, still log every Nth occurrence of a repeated message.
+        use_queue: Write the records from a listener thread. Processes of a pool exit without running atexit
+            hooks, which stop the listener, so they log directly.
+    """
+    global _AGGREGATOR  # pylint: disable=global-statement
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(logging.Formatter(LOGGING_FORMAT))
+    handler: logging.Handler = stream_handler
+    if use_queue:
+        log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+        handler = DeferredQueueHandler(log_queue)
+        listener = QueueListener(log_queue, stream_handler)
+        listener.start()
+        atexit.register(listener.stop)
+
+    _AGGREGATOR = LogAggregator(sample_interval if debug else 0) if aggregate else None
+    if _AGGREGATOR is not None:
+        handler.addFilter(_AGGREGATOR)
+
+    logging.basicConfig(level=logging.DEBUG if debug else logging.WARNING, handlers=[handler], force=True)
+
+
+@contextmanager
+def log_stage(stage: str) -> Iterator[None]:
+    """
+    Mark a stage of the export; with aggregation enabled, log the summary of its repeated messages when it ends.
+
+    Can also be used as a decorator.
+    """
+    try:
+        yield
+    finally:
+        aggregator = _AGGREGATOR
+        if aggregator is not None:
+            aggregator.flush_stage(stage)
@@ -0,0 +1,180 @@
+"""
+Opt-in wall and CPU time profiling of the export.
+
+Spans are recorded around Bitwarden CLI commands, attachment downloads, item validation, the KeePassStorage
+stages, and the final save. When the application exits, they are written as a Chrome trace (open it in
+chrome://tracing or https://ui.perfetto.dev) and summarized in a table in the log.
+
+Spans only carry the name of the operation and non-sensitive numbers such as counts and sizes; item names,
+IDs, and secrets are never recorded, so a trace can be shared.
+
+CPU time is the CPU time of the thread that recorded the span; time spent in `bw` child processes is not
+included and shows as wall time only.
+
+Functions:
+    start_profiling: Enable profiling and write the trace on exit.
+    profile_span: Context manager recording one span.
+    profiled: Decorator recording one span per call.
+"""
+
+import atexit
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, TypeVar
+
+LOGGER = logging.getLogger(__name__)
+
+CallableT = TypeVar("CallableT", bound=Callable[..., Any])
+
+
+class Profiler:
+    """
+    Thread safe collector of spans.
+    """
+
+    def __init__(self) -> None:
+        self.__lock = threading.Lock()
+        self.__origin_ns = time.perf_counter_ns()
+        self.__events: List[Dict[str, Any]] = []
+        self.__thread_names: Dict[int, str] = {}
+
+    def record(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self, name: str, category: str, start_ns: int, wall_ns: int, cpu_ns: int, args: Dict[str, Any]
+    ) -> None:
+        """
+        Record a finished span of the current thread.
+
+        Args:
+            name: Name of the operation, grouped by in the summary.
+            category: Category shown in the trace viewer.
+            start_ns: time.perf_counter_ns() at the start of the span.
+            wall_ns: Wall time of the span.
+            cpu_ns: CPU time of the current thread during the span.
+            args: Non-sensitive details shown in the trace viewer.
+        """
+        thread = threading.current_thread()
+        thread_id = thread.native_id or 0
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": (start_ns - self.__origin_ns) / 1000,
+            "dur": wall_ns / 1000,
+            "pid": os.getpid(),
+            "tid": thread_id,
+            "args": dict(args, cpu_ms=round(cpu_ns / 1e6, 3)),
+        }
+        with self.__lock:
+            self.__events.append(event)
+            self.__thread_names.setdefault(thread_id, thread.name)
+
+    def write_trace(self, trace_file: str) -> None:
+        """
+        Write the spans in the Chrome trace event format.
+        """
+        with self.__lock:
+            events = list(self.__events)
+            thread_names = dict(self.__thread_names)
+        metadata = [
+            {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": thread_id, "args": {"name": thread_name}}
+            for thread_id, thread_name in thread_names.items()
+        ]
+        with open(trace_file, "w", encoding="utf-8") as trace:
+            json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms"}, trace)
+
+    def summary(self) -> str:
+        """
+        Summarize the spans by name, slowest total wall time first.
+
+        Returns:
+            str: A table with the count, total and maximum wall time, and total CPU time of each operation.
+        """
+        rows: Dict[str, List[float]] = {}
+        with self.__lock:
+            for event in self.__events:
+                row = rows.setdefault(event["name"], [0, 0.0, 0.0, 0.0])
+                row[0] += 1
+                row[1] += event["dur"] / 1e6
+                row[2] = max(row[2], event["dur"] / 1e6)
+                row[3] += event["args"]["cpu_ms"] / 1e3
+        lines = [f"{'operation':<40} {'count':>8} {'wall (s)':>10} {'max (s)':>10} {'cpu (s)':>10}"]
+        for name, (count, wall, wall_max, cpu) in sorted(rows.items(), key=lambda row: -row[1][1]):
+            lines.append(f"{name:<40} {int(count):>8} {wall:>10.3f} {wall_max:>10.3f} {cpu:>10.3f}")
+        return "\n".join(lines)
+
+
+_PROFILER: Optional[Profiler] = None
+
+
+def start_profiling(trace_file: str) -> None:
+    """
+    Enable profiling; the trace is written and the summary logged when the application exits.
+
+    Args:
+        trace_file: Path of the Chrome trace JSON file.
+    """
+    global _PROFILER  # pylint: disable=global-statement
+    profiler = Profiler()
+    _PROFILER = profiler
+
+    def write_profile() -> None:
+        profiler.write_trace(trace_file)
+        LOGGER.warning("Profiling: application wrote the trace file\n%s", profiler.summary())
+        LOGGER.info("Trace written to %s", os.path.abspath(trace_file))
+
+    atexit.register(write_profile)
+
+
+@contextmanager
+def profile_span(name: str, category: str, **args: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Record the wall and CPU time of the enclosed block; does nothing unless profiling is enabled.
+
+    Args:
+        name: Name of the operation, must not contain item data.
+        category: Category shown in the trace viewer.
+        **args: Non-sensitive details such as counts and sizes.
+
+    Yields:
+        Dict[str, Any]: The span details, more can be added while the block runs.
+    """
+    profiler = _PROFILER
+    if profiler is None:
+        yield args
+        return
+    start_ns = time.perf_counter_ns()
+    start_cpu_ns = time.thread_time_ns()
+    try:
+        yield args
+    finally:
+        profiler.record(
+            name,
+            category,
+            start_ns,
+            time.perf_counter_ns() - start_ns,
+            time.thread_time_ns() - start_cpu_ns,
+            args,
+        )
+
+
+def profiled(category: str) -> Callable[[CallableT], CallableT]:
+    """
+    Decorator recording a span, named after the decorated function, for every call.
+    """
+
+    def decorator(func: CallableT) -> CallableT:
+        name = func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with profile_span(name, category):
+                return func(*args, **kwargs)
+
+        return wrapper  # type: ignore
+
+    return decorator
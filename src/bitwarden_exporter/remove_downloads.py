@@ -3,6 +3,7 @@ Delete downloaded Files.
 """
 
 import logging
+import os
 import shutil
 
 from . import BITWARDEN_EXPORTER_GLOBAL_SETTINGS
@@ -10,12 +11,22 @@ from . import BITWARDEN_EXPORTER_GLOBAL_SETTINGS
 LOGGER = logging.getLogger(__name__)
 
 
-def remove_downloaded() -> None:
+def remove_downloaded(failed: bool = False) -> None:
     """
-    Remove the temporary directory used for downloading attachments.
+    Remove the temporary directory used for downloading attachments, if one was created.
+
+    Args:
+        failed: The export failed; with resume enabled, the directory is then kept for the next run.
     """
+    if BITWARDEN_EXPORTER_GLOBAL_SETTINGS.tmp_dir is None:
+        return
+    if failed and BITWARDEN_EXPORTER_GLOBAL_SETTINGS.resume:
+        LOGGER.warning("Resume enabled: application will keep the temporary directory to resume the export")
+        LOGGER.info("Keeping temporary directory %s", BITWARDEN_EXPORTER_GLOBAL_SETTINGS.tmp_dir)
+        return
     if not BITWARDEN_EXPORTER_GLOBAL_SETTINGS.debug:
-        shutil.rmtree(BITWARDEN_EXPORTER_GLOBAL_SETTINGS.tmp_dir)
+        if os.path.exists(BITWARDEN_EXPORTER_GLOBAL_SETTINGS.tmp_dir):
+            shutil.rmtree(BITWARDEN_EXPORTER_GLOBAL_SETTINGS.tmp_dir)
     else:
         LOGGER.warning("Debug enabled: application will keep the temporary directory for troubleshooting")
         LOGGER.info("Keeping temporary directory %s", BITWARDEN_EXPORTER_GLOBAL_SETTINGS.tmp_dir)
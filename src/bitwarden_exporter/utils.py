@@ -2,9 +2,13 @@
 General utilities.
 """
 
+import functools
+import gc
+import json
 import logging
 import os
-from typing import Any, Optional
+from contextlib import contextmanager
+from typing import IO, Any, Dict, Iterator, List, Mapping, NamedTuple, Optional
 
 import jmespath
 
@@ -12,16 +16,128 @@ from .exceptions import BitwardenException
 
 LOGGER = logging.getLogger(__name__)
 
+# Nodes that only read the result of their first child, so a filter below them sees every input they get.
+_JMESPATH_LEFT_NODE_TYPES = frozenset(
+    {"pipe", "projection", "value_projection", "filter_projection", "flatten", "subexpression", "index_expression"}
+)
+
+
+class CompiledJmespath(NamedTuple):
+    """
+    A compiled JMESPath secret expression.
+
+    Attributes:
+        expression: The parsed expression.
+        item_id: The item ID every result is filtered by, as in [?id=='<id>'].login.password, or None.
+    """
+
+    expression: Any
+    item_id: Optional[str]
+
+
+def _item_id_condition(node: Any) -> Optional[str]:
+    """
+    The item ID of an id=='<id>' filter condition, or None for any other condition.
+
+    A condition joined with && matches only the items its id=='<id>' part matches.
+    """
+    if node["type"] == "and_expression":
+        return _item_id_condition(node["children"][0]) or _item_id_condition(node["children"][1])
+    if node["type"] != "comparator" or node["value"] != "eq":
+        return None
+    field_ids = [child for child in node["children"] if child["type"] == "field" and child["value"] == "id"]
+    literals = [child for child in node["children"] if child["type"] == "literal" and isinstance(child["value"], str)]
+    if len(field_ids) != 1 or len(literals) != 1:
+        return None
+    return str(literals[0]["value"])
+
+
+@functools.lru_cache(maxsize=128)
+def compile_jmespath(expression: str) -> CompiledJmespath:
+    """
+    Compile a JMESPath secret expression once and find the item ID filter it starts with, if any.
+
+    The filter is found on the syntax tree: following the first child of pipes, projections, and indexes leads
+    to the part of the expression that reads the input. When that part is [?id=='<id>'], alone or joined to
+    other conditions with &&, only the items with that ID can contribute to the result.
+
+    Args:
+        expression: The JMESPath expression, without the jmespath: prefix.
+
+    Returns:
+        CompiledJmespath: The parsed expression and its item ID filter.
+
+    Raises:
+        jmespath.exceptions.ParseError: If the expression is invalid.
+    """
+    compiled = jmespath.compile(expression)
+    node: Any = compiled.parsed
+    while node["type"] != "filter_projection" or _item_id_condition(node["children"][2]) is None:
+        if node["type"] not in _JMESPATH_LEFT_NODE_TYPES:
+            return CompiledJmespath(compiled, None)
+        node = node["children"][0]
+
+    if node["children"][0]["type"] != "identity":
+        return CompiledJmespath(compiled, None)
+    return CompiledJmespath(compiled, _item_id_condition(node["children"][2]))
+
+
+def index_items(all_items_list: List[Any]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Index raw items by ID for JMESPath secrets.
+
+    Args:
+        all_items_list: RawItems.items, a list wrapping the list of item dicts.
+
+    Returns:
+        Dict[str, List[Dict[str, Any]]]: The item dicts with each ID, in vault order.
+    """
+    items_by_id: Dict[str, List[Dict[str, Any]]] = {}
+    for bw_items_dict in all_items_list:
+        for bw_item_dict in bw_items_dict:
+            items_by_id.setdefault(bw_item_dict.get("id"), []).append(bw_item_dict)
+    return items_by_id
+
+
+def search_items(
+    expression: str, all_items_list: List[Any], items_by_id: Optional[Mapping[str, List[Dict[str, Any]]]] = None
+) -> Any:
+    """
+    Evaluate a JMESPath expression against the list of all raw item dicts.
+
+    Expressions filtering by item ID, see compile_jmespath, are evaluated against the items with that ID only,
+    looked up in items_by_id; the filter drops every other item, so the result is the same. Any other
+    expression is evaluated against all items.
+
+    Args:
+        expression: The JMESPath expression, without the jmespath: prefix.
+        all_items_list: RawItems.items, a list wrapping the list of item dicts.
+        items_by_id: RawItems.items_by_id; built from all_items_list when None or empty.
+
+    Returns:
+        Any: The result of the expression.
+    """
+    compiled = compile_jmespath(expression)
+    if compiled.item_id is None:
+        return compiled.expression.search([item for bw_items_dict in all_items_list for item in bw_items_dict])
+    if not items_by_id:
+        items_by_id = index_items(all_items_list)
+    return compiled.expression.search(items_by_id.get(compiled.item_id, []))
+
 
 # pylint: disable=too-many-branches
-def resolve_secret(secret_path: str, all_items_list: Optional[list[dict[str, Any]]]) -> str:
+def resolve_secret(
+    secret_path: str,
+    all_items_list: Optional[List[Any]],
+    items_by_id: Optional[Mapping[str, List[Dict[str, Any]]]] = None,
+) -> str:
     """
     Resolve a secret from multiple sources with optional file indirection.
 
     Supports three prefix types:
     - env:<VAR_NAME>: Read from environment variable
     - file:<PATH>: Read from a file at the given path
-    - jmespath:<EXPR>: Evaluate JMESPath expression against all_items_list
+    - jmespath:<EXPR>: Evaluate JMESPath expression against the items of all_items_list, see search_items
 
     After prefix resolution, if the result is a valid file path, its contents
     are read and returned. Otherwise, the resolved value is returned as-is.
@@ -29,6 +145,7 @@ def resolve_secret(secret_path: str, all_items_list: Optional[list[dict[str, Any
     Args:
         secret_path: The secret identifier with optional prefix
         all_items_list: List of Bitwarden items for JMESPath evaluation
+        items_by_id: Index of all_items_list by item ID, see search_items
 
     Returns:
         The resolved secret string
@@ -55,7 +172,7 @@ def resolve_secret(secret_path: str, all_items_list: Optional[list[dict[str, Any
             LOGGER.info("Cannot use JMESPath expressions: vault items not available")
             raise BitwardenException(error_msg)
         jmespath_expression = secret_path[len("jmespath:") :]
-        jmespath_password = jmespath.search(jmespath_expression, all_items_list)
+        jmespath_password = search_items(jmespath_expression, all_items_list, items_by_id)
 
         if not jmespath_password:
             LOGGER.info("Vault password is not found")
@@ -83,3 +200,84 @@ def resolve_secret(secret_path: str, all_items_list: Optional[list[dict[str, Any
             return content
 
     return secret_path
+
+
+def iter_json_array(stream: IO[str], chunk_size: int = 65536) -> Iterator[Any]:
+    """
+    Incrementally decode a JSON array from a text stream, yielding one element at a time.
+
+    Only the current, not yet decoded element is buffered, so memory does not grow with the length of the
+    array. When an element does not fit in the buffer, reads grow with the buffer to keep decoding linear.
+
+    Args:
+        stream: Text stream positioned at the start of a JSON array, e.g. the stdout pipe of the bw CLI.
+        chunk_size: Minimum number of characters read from the stream at a time.
+
+    Yields:
+        The decoded array elements.
+
+    Raises:
+        BitwardenException: If the stream does not contain a well-formed JSON array.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    is_eof = False
+    expect_array_start = True
+
+    def read_more() -> bool:
+        nonlocal buffer, position
+        chunk = stream.read(max(chunk_size, len(buffer) - position))
+        buffer = buffer[position:] + chunk
+        position = 0
+        return len(chunk) > 0
+
+    while True:
+        while position < len(buffer) and buffer[position] in " \t\r\n":
+            position += 1
+        if position >= len(buffer):
+            if is_eof or not read_more():
+                is_eof = True
+                raise BitwardenException("Unexpected end of JSON array from Bitwarden CLI")
+            continue
+
+        if expect_array_start:
+            if buffer[position] != "[":
+                raise BitwardenException("Expected a JSON array from Bitwarden CLI")
+            position += 1
+            expect_array_start = False
+            continue
+
+        if buffer[position] == "]":
+            return
+        if buffer[position] == ",":
+            position += 1
+            continue
+
+        try:
+            element, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError as e:
+            if is_eof or not read_more():
+                is_eof = True
+                LOGGER.info("Invalid JSON from Bitwarden CLI: %s", e)
+                raise BitwardenException("Invalid JSON from Bitwarden CLI, enable debug logging for more information")
+            continue
+        yield element
+
+
+@contextmanager
+def paused_gc() -> Iterator[None]:
+    """
+    Pause the cyclic garbage collector while decoding acyclic JSON.
+
+    Building hundreds of thousands of dicts and models triggers repeated full collections that scan every object
+    decoded so far, although none of them can be part of a reference cycle. The collector is enabled again on
+    exit, so the decoded objects are still collected once the export releases them.
+    """
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if gc_was_enabled:
+            gc.enable()
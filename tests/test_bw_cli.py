@@ -0,0 +1,123 @@
+"""
+Tests of the attachment download pool.
+"""
+
+import os
+import subprocess  # nosec B404
+import tempfile
+import threading
+import unittest
+from typing import Dict, List, Optional
+from unittest import mock
+
+from bitwarden_exporter import bw_cli
+from bitwarden_exporter.bw_cli import AttachmentDownloader
+from bitwarden_exporter.download_manifest import MANIFEST_FILE_NAME, DownloadManifest
+
+
+class AttachmentDownloaderTest(unittest.TestCase):
+    """
+    AttachmentDownloader gives back its download slots whatever a download raises, and resumes from its manifest.
+    """
+
+    def setUp(self) -> None:
+        tmp_dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_dir = tmp_dir.name
+        self.errors: Dict[str, BaseException] = {}
+        self.downloads: List[str] = []
+
+        def fake_bw_run(cmd: List[str], is_raw: bool = True) -> str:  # pylint: disable=unused-argument
+            attachment_id = cmd[2]
+            self.downloads.append(attachment_id)
+            with open(cmd[cmd.index("--output") + 1], "wb") as output_file:
+                output_file.write(attachment_id.encode("utf-8"))
+            if attachment_id in self.errors:
+                raise self.errors[attachment_id]
+            return ""
+
+        bw_run_patch = mock.patch.object(bw_cli, "bw_run", fake_bw_run)
+        bw_run_patch.start()
+        self.addCleanup(bw_run_patch.stop)
+
+    def download_all(self, attachment_ids: List[str], manifest: Optional[DownloadManifest] = None) -> None:
+        """
+        Download the attachments with one slot, failing the test instead of waiting forever for a slot.
+        """
+        errors: List[BaseException] = []
+
+        def download() -> None:
+            try:
+                with AttachmentDownloader(
+                    max_workers=1, max_attempts=2, backoff_seconds=0, manifest=manifest
+                ) as downloader:
+                    for attachment_id in attachment_ids:
+                        downloader.schedule("item-1", attachment_id, os.path.join(self.tmp_dir, attachment_id))
+            except BaseException as e:  # pylint: disable=broad-except
+                errors.append(e)
+
+        thread = threading.Thread(target=download, daemon=True)
+        thread.start()
+        thread.join(timeout=10)
+        self.assertFalse(thread.is_alive(), "the downloads wait for a download slot that was never released")
+        if errors:
+            raise errors[0]
+
+    def test_unexpected_error_releases_the_slot(self) -> None:
+        """
+        An error other than a CLI failure is not retried, and the next downloads still get the slot.
+        """
+        self.errors["attachment-1"] = OSError("connection reset")
+        with self.assertRaises(OSError):
+            self.download_all(["attachment-1", "attachment-2", "attachment-3"])
+        self.assertEqual(self.downloads, ["attachment-1", "attachment-2", "attachment-3"])
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)), ["attachment-2", "attachment-3"])
+
+    def test_cli_failure_is_retried_then_reported(self) -> None:
+        """
+        A failing CLI is retried, then reported on exit, and the partial downloads are removed.
+        """
+        self.errors["attachment-1"] = subprocess.CalledProcessError(1, ["bw"])
+        with self.assertLogs(bw_cli.LOGGER), self.assertRaises(bw_cli.BitwardenException):
+            self.download_all(["attachment-1", "attachment-2"])
+        self.assertEqual(self.downloads, ["attachment-1", "attachment-1", "attachment-2"])
+        self.assertEqual(os.listdir(self.tmp_dir), ["attachment-2"])
+
+    def test_resume_skips_completed_downloads(self) -> None:
+        """
+        A second run with the manifest of the first only downloads what the first did not complete.
+        """
+        self.errors["attachment-2"] = subprocess.CalledProcessError(1, ["bw"])
+        with self.assertLogs("bitwarden_exporter"), self.assertRaises(bw_cli.BitwardenException):
+            self.download_all(["attachment-1", "attachment-2"], DownloadManifest(self.tmp_dir))
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)), ["attachment-1", MANIFEST_FILE_NAME])
+
+        del self.errors["attachment-2"]
+        self.downloads.clear()
+        with self.assertLogs("bitwarden_exporter") as logs:
+            self.download_all(["attachment-1", "attachment-2"], DownloadManifest(self.tmp_dir))
+        self.assertEqual(self.downloads, ["attachment-2"])
+        self.assertIn(
+            "Attachment attachment-1 matches the download manifest, skipping download", "\n".join(logs.output)
+        )
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)), ["attachment-1", "attachment-2", MANIFEST_FILE_NAME])
+
+    def test_resume_downloads_changed_files_again(self) -> None:
+        """
+        A file that no longer matches the manifest is downloaded again.
+        """
+        with self.assertLogs("bitwarden_exporter"):
+            self.download_all(["attachment-1"], DownloadManifest(self.tmp_dir))
+        with open(os.path.join(self.tmp_dir, "attachment-1"), "wb") as attachment_file:
+            attachment_file.write(b"truncat")
+
+        self.downloads.clear()
+        with self.assertLogs("bitwarden_exporter"):
+            self.download_all(["attachment-1"], DownloadManifest(self.tmp_dir))
+        self.assertEqual(self.downloads, ["attachment-1"])
+        with open(os.path.join(self.tmp_dir, "attachment-1"), "rb") as attachment_file:
+            self.assertEqual(attachment_file.read(), b"attachment-1")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,226 @@
+"""
+Tests of preparing the vault for a streaming export.
+"""
+
+import gc
+import json
+import os
+import tempfile
+import types
+import unittest
+import weakref
+from typing import Any, Dict, List
+from unittest import mock
+
+from bitwarden_exporter import BITWARDEN_EXPORTER_GLOBAL_SETTINGS, BwDecodeMode, BwFetchMode, bw_cli, bw_list_process
+from bitwarden_exporter.bw_list_process import prepare_vault, process_list, process_list_pipelined
+
+ITEMS: List[Dict[str, Any]] = [
+    {
+        "object": "item",
+        "id": f"item-{item_index}",
+        "name": f"Item {item_index}",
+        "type": 2,
+        "reprompt": 0,
+        "favorite": False,
+        "revisionDate": "2024-01-01T00:00:00.000Z",
+        "creationDate": "2024-01-01T00:00:00.000Z",
+        "notes": f"note {item_index}",
+    }
+    for item_index in range(5)
+]
+
+CLI_OUTPUTS: Dict[str, str] = {
+    "status": json.dumps({"status": "unlocked"}),
+    "folders": "[]",
+    "organizations": "[]",
+    "collections": "[]",
+    "items": json.dumps(ITEMS),
+}
+
+
+ATTACHMENT_CLI_OUTPUTS: Dict[str, str] = {
+    **CLI_OUTPUTS,
+    "items": json.dumps(
+        [
+            {
+                **ITEMS[0],
+                "attachments": [
+                    {"id": "attachment-1", "fileName": "a.txt", "size": "4", "sizeName": "4 Bytes", "url": "u"}
+                ],
+            }
+        ]
+    ),
+}
+
+
+class DecodedObject(dict):  # type: ignore[type-arg]
+    """
+    A decoded JSON object that can be weakly referenced.
+    """
+
+
+def fake_bw_exec(cmd: List[str], is_raw: bool = True) -> str:  # pylint: disable=unused-argument
+    """
+    Print what the Bitwarden CLI prints for status and list commands.
+    """
+    return CLI_OUTPUTS[cmd[-1]]
+
+
+class PrepareVaultTest(unittest.TestCase):
+    """
+    prepare_vault without raw items keeps nothing alive that the caller already consumed.
+    """
+
+    def setUp(self) -> None:
+        self.item_dicts: List["weakref.ReferenceType[DecodedObject]"] = []
+
+        def loads(payload: str) -> Any:
+            return json.loads(payload, object_hook=self.track)
+
+        bw_exec_patch = mock.patch.object(bw_list_process, "bw_exec", fake_bw_exec)
+        bw_exec_patch.start()
+        self.addCleanup(bw_exec_patch.stop)
+        json_patch = mock.patch.object(bw_list_process, "json", types.SimpleNamespace(loads=loads, dumps=json.dumps))
+        json_patch.start()
+        self.addCleanup(json_patch.stop)
+
+    def track(self, decoded: Dict[str, Any]) -> DecodedObject:
+        """
+        Decode JSON objects into weakly referenced dicts, remembering the items.
+        """
+        decoded_object = DecodedObject(decoded)
+        if decoded_object.get("object") == "item":
+            self.item_dicts.append(weakref.ref(decoded_object))
+        return decoded_object
+
+    def assert_consumed_items_released(self, decode_mode: BwDecodeMode) -> None:
+        """
+        Consume the items one by one, checking that every item before the current one was released.
+        """
+        with (
+            mock.patch.object(BITWARDEN_EXPORTER_GLOBAL_SETTINGS, "decode_mode", decode_mode),
+            self.assertLogs(bw_list_process.LOGGER),
+        ):
+            prepared_vault = prepare_vault(keep_raw_items=False)
+        self.assertNotIn("items", prepared_vault.bw_process_items.raw_items.cli_outputs)
+        self.assertEqual(prepared_vault.bw_items_dict, [])
+
+        consumed = []
+        for item_index, bw_item in enumerate(prepared_vault.bw_items_iter):
+            self.assertEqual(bw_item.id, f"item-{item_index}")
+            consumed.append(weakref.ref(bw_item))
+            del bw_item
+            gc.collect()
+            self.assertEqual([item() for item in consumed[:-1]], [None] * item_index)
+            released_dicts = self.item_dicts[:item_index]
+            self.assertEqual([item_dict() for item_dict in released_dicts], [None] * len(released_dicts))
+        self.assertEqual(len(consumed), len(ITEMS))
+
+    def test_batch_releases_consumed_items(self) -> None:
+        """
+        Items validated in one batch are released once consumed, and the CLI output is not kept.
+        """
+        self.assert_consumed_items_released(BwDecodeMode.BATCH)
+        self.assertEqual(self.item_dicts, [])
+
+    def test_per_item_releases_consumed_items(self) -> None:
+        """
+        Items validated one by one are released once consumed, with their decoded dicts.
+        """
+        self.assert_consumed_items_released(BwDecodeMode.PER_ITEM)
+        self.assertEqual(len(self.item_dicts), len(ITEMS))
+
+    def test_raw_items_are_kept_when_asked(self) -> None:
+        """
+        With raw items, the CLI output and the decoded items stay available for the Bitwarden Export entry.
+        """
+        with self.assertLogs(bw_list_process.LOGGER):
+            prepared_vault = prepare_vault(keep_raw_items=True)
+        self.assertEqual([bw_item.id for bw_item in prepared_vault.bw_items_iter], [item["id"] for item in ITEMS])
+        self.assertEqual(prepared_vault.bw_process_items.raw_items.cli_outputs["items"], CLI_OUTPUTS["items"])
+        self.assertEqual(prepared_vault.bw_items_dict, ITEMS)
+
+    def test_streaming_an_export_warns(self) -> None:
+        """
+        A caller that asks for streamed items with the export fetch mode is told the export is decoded at once.
+        """
+        bw_export = json.dumps({"encrypted": False, "folders": [], "items": ITEMS})
+        with (
+            mock.patch.object(BITWARDEN_EXPORTER_GLOBAL_SETTINGS, "fetch_mode", BwFetchMode.EXPORT),
+            mock.patch.object(
+                bw_list_process, "bw_exec", lambda cmd, is_raw=True: {**CLI_OUTPUTS, "json": bw_export}[cmd[-1]]
+            ),
+            self.assertLogs(bw_list_process.LOGGER) as logs,
+        ):
+            prepared_vault = prepare_vault(keep_raw_items=False, stream_items=True)
+        self.assertIn(
+            f"WARNING:{bw_list_process.LOGGER.name}:Streaming items is not supported with the export fetch mode, "
+            "decoding the export at once",
+            logs.output,
+        )
+        self.assertEqual([bw_item.id for bw_item in prepared_vault.bw_items_iter], [item["id"] for item in ITEMS])
+
+
+class ProcessListTest(unittest.TestCase):
+    """
+    process_list downloads attachments only when asked to.
+    """
+
+    def setUp(self) -> None:
+        tmp_dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(tmp_dir.cleanup)
+        self.downloads: List[str] = []
+
+        def fake_bw_run(cmd: List[str], is_raw: bool = True) -> str:  # pylint: disable=unused-argument
+            output = cmd[cmd.index("--output") + 1]
+            with open(output, "wb") as output_file:
+                output_file.write(b"data")
+            self.downloads.append(cmd[2])
+            return ""
+
+        for patch in (
+            mock.patch.object(bw_list_process, "bw_exec", lambda cmd, is_raw=True: ATTACHMENT_CLI_OUTPUTS[cmd[-1]]),
+            mock.patch.object(bw_cli, "bw_run", fake_bw_run),
+            mock.patch.object(BITWARDEN_EXPORTER_GLOBAL_SETTINGS, "tmp_dir", tmp_dir.name),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_reference_attachments_are_not_downloaded(self) -> None:
+        """
+        Without download_attachments, attachments stay Bitwarden references and nothing is downloaded.
+        """
+        with self.assertLogs(bw_list_process.LOGGER):
+            bw_process_result = process_list(download_attachments=False)
+        self.assertEqual(self.downloads, [])
+        self.assertEqual(bw_process_result.no_folder_items[0].attachments[0].local_file_path, "")
+
+    def test_attachments_are_downloaded(self) -> None:
+        """
+        By default every attachment is downloaded to the temporary directory.
+        """
+        with self.assertLogs(bw_list_process.LOGGER):
+            bw_process_result = process_list()
+        self.assertEqual(self.downloads, ["attachment-1"])
+        local_file_path = bw_process_result.no_folder_items[0].attachments[0].local_file_path
+        with open(local_file_path, "rb") as attachment_file:
+            self.assertEqual(attachment_file.read(), b"data")
+        self.assertTrue(local_file_path.startswith(str(BITWARDEN_EXPORTER_GLOBAL_SETTINGS.tmp_dir) + os.sep))
+
+    def test_items_are_counted_without_raw_items(self) -> None:
+        """
+        The summary counts the processed items, also when the raw items are not kept.
+        """
+        with self.assertLogs(bw_list_process.LOGGER) as logs:
+            process_list(keep_raw_items=False, download_attachments=False)
+        self.assertEqual(logs.output[-1], f"INFO:{bw_list_process.LOGGER.name}:Total Items Fetched: 1")
+
+        with self.assertLogs(bw_list_process.LOGGER) as logs:
+            with process_list_pipelined(keep_items=False, download_attachments=False) as (_, bw_items_iter):
+                self.assertEqual(len(list(bw_items_iter)), 1)
+        self.assertEqual(logs.output[-1], f"INFO:{bw_list_process.LOGGER.name}:Total Items Fetched: 1")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,210 @@
+"""
+Tests of the bw serve backend against a fake Vault Management API server.
+"""
+
+import json
+import os
+import socket
+import subprocess  # nosec B404
+import tempfile
+import threading
+import unittest
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Tuple
+from unittest import mock
+
+from bitwarden_exporter import BITWARDEN_EXPORTER_GLOBAL_SETTINGS, BwBackend, bw_serve
+from bitwarden_exporter.bw_cli import AttachmentStream, bw_exec
+from bitwarden_exporter.bw_serve import BwServeClient
+from bitwarden_exporter.exceptions import BitwardenException
+
+ITEMS: List[Dict[str, Any]] = [{"object": "item", "id": "item-1", "name": "Item 1"}]
+
+ATTACHMENTS: Dict[str, bytes] = {"attachment-1": b"attachment content" * 1000}
+
+
+class FakeVaultApiHandler(BaseHTTPRequestHandler):
+    """
+    Answer the requests of the Vault Management API the exporter sends, with keep-alive connections.
+    """
+
+    protocol_version = "HTTP/1.1"
+    server: "FakeVaultApiServer"
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        """
+        Serve /status, /list/object/items, and /object/attachment/<id>.
+        """
+        self.server.paths.append(self.path)
+        url = urllib.parse.urlparse(self.path)
+        if url.path == "/status":
+            self.send_json(200, {"success": True, "data": {"template": {"status": "unlocked"}}})
+        elif url.path == "/list/object/items":
+            self.send_json(200, {"success": True, "data": {"object": "list", "data": ITEMS}})
+        elif url.path.startswith("/object/attachment/") and url.path.split("/")[-1] in ATTACHMENTS:
+            self.send_body(200, ATTACHMENTS[url.path.split("/")[-1]])
+        else:
+            self.send_json(404, {"success": False, "message": "Not found."})
+        if self.server.drop_connections:
+            # Close without announcing it, like a kept-alive connection that went stale.
+            self.close_connection = True  # pylint: disable=attribute-defined-outside-init
+
+    def send_json(self, status: int, body: Dict[str, Any]) -> None:
+        """
+        Send a JSON response.
+        """
+        self.send_body(status, json.dumps(body).encode("utf-8"))
+
+    def send_body(self, status: int, body: bytes) -> None:
+        """
+        Send a response with a Content-Length, so the connection can be kept alive.
+        """
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:  # pylint: disable=redefined-builtin
+        """
+        Keep the test output quiet.
+        """
+
+
+class FakeVaultApiServer(ThreadingHTTPServer):
+    """
+    Fake `bw serve` on a free loopback port, recording the requested paths.
+    """
+
+    daemon_threads = True
+
+    def __init__(self) -> None:
+        super().__init__(("127.0.0.1", 0), FakeVaultApiHandler)
+        self.paths: List[str] = []
+        self.drop_connections = False
+        self.connections: List[socket.socket] = []
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self) -> str:
+        """
+        Base URL of the server.
+        """
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def get_request(self) -> Tuple[socket.socket, Any]:
+        connection, address = super().get_request()
+        self.connections.append(connection)
+        return connection, address
+
+    def stop(self) -> None:
+        """
+        Stop like a `bw serve` process that exited: refuse new connections and close the kept-alive ones.
+        """
+        self.shutdown()
+        self.server_close()
+        self.thread.join()
+        for connection in self.connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+class BwServeClientTest(unittest.TestCase):
+    """
+    BwServeClient against a running, and then a stopped, fake server.
+    """
+
+    def setUp(self) -> None:
+        self.server = FakeVaultApiServer()
+        self.client = BwServeClient(base_url=self.server.url, timeout=5)
+        self.client.start(startup_timeout=5)
+
+    def tearDown(self) -> None:
+        self.client.close()
+        if self.server.thread.is_alive():
+            self.server.stop()
+
+    def test_exec_returns_cli_output(self) -> None:
+        """
+        status and list return the JSON the CLI prints.
+        """
+        self.assertEqual(json.loads(self.client.exec(["status"])), {"status": "unlocked"})
+        self.assertEqual(json.loads(self.client.exec(["list", "items", "--raw"])), ITEMS)
+
+    def test_exec_downloads_attachment(self) -> None:
+        """
+        get attachment writes the content to the output path.
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output = os.path.join(tmp_dir, "attachment")
+            self.client.exec(["get", "attachment", "attachment-1", "--itemid", "item-1", "--output", output])
+            with open(output, "rb") as attachment_file:
+                self.assertEqual(attachment_file.read(), ATTACHMENTS["attachment-1"])
+        self.assertIn("/object/attachment/attachment-1?itemid=item-1", self.server.paths)
+
+    def test_error_response_raises_called_process_error(self) -> None:
+        """
+        An error response is raised like a failed CLI command, with the server message.
+        """
+        with self.assertRaises(subprocess.CalledProcessError) as raised:
+            self.client.exec(["list", "sends"])
+        self.assertEqual(raised.exception.stderr, "Not found.")
+
+    def test_stale_connection_is_retried(self) -> None:
+        """
+        A kept-alive connection the server closed is retried on a new connection.
+        """
+        self.server.drop_connections = True
+        for _ in range(3):
+            self.assertEqual(json.loads(self.client.exec(["list", "items"])), ITEMS)
+
+    def test_stopped_server_raises_called_process_error(self) -> None:
+        """
+        A server that went away is raised like a failed CLI command, so callers retry it.
+        """
+        self.server.stop()
+        with self.assertRaises(subprocess.CalledProcessError) as raised:
+            self.client.exec(["list", "items"])
+        self.assertEqual(raised.exception.cmd, ["GET", "/list/object/items"])
+
+    def test_stopped_server_raises_called_process_error_when_streaming(self) -> None:
+        """
+        Streaming an attachment from a server that went away fails like a failed CLI command.
+        """
+        self.server.stop()
+        with self.assertRaises(subprocess.CalledProcessError) as raised:
+            self.client.open_attachment("item-1", "attachment-1")
+        self.assertEqual(raised.exception.cmd, ["GET", "/object/attachment/attachment-1?itemid=item-1"])
+
+    def test_attachment_stream_reads_content(self) -> None:
+        """
+        AttachmentStream streams the attachment body from the serve backend.
+        """
+        with (
+            mock.patch.object(BITWARDEN_EXPORTER_GLOBAL_SETTINGS, "bw_backend", BwBackend.SERVE),
+            mock.patch.object(bw_serve, "_SERVE_CLIENT", self.client),
+            AttachmentStream("item-1", "attachment-1") as stream,
+        ):
+            content = b""
+            while chunk := stream.read(4096):
+                content += chunk
+        self.assertEqual(content, ATTACHMENTS["attachment-1"])
+
+    def test_bw_exec_raises_bitwarden_exception_when_server_stopped(self) -> None:
+        """
+        bw_exec reports a server that went away as a BitwardenException, not a traceback.
+        """
+        self.server.stop()
+        with (
+            mock.patch.object(BITWARDEN_EXPORTER_GLOBAL_SETTINGS, "bw_backend", BwBackend.SERVE),
+            mock.patch.object(bw_serve, "_SERVE_CLIENT", self.client),
+            self.assertRaises(BitwardenException),
+        ):
+            bw_exec(["list", "items"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+"""
+Tests of the encrypted JSONL export file.
+"""
+
+import os
+import tempfile
+import unittest
+
+from bitwarden_exporter.exceptions import BitwardenException
+from bitwarden_exporter.exporter.jsonl_exporter import EncryptedJsonlWriter, iter_jsonl_export
+
+
+class EncryptedJsonlWriterTest(unittest.TestCase):
+    """
+    EncryptedJsonlWriter leaves a complete export or no file at all.
+    """
+
+    def setUp(self) -> None:
+        tmp_dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(tmp_dir.cleanup)
+        self.jsonl_file = os.path.join(tmp_dir.name, "export.jsonl")
+
+    def test_complete_export_is_readable(self) -> None:
+        """
+        An export that exits cleanly ends with a trailer and reads back.
+        """
+        with self.assertLogs("bitwarden_exporter.exporter.jsonl_exporter"):
+            with EncryptedJsonlWriter(self.jsonl_file, "pw") as writer:
+                writer.write_groups({}, {})
+            records = list(iter_jsonl_export(self.jsonl_file, "pw"))
+        self.assertEqual(records[-1]["record"], "trailer")
+
+    def test_failed_export_is_removed_and_can_be_rerun(self) -> None:
+        """
+        An export that fails after the header was written is removed, so the next run does not refuse the path.
+        """
+        with self.assertLogs("bitwarden_exporter.exporter.jsonl_exporter"), self.assertRaises(BitwardenException):
+            with EncryptedJsonlWriter(self.jsonl_file, "pw"):
+                self.assertTrue(os.path.exists(self.jsonl_file))
+                raise BitwardenException("Vault is not unlocked")
+        self.assertFalse(os.path.exists(self.jsonl_file))
+
+        with self.assertLogs("bitwarden_exporter.exporter.jsonl_exporter"):
+            with EncryptedJsonlWriter(self.jsonl_file, "pw"):
+                pass
+        self.assertTrue(os.path.exists(self.jsonl_file))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,164 @@
+"""
+Tests of adding Bitwarden items to a KeePass database, and of verifying the saved database.
+"""
+
+import os
+import tempfile
+import unittest
+from typing import Dict, List
+
+from pykeepass import PyKeePass  # type: ignore
+
+from bitwarden_exporter.bw_models import BwCollection, BwFolder, BwItem, BwItemLogin, BwOrganization
+from bitwarden_exporter.exceptions import BitwardenException
+from bitwarden_exporter.exporter.keepass_exporter import KeePassStorage
+from bitwarden_exporter.exporter.keepass_kdf import KdbxFormat
+from bitwarden_exporter.exporter.keepass_verify import verify_database
+
+# Cheap key derivation, the tests are about the entries.
+TEST_KDBX_FORMAT = KdbxFormat(argon2_memory_mib=1, argon2_iterations=1, argon2_parallelism=1)
+
+
+def make_item(item_id: str, name: str = "Shared title", username: str = "shared-user") -> BwItem:
+    """
+    Build a login item.
+    """
+    return BwItem(
+        object="item",
+        id=item_id,
+        name=name,
+        type=1,
+        reprompt=0,
+        favorite=False,
+        revisionDate="2024-01-01T00:00:00.000Z",
+        creationDate="2024-01-01T00:00:00.000Z",
+        login=BwItemLogin(username=username, password=f"password of {item_id}"),
+    )
+
+
+class KeePassStorageEntriesTest(unittest.TestCase):
+    """
+    Items are appended to their groups directly, and deduplicated by group and Bitwarden item ID.
+    """
+
+    def setUp(self) -> None:
+        tmp_dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(tmp_dir.cleanup)
+        self.kdbx_file = os.path.join(tmp_dir.name, "vault.kdbx")
+
+    def entry_titles_by_group(self) -> Dict[str, List[str]]:
+        """
+        Read the saved database back and list the entry titles of every group.
+        """
+        py_kee_pass = PyKeePass(self.kdbx_file, "pw")
+        return {group.name: [entry.title for entry in group.entries] for group in py_kee_pass.groups}
+
+    def test_items_sharing_title_and_username_are_all_added(self) -> None:
+        """
+        Distinct items with the same title and username are distinct entries.
+        """
+        with self.assertLogs("bitwarden_exporter"):
+            with KeePassStorage(self.kdbx_file, "pw", kdbx_format=TEST_KDBX_FORMAT) as storage:
+                storage.process_no_folder_items([make_item("item-1"), make_item("item-2")])
+        self.assertEqual(self.entry_titles_by_group()["My Vault"], ["Shared title", "Shared title"])
+
+    def test_same_item_in_one_group_is_added_once(self) -> None:
+        """
+        Adding an item to a group that already has it keeps the existing entry.
+        """
+        bw_item = make_item("item-1")
+        with self.assertLogs("bitwarden_exporter") as logs:
+            with KeePassStorage(self.kdbx_file, "pw", kdbx_format=TEST_KDBX_FORMAT) as storage:
+                storage.process_no_folder_items([bw_item, bw_item])
+        self.assertEqual(self.entry_titles_by_group()["My Vault"], ["Shared title"])
+        self.assertIn("Item Shared title is already in group My Vault, skipping", "\n".join(logs.output))
+
+    def test_same_item_in_two_groups_is_added_to_both(self) -> None:
+        """
+        The same item in two collections is an entry of each collection group.
+        """
+        bw_organizations = {
+            "organization-1": BwOrganization(
+                object="organization",
+                id="organization-1",
+                name="Organization",
+                status=2,
+                type=0,
+                enabled=True,
+                collections={
+                    collection_id: BwCollection(
+                        object="collection", id=collection_id, organizationId="organization-1", name=collection_id
+                    )
+                    for collection_id in ("collection-1", "collection-2")
+                },
+            )
+        }
+        bw_folders: Dict[str, BwFolder] = {}
+        bw_item = make_item("item-1").model_copy(
+            update={"organizationId": "organization-1", "collectionIds": ["collection-1", "collection-2"]}
+        )
+        with self.assertLogs("bitwarden_exporter"):
+            with KeePassStorage(self.kdbx_file, "pw", kdbx_format=TEST_KDBX_FORMAT) as storage:
+                storage.process_groups(bw_organizations, bw_folders)
+                storage.process_item(bw_item, bw_organizations, bw_folders, allow_duplicates=True)
+                storage.process_item(bw_item, bw_organizations, bw_folders, allow_duplicates=True)
+        entry_titles_by_group = self.entry_titles_by_group()
+        self.assertEqual(entry_titles_by_group["collection-1"], ["Shared title"])
+        self.assertEqual(entry_titles_by_group["collection-2"], ["Shared title"])
+
+
+class VerifyDatabaseTest(unittest.TestCase):
+    """
+    verify_database accepts the database as written, and names the Bitwarden items whose entries changed.
+    """
+
+    def setUp(self) -> None:
+        tmp_dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(tmp_dir.cleanup)
+        self.kdbx_file = os.path.join(tmp_dir.name, "vault.kdbx")
+        with self.assertLogs("bitwarden_exporter"):
+            with KeePassStorage(self.kdbx_file, "pw", kdbx_format=TEST_KDBX_FORMAT, verify=True) as storage:
+                storage.process_no_folder_items(
+                    [make_item(f"item-{item_index}", name=f"Item {item_index}") for item_index in range(3)]
+                )
+
+    def test_written_database_verifies(self) -> None:
+        """
+        The database as saved matches its index.
+        """
+        with self.assertLogs("bitwarden_exporter") as logs:
+            verify_database(self.kdbx_file, "pw")
+        self.assertIn("Verified 3 entries", "\n".join(logs.output))
+
+    def test_tampered_entry_names_its_item(self) -> None:
+        """
+        A changed password fails the verification of its item only.
+        """
+        py_kee_pass = PyKeePass(self.kdbx_file, "pw")
+        py_kee_pass.find_entries(title="Item 1", first=True).password = "tampered"
+        py_kee_pass.save()
+
+        with self.assertLogs("bitwarden_exporter") as logs, self.assertRaises(BitwardenException) as raised:
+            verify_database(self.kdbx_file, "pw")
+        self.assertIn("1 items with missing or different entries, 0 unexpected entries", str(raised.exception))
+        self.assertIn("Bitwarden items: item-1", str(raised.exception))
+        self.assertNotIn("item-0", str(raised.exception))
+        self.assertNotIn("item-2", str(raised.exception))
+        self.assertIn("Item item-1: entry", "\n".join(logs.output))
+
+    def test_deleted_entry_names_its_item(self) -> None:
+        """
+        A missing entry fails the verification of its item.
+        """
+        py_kee_pass = PyKeePass(self.kdbx_file, "pw")
+        py_kee_pass.delete_entry(py_kee_pass.find_entries(title="Item 2", first=True))
+        py_kee_pass.save()
+
+        with self.assertLogs("bitwarden_exporter"), self.assertRaises(BitwardenException) as raised:
+            verify_database(self.kdbx_file, "pw")
+        self.assertIn("1 items with missing or different entries, 0 unexpected entries", str(raised.exception))
+        self.assertIn("Bitwarden items: item-2", str(raised.exception))
+
+
+if __name__ == "__main__":
+    unittest.main()
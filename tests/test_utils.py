@@ -0,0 +1,128 @@
+"""
+Tests of JMESPath secrets resolved through the item ID index.
+"""
+
+import unittest
+from typing import Any, Dict, List
+
+import jmespath
+
+from bitwarden_exporter.exceptions import BitwardenException
+from bitwarden_exporter.utils import compile_jmespath, index_items, resolve_secret, search_items
+
+ITEMS: List[Dict[str, Any]] = [
+    {
+        "id": "a",
+        "type": 1,
+        "login": {"username": "ua", "password": "pa"},
+        "fields": [{"name": "export-password", "value": "secret-a", "type": 1}],
+    },
+    {"id": "b", "type": 2, "login": {"username": "ub", "password": "pb"}, "fields": []},
+    {
+        "id": "a",
+        "type": 2,
+        "login": {"username": "ua2", "password": "pa2"},
+        "fields": [{"name": "export-password", "value": "secret-a2", "type": 1}],
+    },
+    {
+        "id": "c",
+        "type": 1,
+        "login": {"username": "uc", "password": "pc"},
+        "fields": [{"name": "export-password", "value": "secret-c", "type": 1}],
+    },
+]
+
+# RawItems.items wraps the item list.
+ALL_ITEMS_LIST: List[Any] = [ITEMS]
+
+INDEXED_EXPRESSIONS: List[str] = [
+    "[?id=='a'].fields[] | [?name=='export-password'].value",
+    "[?id=='a'].login.password",
+    "[?'c'==id].login.password",
+    "[?id=='a' && type==`1`].login.password",
+    "[?type==`2` && id=='a'].login.password",
+    "[?id=='a'] | [0].login.password",
+    "[?id=='a'] | [1].login.username",
+    "[?id=='a'][?type==`2`].login.password",
+    "[?id=='missing'].login.password",
+    "[?id=='a'].fields[].value | [0]",
+]
+
+SCANNED_EXPRESSIONS: List[str] = [
+    "[0][?id=='a'].login.password",
+    "[?id=='a' || id=='c'].login.password",
+    "[?type==`1`].login.password",
+    "[1].login.password",
+    "length([?id=='a'])",
+    "[].id",
+]
+
+
+class SearchItemsTest(unittest.TestCase):
+    """
+    search_items gives the result jmespath.search gives on the list of all items, with or without the index.
+    """
+
+    def test_indexed_expressions_match_a_full_search(self) -> None:
+        """
+        Expressions with an item ID filter take the index and return what a full search returns.
+        """
+        items_by_id = index_items(ALL_ITEMS_LIST)
+        for expression in INDEXED_EXPRESSIONS:
+            with self.subTest(expression=expression):
+                self.assertIsNotNone(compile_jmespath(expression).item_id)
+                self.assertEqual(
+                    search_items(expression, ALL_ITEMS_LIST, items_by_id), jmespath.search(expression, ITEMS)
+                )
+
+    def test_other_expressions_match_a_full_search(self) -> None:
+        """
+        Expressions without an item ID filter on the items are evaluated against all items.
+        """
+        for expression in SCANNED_EXPRESSIONS:
+            with self.subTest(expression=expression):
+                self.assertIsNone(compile_jmespath(expression).item_id)
+                self.assertEqual(search_items(expression, ALL_ITEMS_LIST), jmespath.search(expression, ITEMS))
+
+    def test_index_only_reads_the_matching_items(self) -> None:
+        """
+        An indexed expression is evaluated against the items with its ID, not against all_items_list.
+        """
+        items_by_id = {"a": [{"id": "a", "login": {"password": "from-index"}}]}
+        self.assertEqual(search_items("[?id=='a'].login.password", [[]], items_by_id), ["from-index"])
+
+    def test_index_is_built_when_missing(self) -> None:
+        """
+        Without an index, the index is built from all_items_list.
+        """
+        self.assertEqual(search_items("[?id=='c'].login.password", ALL_ITEMS_LIST), ["pc"])
+
+
+class ResolveSecretTest(unittest.TestCase):
+    """
+    resolve_secret with the jmespath: prefix.
+    """
+
+    def test_documented_form_resolves(self) -> None:
+        """
+        The form of the --kdbx-password help resolves to the first value.
+        """
+        self.assertEqual(
+            resolve_secret(
+                "jmespath:[?id=='c'].fields[] | [?name=='export-password'].value",
+                ALL_ITEMS_LIST,
+                index_items(ALL_ITEMS_LIST),
+            ),
+            "secret-c",
+        )
+
+    def test_empty_result_raises(self) -> None:
+        """
+        An expression without a result cannot be a password.
+        """
+        with self.assertLogs("bitwarden_exporter.utils"), self.assertRaises(BitwardenException):
+            resolve_secret("jmespath:[?id=='missing'].login.password", ALL_ITEMS_LIST)
+
+
+if __name__ == "__main__":
+    unittest.main()